@@ -0,0 +1,114 @@
+"""
+Benchmark format_qc() against the previous row-by-row implementation on synthetic catalogs.
+
+  python benchmarks/bench_format_qc.py                  10,000 and 100,000 genomes
+  python benchmarks/bench_format_qc.py --rows 5000      a quick run
+"""
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+from dateutil.parser import parse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from genome_portal_api import flatten_dict, format_qc
+from synthetic import make_catalog
+
+
+def format_qc_rowwise(dataframe):
+  """format_qc() as it was before it was vectorized (genome_portal_api 1.1.1), kept as the baseline"""
+  df=dataframe
+  new_df=pd.DataFrame()
+
+  new_df['atcc_product_id'] = df['product_id']
+  new_df['name'] = df['attributes.atcc_metadata.preferred_taxonomy_name'].combine_first(df['taxon_name'])
+  new_df['taxid'] = df['taxon_id']
+  new_df['genome_id'] = df['id']
+  new_df['assembly_id'] = df['primary_assembly.id']
+  new_df['collection'] = "ATCC " + df['collection_name'].str.capitalize()
+  
+  # Extended metadata inclusion
+  df['extended_json_format'] = df.apply(lambda row: True if 'attributes.atcc_metadata.other_metadata.catalog_details.ATCC_catalog_number' in row else False, axis=1)
+
+  new_df['contig_count'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.genome_stats.filtered_contig_count'] if row['extended_json_format'] else row['primary_assembly.attributes.qc_statistics.assembly_statistics.filtered.total_contigs'], axis=1)
+  new_df['total_contig_length'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.genome_stats.filtered_contig_length'] if row['extended_json_format'] else row['primary_assembly.attributes.qc_statistics.assembly_statistics.filtered.total_contig_length'], axis=1)
+  new_df['total_circular_contigs'] = df.apply(lambda row: row['primary_assembly.attributes.qc_statistics.assembly_statistics.filtered.total_circular_contigs'], axis=1)
+  new_df['total_n_assembly'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.genome_stats.number_of_n_bases'] if (row['extended_json_format'] and pd.notnull(row['attributes.atcc_metadata.other_metadata.genome_stats.number_of_n_bases'])) else (sum([i['ambiguous_nucleotide_count'] for i in row['primary_assembly.attributes.qc_statistics.assembly_statistics.filtered.contig_statistics']])) if isinstance(row['primary_assembly.attributes.qc_statistics.assembly_statistics.filtered.contig_statistics'], list) else None, axis=1)
+  new_df['illumina_barcoding_kit'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.illumina_metadata.barcoding_kit'] if row['extended_json_format'] else None, axis=1)
+  new_df['illumina_library_kit'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.illumina_metadata.library_kit'] if row['extended_json_format'] else None, axis=1)
+  new_df['illumina_sequencer'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.illumina_metadata.sequencer'] if row['extended_json_format'] else None, axis=1)
+  new_df['illumina_basecalling_model'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.illumina_metadata.basecaller_model'] if row['extended_json_format'] else None, axis=1)
+  new_df['illumina_basecalling_version'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.illumina_metadata.basecaller_version'] if row['extended_json_format'] else None, axis=1)
+  new_df['nanopore_barcoding_kit'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.ont_metadata.barcoding_kit'] if row['extended_json_format'] else None, axis=1)
+  new_df['nanopore_library_kit'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.ont_metadata.library_kit'] if row['extended_json_format'] else None, axis=1)
+  new_df['nanopore_flowcell_type'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.ont_metadata.flowcell_type'] if row['extended_json_format'] else None, axis=1)
+  new_df['nanopore_sequencer'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.ont_metadata.sequencer'] if row['extended_json_format'] else None, axis=1)
+  new_df['nanopore_basecalling_model'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.ont_metadata.basecaller_model'] if row['extended_json_format'] else None, axis=1)
+  new_df['nanopore_basecalling_version'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.ont_metadata.basecaller_version'] if row['extended_json_format'] else None, axis=1)
+
+  new_df['genome_page_creation'] = df.apply(lambda row: parse(row['created_at']).strftime('%x %X'), axis=1)  
+  new_df['genome_assembled_by'] = df['attributes.atcc_metadata.notes'].apply(lambda x: 'ATCC' if ('attributes.atcc_metadata.notes' in df.columns and ('oatmeal' in str(x).lower() or 'manual' in str(x).lower())) else 'OneCodex')
+  df['genome_assembled_by'] = new_df['genome_assembled_by']
+  
+  new_df['atcc_lotnumber'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.catalog_details.ATCC_lot_number'] if row['extended_json_format'] else None, axis=1)
+  new_df['assembled_by'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.genome_provider.asssembled_by'] if row['extended_json_format'] else row['genome_assembled_by'], axis=1)
+  new_df['assembled_date'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.genome_provider.asssembly_date'] if row['extended_json_format'] else None, axis=1)
+  new_df['assembler_software'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.genome_provider.asssembler_software'] if row['extended_json_format'] else None, axis=1)
+  new_df['annotatated_by'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.genome_provider.annotatated_by'] if row['extended_json_format'] else row['genome_assembled_by'], axis=1)
+  new_df['annotations_date'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.genome_provider.annotations_date'] if row['extended_json_format'] else None, axis=1)
+  new_df['annotations_software'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.genome_provider.annotations_software'] if row['extended_json_format'] else None, axis=1)
+
+  new_df['genome_completeness'] = df.apply(lambda row: row['attributes.atcc_metadata.qc_statistics.assembly_quality_control.genome_completeness'] if row['genome_assembled_by'] == 'ATCC' 
+    else row['primary_assembly.attributes.qc_statistics.checkm_results.completeness'] if pd.notnull(row['primary_assembly.attributes.qc_statistics.checkm_results.completeness']) 
+    else row['primary_assembly.attributes.qc_statistics.virify_results.completeness'] if pd.notnull(row['primary_assembly.attributes.qc_statistics.virify_results.completeness']) else None, axis=1)
+  new_df['genome_contamination'] = df.apply(lambda row: row['attributes.atcc_metadata.qc_statistics.assembly_quality_control.genome_contamination'] if row['genome_assembled_by'] == 'ATCC' 
+    else row['primary_assembly.attributes.qc_statistics.checkm_results.contamination'] if pd.notnull(row['primary_assembly.attributes.qc_statistics.checkm_results.contamination']) else None, axis=1)
+  
+  new_df['genome_completeness'] = new_df.apply(lambda row: (row['genome_completeness']*100) if (row['genome_assembled_by'] == 'OneCodex' and row['collection'] == "ATCC Virology") else None, axis=1)
+  new_df['illumina_depth'] = df.apply(lambda row: row['attributes.atcc_metadata.qc_statistics.assembly_quality_control.illumina_depth_of_coverage'] if 'attributes.atcc_metadata.qc_statistics.assembly_quality_control.illumina_depth_of_coverage' in df.columns else row['primary_assembly.attributes.qc_statistics.sequencing_statistics.illumina.depth.mean'], axis=1)
+  new_df['nanopore_depth'] = df.apply(lambda row: row['attributes.atcc_metadata.qc_statistics.assembly_quality_control.ont_depth_of_coverage'] if 'attributes.atcc_metadata.qc_statistics.assembly_quality_control.ont_depth_of_coverage' in df.columns else row['primary_assembly.attributes.qc_statistics.sequencing_statistics.ont.depth.mean'], axis=1)
+  #AMR Sitecore Section
+  new_df['amr_intermediate'] = df.apply(lambda row: row['attributes.atcc_metadata.amr_intermediate'] if row['attributes.atcc_metadata.amr_intermediate'] != [] else None, axis=1)
+  new_df['amr_resistant'] = df.apply(lambda row: row['attributes.atcc_metadata.amr_resistant'] if row['attributes.atcc_metadata.amr_resistant'] != [] else None, axis=1)
+  new_df['amr_susceptible'] = df.apply(lambda row: row['attributes.atcc_metadata.amr_susceptible'] if row['attributes.atcc_metadata.amr_susceptible'] != [] else None, axis=1)
+  new_df['antibiotic_resistance'] = df.apply(lambda row: row['attributes.atcc_metadata.antibiotic_resistance'] if 'attributes.atcc_metadata.antibiotic_resistance' in row else None, axis=1)
+  new_df['antigenic_prop'] = df.apply(lambda row: row['attributes.atcc_metadata.antigenic_prop'] if 'attributes.atcc_metadata.antigenic_prop' in row else None, axis=1)
+  new_df['drug_repository'] = df.apply(lambda row: row['attributes.atcc_metadata.drug_repository'] if 'attributes.atcc_metadata.drug_repository' in row else None, axis=1)
+  new_df['genotype'] = df.apply(lambda row: row['attributes.atcc_metadata.genotype'] if 'attributes.atcc_metadata.genotype' in row else None, axis=1)
+  new_df['isolation_new_web'] = df.apply(lambda row: row['attributes.atcc_metadata.isolation_new_web'] if 'attributes.atcc_metadata.isolation_new_web' in row else None, axis=1)
+  new_df['biosafety_level'] = df.apply(lambda row: int(row['attributes.atcc_metadata.bsl']) if 'attributes.atcc_metadata.bsl' in row and pd.notnull(row['attributes.atcc_metadata.bsl']) else None, axis=1)
+  new_df['notes'] = df.apply(lambda row: row['attributes.atcc_metadata.notes'] if 'notes' in df.columns  else None, axis=1)
+  #new_df['genome_page_creation']=new_df['genome_page_creation'].apply(pd.to_datetime)
+  #new_df=new_df.sort_values(by='genome_page_creation',ascending=False)
+  
+  return new_df
+
+
+def timed(function, *args):
+  start = time.perf_counter()
+  result = function(*args)
+  return result, time.perf_counter() - start
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark format_qc() against the row-by-row implementation")
+  parser.add_argument("--rows", default="10000,100000", help="Comma separated catalog sizes [10000,100000]")
+  parser.add_argument("--skip-rowwise", action="store_true", help="Only time the vectorized format_qc()")
+  args = parser.parse_args()
+
+  print(f"{'rows':>8} {'rowwise (s)':>12} {'vectorized (s)':>15} {'speedup':>8}")
+  for rows in (int(r) for r in args.rows.split(",")):
+    df = pd.DataFrame.from_records([flatten_dict(g) for g in make_catalog(rows)])
+    vectorized, vectorized_seconds = timed(format_qc, df.copy())
+    if args.skip_rowwise:
+      print(f"{rows:>8,} {'-':>12} {vectorized_seconds:>15.3f} {'-':>8}")
+      continue
+    rowwise, rowwise_seconds = timed(format_qc_rowwise, df.copy())
+    pd.testing.assert_frame_equal(rowwise, vectorized)
+    print(f"{rows:>8,} {rowwise_seconds:>12.3f} {vectorized_seconds:>15.3f} {rowwise_seconds / vectorized_seconds:>7.1f}x")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,179 @@
+"""
+Time the API functions end to end against the local mock portal (mock_portal.py). Nothing here talks to genomes.atcc.org.
+
+  python benchmarks/bench_portal.py                                    10,000 genomes
+  python benchmarks/bench_portal.py --genomes 100000 --memory          100,000 genomes, with peak memory of every step
+  python benchmarks/bench_portal.py --only pagination,deep_search      a few groups
+  python benchmarks/bench_portal.py --json after.json --baseline before.json
+
+--json saves the results, and --baseline compares a run with saved ones, so a regression in a hot path shows up as a ratio.
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import genome_portal_api as gpa
+from genome_portal_api import genome_portal_api as module
+
+GROUPS = ["pagination", "search", "downloads", "deep_search", "tabulate"]
+API_KEY = "benchmark"
+
+
+def start_mock_portal(args):
+  """Run mock_portal.py in its own process, so that serving does not compete with the client for the GIL"""
+  command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_portal.py"),
+             "--genomes", str(args.genomes), "--latency", str(args.latency), "--contig-scale", str(args.contig_scale)]
+  process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+  line = process.stdout.readline()
+  match = re.search(r"(http://\S+)", line)
+  if not match:
+    process.terminate()
+    raise RuntimeError(f"The mock portal did not start: {line}")
+  print(line.strip())
+  return process, match.group(1)
+
+
+def network_note():
+  """Requests and megabytes received since the last reset_metrics(), from the module's own instrumentation"""
+  endpoints = gpa.get_metrics()["endpoints"].values()
+  requests_made = sum(e["requests"] for e in endpoints)
+  received = sum(e["bytes_received"] for e in endpoints) / 1e6
+  return f"{requests_made:,} requests, {received:,.1f} MB"
+
+
+def download_note(result):
+  errors = f", {len(result['errors'])} genomes with errors" if result["errors"] else ""
+  return network_note() + errors
+
+
+def timer_note(*names):
+  timers = gpa.get_metrics()["timers"]
+  return ", ".join(f"{name} {timers[name]['seconds']:.2f}s" for name in names if name in timers)
+
+
+def run(name, function, note, memory):
+  gpa.reset_metrics()
+  if memory:
+    tracemalloc.start()
+  start = time.perf_counter()
+  with contextlib.redirect_stdout(io.StringIO()):
+    result = function()
+  seconds = time.perf_counter() - start
+  peak_mb = None
+  if memory:
+    peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+  return result, {"name": name, "seconds": seconds, "peak_mb": peak_mb, "note": note(result) if note else ""}
+
+
+def benchmarks(args, work_dir):
+  """(group, name, function, note) for every step, in the order they run. Later steps use the catalog the pagination steps fetched"""
+  state = {}
+  download_dir = os.path.join(work_dir, "downloads")
+  os.makedirs(download_dir, exist_ok=True)
+  sample = lambda: [g["id"] for g in state["catalog"][::max(1, len(state["catalog"]) // args.downloads)][:args.downloads]]
+
+  def fetch_catalog(max_workers):
+    state["catalog"] = list(gpa.get_genomes(API_KEY, max_workers=max_workers))
+    module.global_genome_metadata = state["catalog"]
+    return state["catalog"]
+
+  def download(kinds):
+    return gpa.download_genomes(id_list=sample(), data=kinds, download_dir=download_dir, max_workers=args.workers)
+
+  def methylation():
+    for genome_id in sample()[:10]:
+      gpa.download_methylation(id=genome_id, download_dir=download_dir)
+
+  def fresh_search_index(function):
+    def wrapper():
+      gpa.invalidate_search_index()
+      return function()
+    return wrapper
+
+  return [
+    ("pagination", "get_genomes(), one page at a time", lambda: fetch_catalog(1), lambda r: f"{len(r):,} genomes, " + network_note()),
+    ("pagination", f"get_genomes(), {args.workers} workers", lambda: fetch_catalog(args.workers), lambda r: f"{len(r):,} genomes, " + network_note()),
+    ("pagination", "refresh_metadata_snapshot(), no snapshot yet", lambda: gpa.refresh_metadata_snapshot(api_key=API_KEY, max_workers=args.workers), lambda r: network_note()),
+    ("pagination", "refresh_metadata_snapshot(), nothing changed", lambda: gpa.refresh_metadata_snapshot(api_key=API_KEY, max_workers=args.workers), lambda r: network_note()),
+    ("search", "search_text(text='Escherichia')", lambda: gpa.search_text(text="Escherichia", output="id"), lambda r: f"{len(r or []):,} hits, " + network_note()),
+    ("search", "search_product() x 100", lambda: [gpa.search_product(product_id=f"BAA-{n * 7}", output="id") for n in range(100)], lambda r: network_note()),
+    ("downloads", f"download_genomes() assemblies + annotations, {args.downloads} genomes", lambda: download(["assembly", "annotations"]), download_note),
+    ("downloads", "download_genomes() again, from the artifact cache", lambda: download(["assembly", "annotations"]), download_note),
+    ("downloads", "download_methylation() x 10", methylation, lambda r: network_note()),
+    ("deep_search", "deep_search(text=...), builds the index", fresh_search_index(lambda: gpa.deep_search(text="Lake sediment")), lambda r: f"{len(r or []):,} hits"),
+    ("deep_search", "deep_search(text=...), next query", lambda: gpa.deep_search(text="Infected wound"), lambda r: f"{len(r or []):,} hits"),
+    ("deep_search", "deep_search(fuzz_on=85), builds the index", fresh_search_index(lambda: gpa.deep_search(text="Escherichia colli", fuzz_on=85)), lambda r: f"{len(r or []):,} hits"),
+    ("deep_search", "deep_search(fuzz_on=85), next query", lambda: gpa.deep_search(text="Staphylococus aureus", fuzz_on=85), lambda r: f"{len(r or []):,} hits"),
+    ("tabulate", "tabulate(), whole catalog", lambda: gpa.tabulate(state["catalog"]), lambda r: timer_note("tabulate.flatten", "format_qc")),
+  ]
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark the API functions against a local mock portal")
+  parser.add_argument("--genomes", type=int, default=10_000, help="Size of the synthetic catalog [10000]")
+  parser.add_argument("--latency", type=float, default=0.02, help="Seconds the mock portal adds to every API response [0.02]")
+  parser.add_argument("--contig-scale", type=float, default=0.1, help="Scale of the synthetic contig lengths, 1.0 for full size files [0.1]")
+  parser.add_argument("--downloads", type=int, default=50, help="Genomes to download in the downloads group [50]")
+  parser.add_argument("--workers", type=int, default=8, help="max_workers for concurrent pagination and downloads [8]")
+  parser.add_argument("--only", default=",".join(GROUPS), help=f"Comma separated groups to run [{','.join(GROUPS)}]")
+  parser.add_argument("--memory", action="store_true", help="Record the peak memory of every step with tracemalloc (slows the timed code down)")
+  parser.add_argument("--url", help="Use a mock portal that is already running instead of starting one")
+  parser.add_argument("--json", help="Save the results to this file")
+  parser.add_argument("--baseline", help="Compare with the results saved by an earlier run with --json")
+  args = parser.parse_args()
+  groups = args.only.split(",")
+  unknown = [g for g in groups if g not in GROUPS]
+  if unknown:
+    parser.error(f"Unknown group(s): {', '.join(unknown)}. Choose from {', '.join(GROUPS)}")
+  # deep_search and tabulate need the catalog
+  if any(g in groups for g in ("deep_search", "tabulate", "downloads")) and "pagination" not in groups:
+    groups.insert(0, "pagination")
+
+  process, url = (None, args.url) if args.url else start_mock_portal(args)
+  work_dir = tempfile.mkdtemp(prefix="genome_portal_api_bench_")
+  baseline = {}
+  if args.baseline:
+    with open(args.baseline) as f:
+      baseline = {r["name"]: r for r in json.load(f)["results"]}
+  try:
+    logging.getLogger(module.__name__).setLevel(logging.WARNING)
+    gpa.configure_transport(base_url=url)
+    gpa.set_global_api(api_key=API_KEY)
+    gpa.configure_snapshot(snapshot_dir=os.path.join(work_dir, "snapshot"))
+    # Every step should reach the mock portal, so responses are not reused between them
+    gpa.configure_response_cache(enabled=False)
+
+    results = []
+    print(f"\n{'step':<62} {'seconds':>9} {'peak MB':>9} {'vs baseline':>12}  notes")
+    for group, name, function, note in benchmarks(args, work_dir):
+      if group not in groups:
+        continue
+      _, result = run(name, function, note, args.memory)
+      results.append(result)
+      peak = f"{result['peak_mb']:,.1f}" if result["peak_mb"] is not None else "-"
+      ratio = f"{result['seconds'] / baseline[name]['seconds']:.2f}x" if name in baseline and baseline[name]["seconds"] else "-"
+      print(f"{name:<62} {result['seconds']:>9.3f} {peak:>9} {ratio:>12}  {result['note']}")
+  finally:
+    if process is not None:
+      process.terminate()
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+  if args.json:
+    with open(args.json, "w") as f:
+      json.dump({"genomes": args.genomes, "latency": args.latency, "contig_scale": args.contig_scale, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,328 @@
+"""
+A local stand-in for the ATCC Genome Portal API, serving the synthetic catalog from synthetic.py. Nothing here talks to genomes.atcc.org.
+
+  python benchmarks/mock_portal.py                                   10,000 genomes on a free port
+  python benchmarks/mock_portal.py --genomes 100000 --port 8000 --latency 0.02
+
+Then point the client at it:
+
+  configure_transport(base_url="http://127.0.0.1:8000")
+  set_global_api(api_key="anything")
+
+Served endpoints, shaped like the portal's:
+  GET  /api/genomes?page=N                        paginated catalog with an X-Pagination header, ETag and If-None-Match
+  POST /api/genomes/search?page=N                 {"product_id": ...} or {"text": ...}
+  GET  /api/genomes/<id>                          one genome
+  GET  /api/genomes/<id>/download_assembly        {"url": <signed url>, "save_as_filename": ...}
+  GET  /api/genomes/<id>/download_annotations     same, for the GenBank file
+  GET  /api/genomes/<id>/datasets                 an "epigenome" dataset for bacteriology genomes
+  GET  /api/datasets/<id>/download                {"url": <signed url>}
+  GET  /files/...                                 the signed URLs: FASTA, GenBank and methylation zips, with Range, If-Range, an MD5 ETag and Content-MD5.
+                                                  Expired URLs get a 403, like the storage backend
+"""
+import argparse
+import base64
+import functools
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic import make_genome
+
+BLOCK = 5120  # bases in the repeated sequence block, a multiple of the FASTA (80) and GenBank (60) line widths
+PRODUCTS = ["hypothetical protein", "beta-lactamase", "DNA gyrase subunit A", "50S ribosomal protein L2", "ABC transporter permease", "efflux pump"]
+GENES = ["blaTEM", "gyrA", "rplB", "tetA", "acrB", "mecA", None, None, None]
+
+
+class MockPortal:
+  """The synthetic catalog and the files behind it, with the settings the request handler reads"""
+
+  def __init__(self, genomes=10_000, page_size=50, latency=0.0, url_ttl=600, contig_scale=1.0):
+    self.genomes = genomes
+    self.page_size = page_size
+    self.latency = latency
+    self.url_ttl = url_ttl
+    self.contig_scale = contig_scale
+    self.secret = os.urandom(8).hex()
+    self.lock = threading.Lock()
+    self.requests = 0
+    self.corrupt_files = 0  # number of file responses still to send with a byte flipped after their checksum, for integrity tests
+    # Page bodies are built up front, so that the client is timed rather than the generation of the catalog
+    self.pages = []
+    self.search_haystack = []
+    for start in range(0, genomes, page_size):
+      rows = [make_genome(number) for number in range(start, min(start + page_size, genomes))]
+      self.pages.append(json.dumps(rows).encode())
+      self.search_haystack.extend(f"{g['taxon_name']} {g['product_id']}".lower() for g in rows)
+
+  def number(self, identifier):
+    """Catalog number of a genome or dataset ID, or None"""
+    try:
+      number = int(identifier, 16)
+    except ValueError:
+      return None
+    return number if 0 <= number < self.genomes else None
+
+  def sign(self, base_url, path):
+    expires = int(time.time() + self.url_ttl)
+    signature = hashlib.sha256(f"{self.secret}{path}{expires}".encode()).hexdigest()[:32]
+    return f"{base_url}{path}?X-Expires={expires}&X-Signature={signature}"
+
+  def signature_is_valid(self, path, query):
+    expires, signature = query.get("X-Expires", ["0"])[0], query.get("X-Signature", [""])[0]
+    return expires.isdigit() and int(expires) > time.time() and signature == hashlib.sha256(f"{self.secret}{path}{expires}".encode()).hexdigest()[:32]
+
+  def contigs(self, number):
+    genome = make_genome(number)
+    contigs = genome["primary_assembly"]["attributes"]["qc_statistics"]["assembly_statistics"]["filtered"]["contig_statistics"]
+    return genome, [(contig["name"], max(BLOCK, int(contig["length"] * self.contig_scale))) for contig in contigs]
+
+  def sequence(self, number, contig, length):
+    """A deterministic sequence, one random block repeated, with a short run of Ns in every contig but the first"""
+    block = "".join(random.Random(f"{number}:{contig}").choices("ACGT", k=BLOCK))
+    sequence = block * (length // BLOCK) + block[:length % BLOCK]
+    if contig:
+      middle = length // 2
+      sequence = sequence[:middle] + "N" * 100 + sequence[middle + 100:]
+    return sequence
+
+  @functools.lru_cache(maxsize=32)
+  def fasta(self, number):
+    genome, contigs = self.contigs(number)
+    out = []
+    for contig, (name, length) in enumerate(contigs):
+      sequence = self.sequence(number, contig, length)
+      out.append(f'>{name} assembly_id="{genome["primary_assembly"]["id"]}" genome_id="{genome["id"]}" atcc_catalog_number="ATCC {genome["product_id"]}" '
+                 f'species="{genome["taxon_name"]}" contig_number="{contig + 1}" topology="{"circular" if contig == 0 else "linear"}"\n')
+      out.extend(sequence[i:i + 80] + "\n" for i in range(0, length, 80))
+    return "".join(out).encode()
+
+  @functools.lru_cache(maxsize=32)
+  def genbank(self, number):
+    """One record per contig, with a gene and CDS about every kilobase, like a PGAP annotation"""
+    genome, contigs = self.contigs(number)
+    rng = random.Random(number)
+    out = []
+    locus = 0
+    for contig, (name, length) in enumerate(contigs):
+      topology = "circular" if contig == 0 else "linear"
+      out.append(
+        f"LOCUS       {name} {length} bp    DNA     {topology} BCT 30-APR-2024\n"
+        f"DEFINITION  {genome['taxon_name']} ATCC {genome['product_id']}, contig {contig + 1}.\n"
+        f"ACCESSION   {name}\n"
+        f"VERSION     assembly_{name}\n"
+        f"KEYWORDS    .\n"
+        f"SOURCE      https://genomes.atcc.org/genomes/{genome['id']}\n"
+        f"  ORGANISM  {genome['taxon_name']}\n"
+        f"FEATURES             Location/Qualifiers\n"
+        f"     source          1..{length}\n"
+        f"                     /organism=\"{genome['taxon_name']}\"\n"
+        f"                     /mol_type=\"genomic DNA\"\n"
+        f"                     /db_xref=\"taxon:{genome['taxon_id']}\"\n"
+      )
+      position = 1
+      while position + 400 < length:
+        end = min(length, position + rng.randint(300, 1500))
+        locus += 1
+        location = f"{position}..{end}" if rng.random() < 0.5 else f"complement({position}..{end})"
+        gene = rng.choice(GENES)
+        tags = f"                     /locus_tag=\"pgap_annot_{locus:06d}\"\n" + (f"                     /gene=\"{gene}\"\n" if gene else "")
+        out.append(f"     gene            {location}\n{tags}")
+        out.append(
+          f"     CDS             {location}\n{tags}"
+          f"                     /inference=\"COORDINATES: ab initio prediction:GeneMarkS-2+\"\n"
+          f"                     /codon_start=1\n"
+          f"                     /transl_table=11\n"
+          f"                     /product=\"{rng.choice(PRODUCTS)}\"\n"
+          f"                     /protein_id=\"extdb:pgap_annot_{locus:06d}\"\n"
+        )
+        position = end + rng.randint(20, 200)
+      out.append("ORIGIN\n")
+      sequence = self.sequence(number, contig, length).lower()
+      for i in range(0, length, 60):
+        line = sequence[i:i + 60]
+        out.append(f"{i + 1:>9} " + " ".join(line[j:j + 10] for j in range(0, len(line), 10)) + "\n")
+      out.append("//\n")
+    return "".join(out).encode()
+
+  @functools.lru_cache(maxsize=32)
+  def methylation(self, number):
+    genome, contigs = self.contigs(number)
+    rng = random.Random(number)
+    bed = "".join(f"{name}\t{p}\t{p + 1}\t6mA\t{rng.randint(10, 100)}\t+\n" for name, length in contigs for p in sorted(rng.sample(range(length - 1), min(2000, length - 1))))
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+      zf.writestr(f"{genome['id']}_6mA.bed", bed)
+    return buffer.getvalue()
+
+
+class Handler(BaseHTTPRequestHandler):
+  protocol_version = "HTTP/1.1"
+  # Headers and body are written separately, Nagle's algorithm would hold the body back for the client's delayed ACK
+  disable_nagle_algorithm = True
+  portal = None
+
+  def log_message(self, *args):
+    pass
+
+  def send(self, status, body, content_type="application/json", headers=None):
+    if not isinstance(body, bytes):
+      body = (body if isinstance(body, str) else json.dumps(body)).encode()
+    self.send_response(status)
+    self.send_header("Content-Type", content_type)
+    self.send_header("Content-Length", str(len(body)))
+    for name, value in (headers or {}).items():
+      self.send_header(name, value)
+    self.end_headers()
+    if self.command != "HEAD":
+      self.wfile.write(body)
+
+  def api_call(self):
+    """Common handling of /api/ requests. Returns False when a response was already sent"""
+    with self.portal.lock:
+      self.portal.requests += 1
+    if self.portal.latency:
+      time.sleep(self.portal.latency)
+    # The paginated catalog takes the key as HTTP basic auth, the other endpoints in an X-API-Key header
+    if not self.headers.get("X-API-Key") and not self.headers.get("Authorization", "").startswith("Basic "):
+      self.send(401, {"message": "API access to the ATCC Genome Portal requires a supporting membership."})
+      return False
+    return True
+
+  def do_GET(self):
+    url = urlparse(self.path)
+    query = parse_qs(url.query)
+    base_url = f"http://{self.headers['Host']}"
+    if url.path.startswith("/files/"):
+      return self.send_file(url.path, query)
+    if not url.path.startswith("/api/"):
+      return self.send(404, {"message": "Not found."})
+    if not self.api_call():
+      return
+
+    if url.path == "/api/genomes":
+      page = int(query.get("page", ["1"])[0])
+      total_pages = len(self.portal.pages)
+      body = self.portal.pages[page - 1] if 1 <= page <= total_pages else b"[]"
+      pagination = {"total": self.portal.genomes, "total_pages": total_pages, "first_page": 1, "last_page": total_pages, "page": page,
+                    "previous_page": page - 1 if page > 1 else None, "next_page": page + 1 if page < total_pages else None}
+      etag = '"%s"' % hashlib.md5(body).hexdigest()
+      if self.headers.get("If-None-Match") == etag:
+        self.send_response(304)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", "0")
+        return self.end_headers()
+      return self.send(200, body, headers={"X-Pagination": json.dumps(pagination), "ETag": etag})
+
+    match = re.match(r"^/api/genomes/([^/]+)(?:/(\w+))?$", url.path)
+    if match:
+      number = self.portal.number(match.group(1))
+      if number is None:
+        return self.send(404, {"message": "Not found."})
+      genome = make_genome(number)
+      action = match.group(2)
+      if action is None:
+        return self.send(200, genome)
+      if action == "download_assembly":
+        return self.send(200, {"url": self.portal.sign(base_url, f"/files/{genome['id']}.fasta"), "save_as_filename": f"{genome['product_id']}.fasta"})
+      if action == "download_annotations":
+        return self.send(200, {"url": self.portal.sign(base_url, f"/files/{genome['id']}.gbk"), "save_as_filename": f"{genome['product_id']}.gbk"})
+      if action == "datasets":
+        return self.send(200, [{"id": genome["id"], "type": "epigenome"}] if genome["collection_name"] == "bacteriology" else [])
+      return self.send(404, {"message": "Not found."})
+
+    match = re.match(r"^/api/datasets/([^/]+)/download$", url.path)
+    if match and self.portal.number(match.group(1)) is not None:
+      return self.send(200, {"url": self.portal.sign(base_url, f"/files/{match.group(1)}.zip")})
+    return self.send(404, {"message": "Not found."})
+
+  def do_HEAD(self):
+    self.do_GET()
+
+  def do_POST(self):
+    url = urlparse(self.path)
+    body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+    if url.path != "/api/genomes/search":
+      return self.send(404, {"message": "Not found."})
+    if not self.api_call():
+      return
+    if "product_id" in body:
+      product_id = str(body["product_id"]).upper()
+      number = int(product_id[4:]) if re.fullmatch(r"BAA-\d+", product_id) else None
+      numbers = [number] if number is not None and number < self.portal.genomes else []
+    else:
+      text = str(body.get("text", "")).lower()
+      numbers = [number for number, haystack in enumerate(self.portal.search_haystack) if text in haystack]
+    page = int(parse_qs(url.query).get("page", ["1"])[0])
+    page_size = self.portal.page_size
+    return self.send(200, [make_genome(number) for number in numbers[(page - 1) * page_size: page * page_size]])
+
+  def send_file(self, path, query):
+    if not self.portal.signature_is_valid(path, query):
+      return self.send(403, "<Error><Code>AccessDenied</Code><Message>Request has expired</Message></Error>", "application/xml")
+    match = re.match(r"^/files/([0-9a-f]+)\.(fasta|gbk|zip)$", path)
+    number = self.portal.number(match.group(1)) if match else None
+    if number is None:
+      return self.send(404, "<Error><Code>NoSuchKey</Code><Message>The specified key does not exist.</Message></Error>", "application/xml")
+    body = {"fasta": self.portal.fasta, "gbk": self.portal.genbank, "zip": self.portal.methylation}[match.group(2)](number)
+    etag = '"%s"' % hashlib.md5(body).hexdigest()
+    headers = {"ETag": etag, "Accept-Ranges": "bytes"}
+    byte_range = re.match(r"^bytes=(\d+)-$", self.headers.get("Range", ""))
+    if byte_range and self.headers.get("If-Range") in (None, etag):
+      start = int(byte_range.group(1))
+      if start >= len(body):
+        return self.send(416, b"", "application/octet-stream", {"Content-Range": f"bytes */{len(body)}"})
+      headers["Content-Range"] = f"bytes {start}-{len(body) - 1}/{len(body)}"
+      return self.send(206, body[start:], "application/octet-stream", headers)
+    headers["Content-MD5"] = base64.b64encode(hashlib.md5(body).digest()).decode()
+    with self.portal.lock:
+      corrupt, self.portal.corrupt_files = self.portal.corrupt_files > 0, max(0, self.portal.corrupt_files - 1)
+    if corrupt:
+      body = body[:-2] + bytes([body[-2] ^ 1]) + body[-1:]
+    return self.send(200, body, "application/octet-stream", headers)
+
+
+def serve(portal, host="127.0.0.1", port=0):
+  """Start serving portal in a background thread, returns the server (server.server_address has the port)"""
+  handler = type("PortalHandler", (Handler,), {"portal": portal})
+  server = ThreadingHTTPServer((host, port), handler)
+  server.daemon_threads = True
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  return server
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Serve a synthetic ATCC Genome Portal API locally")
+  parser.add_argument("--genomes", type=int, default=10_000, help="Number of genomes in the catalog [10000]")
+  parser.add_argument("--host", default="127.0.0.1", help="Address to listen on [127.0.0.1]")
+  parser.add_argument("--port", type=int, default=0, help="Port to listen on [a free port]")
+  parser.add_argument("--page-size", type=int, default=50, help="Genomes per page of /api/genomes and search results [50]")
+  parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every API response, to stand in for the network [0]")
+  parser.add_argument("--url-ttl", type=int, default=600, help="Seconds a signed download URL stays valid [600]")
+  parser.add_argument("--contig-scale", type=float, default=1.0, help="Scale the contig lengths of the catalog for smaller or larger files [1.0]")
+  args = parser.parse_args()
+
+  start = time.perf_counter()
+  portal = MockPortal(genomes=args.genomes, page_size=args.page_size, latency=args.latency, url_ttl=args.url_ttl, contig_scale=args.contig_scale)
+  server = serve(portal, args.host, args.port)
+  host, port = server.server_address[:2]
+  # Benchmarks started as a subprocess read the URL from this line
+  print(f"Serving {args.genomes:,} synthetic genomes at http://{host}:{port} (built in {time.perf_counter() - start:.1f}s)", flush=True)
+  try:
+    threading.Event().wait()
+  except KeyboardInterrupt:
+    server.shutdown()
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,93 @@
+"""Synthetic, portal-shaped genome metadata for the benchmarks. Nothing here talks to genomes.atcc.org."""
+import random
+
+TAXA = [
+  ("Escherichia coli", 562, "bacteriology"),
+  ("Salmonella enterica", 28901, "bacteriology"),
+  ("Staphylococcus aureus", 1280, "bacteriology"),
+  ("Candida auris", 498019, "mycology"),
+  ("Aspergillus brasiliensis", 319629, "mycology"),
+  ("Human adenovirus 5", 28285, "virology"),
+  ("Influenza A virus", 11320, "virology"),
+]
+ANTIBIOTICS = ["ampicillin", "ciprofloxacin", "gentamicin", "meropenem", "tetracycline", "vancomycin"]
+SOURCES = ["Urine", "Blood", "Infected wound", "Lake sediment", "Patient with a duodenal ulcer", None]
+
+
+def genome_id(number):
+  return f"{number:016x}"
+
+
+def make_genome(number):
+  """One genome record with the fields format_qc() and the search functions read"""
+  rng = random.Random(number)
+  taxon_name, taxon_id, collection = TAXA[number % len(TAXA)]
+  contigs = [
+    {"name": f"{genome_id(number + 1_000_000)}_{i + 1}", "length": rng.randint(2_000, 5_000_000), "ambiguous_nucleotide_count": rng.randint(0, 3)}
+    for i in range(rng.randint(1, 8))
+  ]
+  resistant = rng.sample(ANTIBIOTICS, rng.randint(0, 3))
+  assembled_by_atcc = number % 2 == 0
+  atcc_metadata = {
+    "preferred_taxonomy_name": taxon_name,
+    "notes": "Assembled with the oatmeal pipeline" if assembled_by_atcc else "",
+    "amr_intermediate": [],
+    "amr_resistant": resistant,
+    "amr_susceptible": [a for a in ANTIBIOTICS if a not in resistant][:2],
+    "antibiotic_resistance": ", ".join(resistant) or None,
+    "isolation_new_web": SOURCES[number % len(SOURCES)],
+    "bsl": 1 + number % 3,
+    "qc_statistics": {"assembly_quality_control": {
+      "genome_completeness": round(rng.uniform(95, 100), 2),
+      "genome_contamination": round(rng.uniform(0, 2), 2),
+      "illumina_depth_of_coverage": rng.randint(50, 400),
+      "ont_depth_of_coverage": rng.randint(20, 200),
+    }},
+  }
+  if number % 3 == 0:
+    atcc_metadata["other_metadata"] = {
+      "catalog_details": {"ATCC_catalog_number": f"BAA-{number}", "ATCC_lot_number": f"7000{number}"},
+      "genome_stats": {"filtered_contig_count": len(contigs), "filtered_contig_length": sum(c["length"] for c in contigs), "number_of_n_bases": 0},
+      "illumina_metadata": {"barcoding_kit": "IDT UDI", "library_kit": "Illumina DNA Prep", "sequencer": "NovaSeq 6000", "basecaller_model": "RTA", "basecaller_version": "3.4.4"},
+      "ont_metadata": {"barcoding_kit": "SQK-NBD114.96", "library_kit": "SQK-LSK114", "flowcell_type": "R10.4.1", "sequencer": "PromethION", "basecaller_model": "dna_r10.4.1_e8.2_400bps_sup", "basecaller_version": "7.2.13"},
+      "genome_provider": {"asssembled_by": "ATCC", "asssembly_date": "2024-01-15", "asssembler_software": "Flye 2.9",
+                          "annotatated_by": "ATCC", "annotations_date": "2024-01-20", "annotations_software": "PGAP 6.6"},
+    }
+  # Virology genomes without CheckM results fall back to virify, whose fraction is scaled to a percentage. 0.745 and 0.125 land on .5
+  checkm_completeness = round(rng.uniform(90, 100), 2)
+  virify_completeness = round(rng.uniform(0.8, 1), 3) if collection == "virology" else None
+  if collection == "virology" and number % 2:
+    checkm_completeness = None
+    virify_completeness = [virify_completeness, 0.745, 0.125][number % 3]
+  return {
+    "id": genome_id(number),
+    "product_id": f"BAA-{number}",
+    "taxon_name": taxon_name,
+    "taxon_id": taxon_id,
+    "collection_name": collection,
+    "created_at": f"2023-{1 + number % 12:02d}-{1 + number % 28:02d}T12:00:00.000000+00:00",
+    "updated_at": f"2024-{1 + number % 12:02d}-{1 + number % 28:02d}T12:00:00.000000+00:00",
+    "attributes": {"atcc_metadata": atcc_metadata},
+    "primary_assembly": {
+      "id": genome_id(number + 1_000_000),
+      "visibility": "public",
+      "attributes": {
+        "contig_lengths": [float(c["length"]) for c in contigs],
+        "qc_statistics": {
+          "assembly_statistics": {"filtered": {
+            "total_contigs": len(contigs),
+            "total_contig_length": sum(c["length"] for c in contigs),
+            "total_circular_contigs": rng.randint(0, len(contigs)),
+            "contig_statistics": contigs,
+          }},
+          "checkm_results": {"completeness": checkm_completeness, "contamination": round(rng.uniform(0, 3), 2)},
+          "virify_results": {"completeness": virify_completeness},
+          "sequencing_statistics": {"illumina": {"depth": {"mean": rng.randint(50, 400)}}, "ont": {"depth": {"mean": rng.randint(20, 200)}}},
+        },
+      },
+    },
+  }
+
+
+def make_catalog(size):
+  return [make_genome(number) for number in range(size)]
@@ -1 +1 @@
-from .genome_portal_api import  set_global_api, get_global_metadata, get_global_apikey, set_global_api, load_all_metadata, flatten_dict, tabulate,  json_search, search_product, search_text, deep_search,  download_assembly, download_annotations, download_all_genomes, download_metadata, get_genomes, iter_paginated_endpoint, convert_to_genomeid, format_qc, retrieve_datasets_json, download_methylation
\ No newline at end of file
+from .genome_portal_api import  set_global_api, get_global_metadata, get_global_apikey, set_global_api, load_all_metadata, flatten_dict, tabulate,  json_search, search_product, search_text, deep_search,  download_assembly, download_annotations, download_all_genomes, download_metadata, get_genomes, iter_paginated_endpoint, convert_to_genomeid, format_qc, retrieve_datasets_json, download_methylation, configure_transport, get_session, download_genomes, configure_snapshot, load_metadata_snapshot, save_metadata_snapshot, refresh_metadata_snapshot, invalidate_search_index, fuzzy_search, IndexedFasta, export_metadata_table, query_metadata_table, query_genomes, configure_artifact_cache, iter_search_text, search_products, configure_response_cache, invalidate_response_cache, response_cache_stats, configure_metrics, get_metrics, reset_metrics, add_metrics_hook, remove_metrics_hook, configure_offline, build_offline_snapshot, GenbankFeatures, GenbankFeature, iter_genbank_features, FeatureIndex, configure_compression, PackedAssembly, PackedSequence
\ No newline at end of file
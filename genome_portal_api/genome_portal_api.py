@@ -5,14 +5,43 @@ import json
 import time
 import pickle as pkl
 from fuzzywuzzy import fuzz
+try:
+  from rapidfuzz import fuzz as rapid_fuzz, process as rapid_process
+except ImportError:
+  rapid_fuzz = rapid_process = None
 import logging
 import requests
 import glob
 from typing import Any, Dict, Generator, List, Optional
-from collections import Counter
+from collections import Counter, OrderedDict, deque, namedtuple
 from dateutil.parser import parse
 import pandas as pd
-import subprocess
+import threading
+import tempfile
+import mmap
+import shutil
+import weakref
+from collections.abc import Mapping, Sequence
+import math
+import numpy as np
+import re
+import ast
+import hashlib
+import base64
+import io
+import http.client
+import random
+import functools
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import parse_qs
+from bisect import bisect_left, bisect_right
+import gzip
+import struct
+import zlib
+from datetime import datetime, timezone
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from itertools import count, islice
+from requests.adapters import HTTPAdapter
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -35,6 +64,538 @@ class emptyResultsError(Exception):
   def __init__(self, message):
     self.message = message
 
+
+## Shared HTTP transport. Every endpoint wrapper goes through one pooled requests.Session
+## so repeated calls reuse keep-alive connections instead of forking curl per request.
+transport_settings = {
+  "base_url": "https://genomes.atcc.org",
+  "pool_connections": 10,
+  "pool_maxsize": 32,
+  "connect_timeout": 10,
+  "read_timeout": 300,
+  "verify": True,
+  "max_retries": 5,
+  "backoff_factor": 0.5,
+  "backoff_max": 60,
+  "rate_limit": None,
+  "rate_burst": 10,
+}
+retry_statuses = {429, 500, 502, 503, 504}
+_session = None
+_session_lock = threading.Lock()
+
+
+def configure_transport(**kwargs):
+  """
+    configure_transport() is a function used to tune the shared HTTP connection pool used by every API call.
+    Calling it drops the current pool, the next request opens a new one with the updated settings. \n
+
+    --------- USAGE ---------
+    Optional arguments:
+    \t base_url = <str> \n \t\t Root URL of the Genome Portal [(https://genomes.atcc.org)]
+    \t pool_connections = <int> \n \t\t Number of host pools to cache [(10)]
+    \t pool_maxsize = <int> \n \t\t Maximum number of keep-alive connections per host [(32)]
+    \t connect_timeout = <float> \n \t\t Seconds to wait for a connection [(10)]
+    \t read_timeout = <float> \n \t\t Seconds to wait between bytes of a response [(300)]
+    \t verify = <bool> \n \t\t Verify TLS certificates [(True)]
+    \t max_retries = <int> \n \t\t Retries for connection errors and 429/5xx responses [(5)]
+    \t backoff_factor = <float> \n \t\t Base of the exponential backoff between retries, in seconds, with full jitter [(0.5)]
+    \t backoff_max = <float> \n \t\t Longest wait between two retries, unless the server asks for longer with Retry-After [(60)]
+    \t rate_limit = <float> \n \t\t Maximum portal API requests per second, shared by every thread [(None) for no limit]
+    \t rate_burst = <int> \n \t\t Requests that may be sent at once before rate_limit applies [(10)]
+  """
+  global _session, _search_page_size
+  unknown = [k for k in kwargs if k not in transport_settings]
+  if unknown:
+    logger.warning(f"Unknown transport setting(s): {', '.join(unknown)}. Choose from {', '.join(transport_settings)}")
+    return
+  base_url = transport_settings["base_url"]
+  transport_settings.update(kwargs)
+  transport_settings["base_url"] = transport_settings["base_url"].rstrip("/")
+  if transport_settings["base_url"] != base_url:
+    # The search page size was learned from the previous portal
+    _search_page_size = None
+  with _session_lock:
+    if _session is not None:
+      _session.close()
+    _session = None
+
+
+def get_session():
+  """Return the shared, pooled requests.Session (created on first use)"""
+  global _session
+  if _session is None:
+    with _session_lock:
+      if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=transport_settings["pool_connections"], pool_maxsize=transport_settings["pool_maxsize"])
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.verify = transport_settings["verify"]
+        if offline_settings["enabled"]:
+          offline_adapter = _OfflineAdapter()
+          session.mount(transport_settings["base_url"] + "/", offline_adapter)
+          session.mount("offline://", offline_adapter)
+        _session = session
+  return _session
+
+
+def _portal_url(path):
+  if path.startswith("http://") or path.startswith("https://"):
+    return path
+  return transport_settings["base_url"] + path
+
+
+## Instrumentation. Every request attempt is recorded per endpoint (genome and dataset IDs in the path are replaced by "{id}",
+## downloads from signed URLs are grouped by storage host) with a latency histogram, bytes sent and received, errors, retries,
+## time spent sleeping before retries or waiting on the rate limit, and response cache hits. tabulate(), format_qc(),
+## deep_search() and the JSON decoding of large pages are timed the same way. Hooks receive every measurement as it is made.
+metrics_settings = {
+  "enabled": True,
+}
+metrics_latency_buckets = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, float("inf")]
+_metrics_lock = threading.Lock()
+_metrics = {"endpoints": {}, "timers": {}}
+_metrics_hooks = []
+_endpoint_id_pattern = re.compile(r"(/api/(?:genomes|datasets)/)(?!search(?:/|$))[^/]+")
+
+
+def _endpoint_name(method, url):
+  base_url = transport_settings["base_url"]
+  if url.startswith(base_url + "/api/"):
+    path = _endpoint_id_pattern.sub(r"\1{id}", url[len(base_url):].split("?")[0])
+    return f"{method} {path}"
+  return f"{method} signed URL ({requests.utils.urlparse(url).netloc})"
+
+
+def _new_histogram():
+  return {"count": 0, "seconds": 0.0, "max_seconds": 0.0, "buckets": [0] * len(metrics_latency_buckets)}
+
+
+def _observe(histogram, seconds):
+  histogram["count"] += 1
+  histogram["seconds"] += seconds
+  histogram["max_seconds"] = max(histogram["max_seconds"], seconds)
+  histogram["buckets"][bisect_left(metrics_latency_buckets, seconds)] += 1
+
+
+def _emit(event):
+  for hook in list(_metrics_hooks):
+    try:
+      hook(event)
+    except Exception as e:
+      logger.warning(f"Metrics hook {getattr(hook, '__name__', hook)} failed: {e}")
+
+
+def _endpoint_metrics(name):
+  endpoint = _metrics["endpoints"].get(name)
+  if endpoint is None:
+    endpoint = _metrics["endpoints"][name] = {"latency": _new_histogram(), "counters": Counter()}
+  return endpoint
+
+
+def _record_request(method, url, seconds, status=None, bytes_sent=0, bytes_received=0):
+  """One request attempt. status is None when the connection failed"""
+  if not metrics_settings["enabled"]:
+    return
+  name = _endpoint_name(method, url)
+  with _metrics_lock:
+    endpoint = _endpoint_metrics(name)
+    _observe(endpoint["latency"], seconds)
+    endpoint["counters"]["bytes_sent"] += bytes_sent
+    endpoint["counters"]["bytes_received"] += bytes_received
+    if status is None or status >= 400:
+      endpoint["counters"]["errors"] += 1
+  _emit({"type": "request", "name": name, "seconds": seconds, "status": status, "bytes_sent": bytes_sent, "bytes_received": bytes_received})
+
+
+def _record_count(method, url, counter, value=1):
+  """Add to one of an endpoint's counters (ex. "retries", "retry_sleep_seconds", "cache_hits", "bytes_received")"""
+  if not metrics_settings["enabled"]:
+    return
+  name = _endpoint_name(method, url)
+  with _metrics_lock:
+    _endpoint_metrics(name)["counters"][counter] += value
+  _emit({"type": counter, "name": name, "value": value})
+
+
+def _record_timer(name, seconds):
+  if not metrics_settings["enabled"]:
+    return
+  with _metrics_lock:
+    timer = _metrics["timers"].get(name)
+    if timer is None:
+      timer = _metrics["timers"][name] = _new_histogram()
+    _observe(timer, seconds)
+  _emit({"type": "timer", "name": name, "seconds": seconds})
+
+
+def _timed(name):
+  """Decorator recording the duration of every call of a function under the timer "name" """
+  def decorator(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+      start = time.perf_counter()
+      try:
+        return function(*args, **kwargs)
+      finally:
+        _record_timer(name, time.perf_counter() - start)
+    return wrapper
+  return decorator
+
+
+@_timed("json_decode")
+def _json_loads(text):
+  return json.loads(text)
+
+
+def _histogram_summary(histogram):
+  summary = {
+    "count": histogram["count"],
+    "seconds": round(histogram["seconds"], 6),
+    "mean_seconds": round(histogram["seconds"] / histogram["count"], 6) if histogram["count"] else None,
+    "max_seconds": round(histogram["max_seconds"], 6),
+  }
+  # Percentiles are reported as the upper bound of the bucket they fall in
+  for label, quantile in (("p50_seconds", 0.5), ("p95_seconds", 0.95), ("p99_seconds", 0.99)):
+    seen, summary[label] = 0, None
+    for bound, bucket in zip(metrics_latency_buckets, histogram["buckets"]):
+      seen += bucket
+      if histogram["count"] and seen >= quantile * histogram["count"]:
+        summary[label] = bound if bound != float("inf") else round(histogram["max_seconds"], 6)
+        break
+  summary["histogram"] = {f"<={bound:g}": bucket for bound, bucket in zip(metrics_latency_buckets, histogram["buckets"]) if bucket}
+  return summary
+
+
+def configure_metrics(**kwargs):
+  """
+    configure_metrics() is a function used to turn the recording of request and timing metrics on or off. \n
+
+    --------- USAGE ---------
+    Optional arguments:
+    \t enabled = <bool> \n \t\t Record metrics and call the hooks added with add_metrics_hook() [(True) | False ]
+  """
+  unknown = [k for k in kwargs if k not in metrics_settings]
+  if unknown:
+    logger.warning(f"Unknown metrics setting(s): {', '.join(unknown)}. Choose from {', '.join(metrics_settings)}")
+    return
+  metrics_settings.update(kwargs)
+
+
+def get_metrics(**kwargs):
+  """
+    get_metrics() is a function used to see where time goes: network requests per endpoint, retries, rate limiting, the response cache and local processing. \n
+
+    --------- USAGE ---------
+    Optional arguments:
+    \t output = <str> \n \t\t (json) a dict with "endpoints", "timers" and "response_cache" | (table) one row per endpoint and timer [(json) | table]
+
+    Each endpoint reports its requests (every attempt, including retried ones), errors, latency (mean, max, p50/p95/p99 and a histogram
+    of seconds to the response headers), bytes_sent, bytes_received, retries, retry_sleep_seconds, rate_limit_wait_seconds and response cache hits.
+  """
+  output = kwargs['output'] if 'output' in kwargs else "json"
+  if output not in ['json','table']:
+    logger.warning("Whoops, make sure you are providing all the correct arguments and choices!")
+    return
+  with _metrics_lock:
+    endpoints = {}
+    for name, endpoint in sorted(_metrics["endpoints"].items()):
+      latency = _histogram_summary(endpoint["latency"])
+      summary = {"requests": latency.pop("count")}
+      for counter in ("errors", "retries", "retry_sleep_seconds", "rate_limit_wait_seconds", "bytes_sent", "bytes_received", "cache_hits", "cache_misses", "cache_coalesced"):
+        value = endpoint["counters"][counter]
+        summary[counter] = round(value, 6) if isinstance(value, float) else value
+      summary.update(latency)
+      endpoints[name] = summary
+    timers = {name: _histogram_summary(timer) for name, timer in sorted(_metrics["timers"].items())}
+  stats = {"endpoints": endpoints, "timers": timers, "response_cache": response_cache_stats()}
+  if output == "table":
+    rows = [{"kind": "endpoint", "name": name, **{k: v for k, v in summary.items() if k != "histogram"}} for name, summary in endpoints.items()]
+    rows += [{"kind": "timer", "name": name, "requests": summary["count"], **{k: v for k, v in summary.items() if k not in ("count", "histogram")}} for name, summary in timers.items()]
+    return pd.DataFrame(rows)
+  return stats
+
+
+def reset_metrics():
+  """Forget every recorded measurement"""
+  with _metrics_lock:
+    _metrics["endpoints"].clear()
+    _metrics["timers"].clear()
+
+
+def add_metrics_hook(hook):
+  """
+    Call hook(event) for every measurement, to forward it to another metrics system (statsd, Prometheus, OpenTelemetry...).
+    event is a dict with a "type" and a "name" (the endpoint or timer):
+    \t {"type": "request", "name": "GET /api/genomes", "seconds": 0.21, "status": 200, "bytes_sent": 0, "bytes_received": 51234}
+    \t {"type": "timer", "name": "format_qc", "seconds": 1.3}
+    \t {"type": "retries" | "retry_sleep_seconds" | "rate_limit_wait_seconds" | "bytes_received" | "cache_hits" | "cache_misses" | "cache_coalesced", "name": ..., "value": ...}
+    Hooks are called from the thread that made the measurement, and exceptions they raise are logged and ignored.
+  """
+  _metrics_hooks.append(hook)
+
+
+def remove_metrics_hook(hook):
+  if hook in _metrics_hooks:
+    _metrics_hooks.remove(hook)
+
+
+## Retries and rate limiting. Connection errors and 429/5xx responses are retried with exponential backoff and full jitter,
+## waiting at least as long as a Retry-After header asks. Portal API calls also take a token from a bucket shared by every
+## thread. A 429 holds all threads back for the Retry-After period and halves the rate, which then climbs back up as requests succeed.
+class _RateLimiter:
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.tokens = None
+    self.updated = time.monotonic()
+    self.paused_until = 0.0
+    self.rate = None
+
+  def acquire(self):
+    """Block until a request may be sent. Returns the seconds spent waiting"""
+    waited = 0.0
+    while True:
+      with self.lock:
+        now = time.monotonic()
+        limit, burst = transport_settings["rate_limit"], transport_settings["rate_burst"]
+        if self.rate is None or not limit or self.rate > limit:
+          self.rate = limit
+        if self.rate:
+          self.tokens = burst if self.tokens is None else min(burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = self.paused_until - now
+        if wait <= 0:
+          if not self.rate:
+            return waited
+          if self.tokens >= 1:
+            self.tokens -= 1
+            return waited
+          wait = (1 - self.tokens) / self.rate
+      time.sleep(wait)
+      waited += wait
+
+  def throttled(self, seconds):
+    """The server asked us to slow down: hold every thread back, and halve the rate"""
+    with self.lock:
+      self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+      if self.rate:
+        self.rate = max(self.rate / 2, transport_settings["rate_limit"] / 16)
+        self.tokens = 0
+
+  def succeeded(self):
+    """A request went through: win back a twentieth of the configured rate"""
+    with self.lock:
+      limit = transport_settings["rate_limit"]
+      if self.rate and limit and self.rate < limit:
+        self.rate = min(limit, self.rate + limit / 20)
+
+
+_rate_limiter = _RateLimiter()
+
+
+def _retry_after_seconds(value):
+  """Seconds to wait from a Retry-After header, given as seconds or an HTTP date"""
+  if not value:
+    return None
+  try:
+    return max(0.0, float(value))
+  except ValueError:
+    pass
+  try:
+    return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+  except (TypeError, ValueError):
+    return None
+
+
+def _backoff_delay(attempt, retry_after=None):
+  """Exponential backoff with full jitter for the given retry attempt (0 based), never shorter than Retry-After"""
+  delay = random.uniform(0, min(transport_settings["backoff_max"], transport_settings["backoff_factor"] * 2 ** attempt))
+  retry_after = _retry_after_seconds(retry_after)
+  return max(delay, retry_after) if retry_after is not None else delay
+
+
+def _send(method, url, rate_limited, **kwargs):
+  """Send a request through the shared session, retrying connection errors and 429/5xx responses"""
+  kwargs.setdefault("timeout", (transport_settings["connect_timeout"], transport_settings["read_timeout"]))
+  max_retries = transport_settings["max_retries"]
+  for attempt in range(max_retries + 1):
+    if rate_limited:
+      waited = _rate_limiter.acquire()
+      if waited:
+        _record_count(method, url, "rate_limit_wait_seconds", waited)
+    start = time.perf_counter()
+    try:
+      resp = get_session().request(method, url, **kwargs)
+    except (requests.ConnectionError, requests.Timeout) as e:
+      _record_request(method, url, time.perf_counter() - start)
+      if attempt == max_retries:
+        raise
+      delay = _backoff_delay(attempt)
+      logger.info(f"{method} {url.split('?')[0]} failed ({e.__class__.__name__}), retrying in {delay:.1f}s ({attempt + 1}/{max_retries})")
+      _record_count(method, url, "retries")
+      _record_count(method, url, "retry_sleep_seconds", delay)
+      time.sleep(delay)
+      continue
+    # Streamed downloads count their bytes as they are written, see _resumable_download()
+    body = resp.request.body
+    _record_request(method, url, time.perf_counter() - start, resp.status_code, len(body) if body else 0, 0 if kwargs.get("stream") else len(resp.content))
+    if resp.status_code not in retry_statuses or attempt == max_retries:
+      if rate_limited and resp.status_code < 400:
+        _rate_limiter.succeeded()
+      return resp
+    delay = _backoff_delay(attempt, resp.headers.get("Retry-After"))
+    if resp.status_code == 429 and rate_limited:
+      _rate_limiter.throttled(delay)
+    logger.info(f"{method} {url.split('?')[0]} returned {resp.status_code}, retrying in {delay:.1f}s ({attempt + 1}/{max_retries})")
+    _record_count(method, url, "retries")
+    _record_count(method, url, "retry_sleep_seconds", delay)
+    resp.close()
+    time.sleep(delay)
+
+
+def _api_request(method, path, apikey, basic_auth=False, **kwargs):
+  """
+    Send an authenticated request to the portal API through the shared session. The key goes in an X-API-Key header,
+    or with basic_auth=True as the HTTP basic auth user name, which is how the paginated /api/genomes catalog has always been called.
+  """
+  headers = kwargs.pop("headers", {})
+  if basic_auth:
+    kwargs["auth"] = (apikey, "")
+  else:
+    headers["X-API-Key"] = apikey
+  return _send(method, _portal_url(path), not offline_settings["enabled"], headers=headers, **kwargs)
+
+
+def _signed_url_request(url, **kwargs):
+  """GET a pre-signed download URL. The API key is never forwarded to the storage host, and the portal rate limit does not apply"""
+  return _send("GET", url, False, **kwargs)
+
+
+## In-process response cache for metadata and search calls. Successful responses are kept for "ttl" seconds, keyed by method,
+## URL, parameters, body and API key, and the least recently used entry is dropped once "max_entries" is reached. Identical
+## requests made at the same time (ex. from download_genomes() threads) wait for the one already in flight instead of repeating it.
+response_cache_settings = {
+  "enabled": True,
+  "ttl": 300,
+  "max_entries": 1024,
+}
+
+
+class _CachedResponse:
+  """The parts of a requests.Response the endpoint wrappers read"""
+
+  def __init__(self, resp):
+    self.status_code = resp.status_code
+    self.headers = requests.structures.CaseInsensitiveDict(resp.headers)
+    self.text = resp.text
+
+  def json(self):
+    return _json_loads(self.text)
+
+
+class _ResponseCache:
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.entries = OrderedDict()
+    self.in_flight = {}
+    self.stats = Counter()
+
+  def get(self, key, fetch):
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is not None and entry[0] > time.monotonic():
+        self.entries.move_to_end(key)
+        self.stats["hits"] += 1
+        hit = True
+      else:
+        hit = False
+        if entry is not None:
+          del self.entries[key]
+          self.stats["expired"] += 1
+        future = self.in_flight.get(key)
+        owner = future is None
+        if owner:
+          future = self.in_flight[key] = Future()
+          self.stats["misses"] += 1
+        else:
+          self.stats["coalesced"] += 1
+    if hit:
+      _record_count(key[0], key[1], "cache_hits")
+      return entry[1]
+    _record_count(key[0], key[1], "cache_misses" if owner else "cache_coalesced")
+    if not owner:
+      return future.result()
+    try:
+      response = fetch()
+    except BaseException as e:
+      with self.lock:
+        del self.in_flight[key]
+      future.set_exception(e)
+      raise
+    with self.lock:
+      del self.in_flight[key]
+      if response.status_code == 200 and "API access" not in response.text:
+        self.entries[key] = (time.monotonic() + response_cache_settings["ttl"], response)
+        self.entries.move_to_end(key)
+        while len(self.entries) > response_cache_settings["max_entries"]:
+          self.entries.popitem(last=False)
+          self.stats["evictions"] += 1
+    future.set_result(response)
+    return response
+
+  def invalidate(self, prefix=None):
+    with self.lock:
+      keys = [key for key in self.entries if prefix is None or key[1].startswith(_portal_url(prefix))]
+      for key in keys:
+        del self.entries[key]
+    return len(keys)
+
+
+_response_cache = _ResponseCache()
+
+
+def _cached_api_request(method, path, apikey, **kwargs):
+  """_api_request() for read-only metadata and search calls, answered from the response cache when possible"""
+  if not response_cache_settings["enabled"] or not response_cache_settings["max_entries"]:
+    return _api_request(method, path, apikey, **kwargs)
+  key = (method, _portal_url(path), apikey, json.dumps(kwargs.get("params"), sort_keys=True), json.dumps(kwargs.get("json"), sort_keys=True))
+  return _response_cache.get(key, lambda: _CachedResponse(_api_request(method, path, apikey, **kwargs)))
+
+
+def configure_response_cache(**kwargs):
+  """
+    configure_response_cache() is a function used to configure the in-memory cache of metadata and search responses. \n
+
+    --------- USAGE ---------
+    Optional arguments:
+    \t enabled = <bool> \n \t\t Cache responses of download_metadata(), search_product(), search_products() and search_text() [(True) | False ]
+    \t ttl = <float> \n \t\t Seconds a response is reused for [(300)]
+    \t max_entries = <int> \n \t\t Number of responses to keep, the least recently used ones are dropped first [(1024)]
+  """
+  unknown = [k for k in kwargs if k not in response_cache_settings]
+  if unknown:
+    logger.warning(f"Unknown response cache setting(s): {', '.join(unknown)}. Choose from {', '.join(response_cache_settings)}")
+    return
+  response_cache_settings.update(kwargs)
+  if not response_cache_settings["enabled"]:
+    _response_cache.invalidate()
+
+
+def invalidate_response_cache(endpoint=None):
+  """Drop cached responses, all of them or those for an endpoint path prefix (ex. "/api/genomes/search"). Returns the number dropped"""
+  return _response_cache.invalidate(endpoint)
+
+
+def response_cache_stats():
+  """Hits, misses, coalesced (requests that waited for an identical one in flight), expired and evicted responses, size and hit rate"""
+  with _response_cache.lock:
+    stats = {name: _response_cache.stats[name] for name in ("hits", "misses", "coalesced", "expired", "evictions")}
+    stats["size"] = len(_response_cache.entries)
+  requests_made = stats["hits"] + stats["misses"] + stats["coalesced"]
+  stats["hit_rate"] = (stats["hits"] + stats["coalesced"]) / requests_made if requests_made else 0.0
+  return stats
+
 def get_global_metadata():
   try:
     if global_genome_metadata:
@@ -43,12 +604,19 @@ def get_global_metadata():
       load_all_metadata()
   except NameError:
     load_all_metadata()
+  try:
+    return global_genome_metadata
+  except NameError:
+    return None
 
 def get_global_apikey():
   global global_api_key
   try:
     return global_api_key
   except NameError: 
+    if offline_settings["enabled"]:
+      # The snapshot answers every call without looking at the key, so headless nodes need neither one nor a prompt
+      return offline_api_key
     set_global_api()
     return global_api_key
 
@@ -90,7 +658,8 @@ def set_global_api(**kwargs): #! Intended to
 def load_all_metadata():
   """
     load_all_metadata() is a helper function used to load the JSON metadata for all available genomes as the variable "global_genome_metadata". 
-    This function will be called automatically in deep_search() and download_all_genomes(), but can be ran independently.\n    
+    This function will be called automatically in deep_search() and download_all_genomes(), but can be ran independently.
+    A local metadata snapshot (see configure_snapshot()) is used when it is recent enough, otherwise the catalog is refreshed from the portal.\n    
   """
   global global_genome_metadata
   ## Check to see if set as enviornment variable
@@ -101,15 +670,37 @@ def load_all_metadata():
       logger.info(f"If this is an error or you want to requery the genomes, please run download_all_genomes()")
       return
     else:
-      global_genome_metadata=download_all_genomes()
+      global_genome_metadata=load_metadata_snapshot(max_age=snapshot_settings["max_age"]) or download_all_genomes()
   except NameError:
-    global_genome_metadata=download_all_genomes()
+    global_genome_metadata=load_metadata_snapshot(max_age=snapshot_settings["max_age"]) or download_all_genomes()
     if global_genome_metadata:
       logger.info(f"All genomes have been stored under the variable 'global_genome_metadata' ")
       logger.info(f"You may need to run `global_genome_metadata=get_global_metadata()` to access this list")
     return
 
 
+## Hash maps from a field of the catalog (ex. "id" or "product_id") to its genome, rebuilt when the genome list is replaced or resized
+_catalog_maps = {}
+
+
+def _normalize_product_id(product_id):
+  """ATCC catalog numbers as typed in spreadsheets: "ATCC 35638", " baa-2889 " or 35638"""
+  product_id = str(product_id).strip().upper()
+  product_id = re.sub(r"^ATCC\s*(®\s*)?", "", product_id)
+  return product_id
+
+
+def _catalog_map(genome_list, field):
+  source, size, mapping = _catalog_maps.get(field, (None, 0, None))
+  if source is not genome_list or size != len(genome_list):
+    normalize = _normalize_product_id if field == "product_id" else (lambda value: value)
+    mapping = {}
+    for genome in genome_list:
+      mapping.setdefault(normalize(genome.get(field)), genome)
+    _catalog_maps[field] = (genome_list, len(genome_list), mapping)
+  return mapping
+
+
 def flatten_dict(d):
     def items():
         for key, value in d.items():
@@ -121,14 +712,95 @@ def flatten_dict(d):
     return dict(items())
 
 
-def tabulate(api_out):
+## Every field path read by format_qc(). tabulate() only flattens these, so large unused subtrees are never copied
+format_qc_fields = [
+  'id', 'product_id', 'taxon_name', 'taxon_id', 'collection_name', 'created_at', 'notes',
+  'primary_assembly.id',
+  'primary_assembly.attributes.qc_statistics.assembly_statistics.filtered.total_contigs',
+  'primary_assembly.attributes.qc_statistics.assembly_statistics.filtered.total_contig_length',
+  'primary_assembly.attributes.qc_statistics.assembly_statistics.filtered.total_circular_contigs',
+  'primary_assembly.attributes.qc_statistics.assembly_statistics.filtered.contig_statistics',
+  'primary_assembly.attributes.qc_statistics.checkm_results.completeness',
+  'primary_assembly.attributes.qc_statistics.checkm_results.contamination',
+  'primary_assembly.attributes.qc_statistics.virify_results.completeness',
+  'primary_assembly.attributes.qc_statistics.sequencing_statistics.illumina.depth.mean',
+  'primary_assembly.attributes.qc_statistics.sequencing_statistics.ont.depth.mean',
+  'attributes.atcc_metadata.preferred_taxonomy_name',
+  'attributes.atcc_metadata.notes',
+  'attributes.atcc_metadata.amr_intermediate',
+  'attributes.atcc_metadata.amr_resistant',
+  'attributes.atcc_metadata.amr_susceptible',
+  'attributes.atcc_metadata.antibiotic_resistance',
+  'attributes.atcc_metadata.antigenic_prop',
+  'attributes.atcc_metadata.drug_repository',
+  'attributes.atcc_metadata.genotype',
+  'attributes.atcc_metadata.isolation_new_web',
+  'attributes.atcc_metadata.bsl',
+  'attributes.atcc_metadata.qc_statistics.assembly_quality_control.genome_completeness',
+  'attributes.atcc_metadata.qc_statistics.assembly_quality_control.genome_contamination',
+  'attributes.atcc_metadata.qc_statistics.assembly_quality_control.illumina_depth_of_coverage',
+  'attributes.atcc_metadata.qc_statistics.assembly_quality_control.ont_depth_of_coverage',
+  'attributes.atcc_metadata.other_metadata.catalog_details.ATCC_catalog_number',
+  'attributes.atcc_metadata.other_metadata.catalog_details.ATCC_lot_number',
+  'attributes.atcc_metadata.other_metadata.genome_stats.filtered_contig_count',
+  'attributes.atcc_metadata.other_metadata.genome_stats.filtered_contig_length',
+  'attributes.atcc_metadata.other_metadata.genome_stats.number_of_n_bases',
+  'attributes.atcc_metadata.other_metadata.illumina_metadata',
+  'attributes.atcc_metadata.other_metadata.ont_metadata',
+  'attributes.atcc_metadata.other_metadata.genome_provider',
+]
+
+
+def _field_tree(paths):
+  """Turn dotted field paths into a nested dict. An empty dict marks a path to keep whole"""
+  tree = {}
+  for path in paths:
+    node = tree
+    parts = path.split(".")
+    for part in parts[:-1]:
+      if node.get(part) == {}:
+        break  # a shorter path already keeps this whole subtree
+      node = node.setdefault(part, {})
+    else:
+      node[parts[-1]] = {}
+  return tree
+
+
+def flatten_fields(d, tree, prefix=""):
+  """flatten_dict() restricted to a _field_tree(). Subtrees that are not requested are never walked"""
+  flat = {}
+  for key, subtree in tree.items():
+    if key not in d:
+      continue
+    value = d[key]
+    if not subtree:
+      if isinstance(value, dict):
+        for subkey, subvalue in flatten_dict(value).items():
+          flat[prefix + key + "." + subkey] = subvalue
+      else:
+        flat[prefix + key] = value
+    elif isinstance(value, dict):
+      flat.update(flatten_fields(value, subtree, prefix + key + "."))
+  return flat
+
+
+@_timed("tabulate")
+def tabulate(api_out, extra_fields=None):
   """
     tabulate() is a helper function used to convert a list of JSON-formatted metadata into a dataframe.
     This function then calls on "format_qc()" to pull relevant metadata fields as dedicated columns. 
+    Only the fields format_qc() reads are flattened. Any other dotted field paths (or whole subtrees, ex. "primary_assembly.attributes.qc_statistics.checkm_results")
+    can be added to the table with extra_fields=[...], one column per leaf field.
   """
-  api_out=list(map(flatten_dict, api_out))
-  df=pd.DataFrame.from_records(api_out)
+  extra_fields = list(extra_fields or [])
+  tree = _field_tree(format_qc_fields + extra_fields)
+  start = time.perf_counter()
+  df=pd.DataFrame.from_records([flatten_fields(genome, tree) for genome in api_out])
+  _record_timer("tabulate.flatten", time.perf_counter() - start)
   new_df=format_qc(df)
+  if extra_fields:
+    extra_columns = [c for c in df.columns if c not in new_df.columns and any(c == f or c.startswith(f + ".") for f in extra_fields)]
+    new_df = pd.concat([new_df, df[extra_columns]], axis=1)
   return new_df
 
 
@@ -137,14 +809,15 @@ def json_search(nested_dict, term, fuzz_value, fuzz_on): #! Intended to iterativ
     if fuzz_on:
       try:
         for key, value in d.items():
-          if fuzz.ratio(value,term) >= fuzz_value or fuzz.ratio(key,term) >= fuzz_value:
+          # fuzz.ratio() only handles strings, so numbers and lists are compared as text
+          if (value is not None and fuzz.ratio(str(value),term) >= fuzz_value) or fuzz.ratio(str(key),term) >= fuzz_value:
             return True
           elif isinstance(value, dict):
             # Recursively search nested dictionaries
             if recursive_search(value, term, fuzz_value, fuzz_on):
               return True
         return False
-      except:
+      except AttributeError:
         return False  
     else:
       try:
@@ -201,13 +874,7 @@ def search_product(**kwargs):
   kwarg_message="Whoops, make sure you are providing all the correct arguments and choices!"
 
   try:
-    cmd = f"curl --insecure --header \'Content-Type: Application/json\' --header \"X-API-Key: {apikey}\""
-    cmd += " -d \'{" + "\"product_id\"" + ": \"" + product_id + "\"}\'" 
-    cmd += f" https://genomes.atcc.org/api/genomes/search"
-    cmd += " 2> /dev/null"
-    result_stage = os.popen(cmd)
-    result = result_stage.read()
-    result_stage.close()
+    result = _cached_api_request("POST", "/api/genomes/search", apikey, json={"product_id": product_id}).text
     if "API access" in result:
       logger.critical(membership_message)
       return
@@ -236,6 +903,81 @@ def search_product(**kwargs):
 
 
 
+def _search_one_product(apikey, product_id):
+  """Genome metadata for one catalog number from the portal, None when there is no match, or "API access" without membership"""
+  result = _cached_api_request("POST", "/api/genomes/search", apikey, json={"product_id": product_id}).text
+  if "API access" in result:
+    return "API access"
+  data = json.loads(result)
+  return data[0] if data else None
+
+
+def search_products(**kwargs):
+  if 'product_id' in kwargs:
+    product_ids = kwargs['product_id']
+  else:
+    print("""
+      search_products() is a batch version of search_product() for mapping many ATCC catalog numbers to genomes at once.
+      Duplicates are resolved once, catalog numbers found in the local catalog (global_genome_metadata, or the metadata snapshot) are answered
+      without a request, and only the rest are searched on the portal, concurrently. \n
+
+      --------- USAGE ---------
+      Required arguments:
+      \t product_id = [list] \n \t\t ATCC product IDs (ex. ["BAA-2889", "35638", "ATCC 700822"])\n
+
+      Optional arguments:
+      \t output = <str> \n \t\t The format of each result [(id) | json]
+      \t max_workers = <int> \n \t\t Number of portal searches to run at the same time for IDs missing from the local catalog [(8)]
+      \t api_key = <str> \n \t\t Your Genome Portal APIKey [default looks for global_api_key] \n
+
+      EXAMPLES:
+      \t search_products(product_id=['35638', 'BAA-2889']) returns {"35638": "ATCC 35638:<genomeid>", "BAA-2889": ...}, None for IDs without a genome
+      \t search_products(product_id=spreadsheet['catalog_number'], output='json') returns the JSON metadata for each product ID
+    """)
+    return
+  membership_message="API access to the ATCC Genome Portal requires a supporting membership. Please visit https://genomes.atcc.org/plans to subscribe."
+  kwarg_message="Whoops, make sure you are providing all the correct arguments and choices!"
+  if "api_key" in kwargs:
+    apikey = kwargs['api_key']
+  else:
+    try:
+      apikey = global_api_key
+    except NameError:
+      apikey = get_global_apikey()
+  output = kwargs['output'].lower() if "output" in kwargs else 'id'
+  max_workers = int(kwargs['max_workers']) if 'max_workers' in kwargs else 8
+  if output not in ['id', 'json'] or max_workers < 1:
+    logger.warning(kwarg_message)
+    return
+  if isinstance(product_ids, (str, int)):
+    product_ids = [product_ids]
+
+  # Inputs that only differ in spacing, case or an "ATCC" prefix are looked up once
+  keys = {product_id: _normalize_product_id(product_id) for product_id in dict.fromkeys(str(p) for p in product_ids)}
+  genome_list = globals().get("global_genome_metadata") or load_metadata_snapshot(max_age=snapshot_settings["max_age"])
+  by_product = _catalog_map(genome_list, "product_id") if genome_list else {}
+  found = {key: by_product[key] for key in set(keys.values()) if key in by_product}
+  misses = [key for key in dict.fromkeys(keys.values()) if key not in found]
+  if misses:
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+      for key, genome in zip(misses, executor.map(lambda key: _search_one_product(apikey, key), misses)):
+        if genome == "API access":
+          logger.critical(membership_message)
+          return
+        found[key] = genome
+  resolved = {}
+  for product_id, key in keys.items():
+    genome = found.get(key)
+    if genome is None or output == "json":
+      resolved[product_id] = genome
+    else:
+      resolved[product_id] = f"ATCC {genome['product_id']}:{genome['id']}"
+  matched = sum(genome is not None for genome in resolved.values())
+  local = len(set(keys.values())) - len(misses)
+  logger.info(f"Resolved {matched:,} of {len(resolved):,} product IDs ({local:,} from the local catalog, {len(misses):,} searched on the portal)")
+  return resolved
+
+
 def search_text(**kwargs):
   if "api_key" in kwargs:
     apikey = kwargs['api_key']
@@ -258,6 +1000,7 @@ def search_text(**kwargs):
       
       Optional arguments:
       \t output = <str> \n \t\t The API response format "output" [(id) | json | table]
+      \t prefetch = <int> \n \t\t Number of result pages to request at the same time, when the portal reports the number of pages [(4) | 0 to request one page at a time]
       \t api_key = <str> \n \t\t Your Genome Portal APIKey [Globally set "global_api_key" or entered "api_key"] \n
       
       EXAMPLES:
@@ -275,88 +1018,118 @@ def search_text(**kwargs):
   
   kwarg_message="Whoops, make sure you are providing all the correct arguments and choices!"
 
+  if output not in ['id', 'json', 'table']:
+    logger.warning(kwarg_message)
+    return
+  prefetch = int(kwargs['prefetch']) if 'prefetch' in kwargs else 4
   try:
-    page=1
     all_data=[]
-    empty_result=False
-    while empty_result == False:
-      cmd = f"curl --insecure --header \'Content-Type: Application/json\' --header \"X-API-Key: {apikey}\""
-      cmd += " -d \'{" + "\"text\"" + ": \"" + text + "\"}\'"
-      cmd += f" https://genomes.atcc.org/api/genomes/search?page={page}"
-      cmd += " 2> /dev/null"
-      result_stage = os.popen(cmd)
-      result = result_stage.read()
-      result_stage.close()
-      if "API access" in result:
+    for rows in _iter_search_pages(apikey, text, prefetch):
+      if rows is None:
         logger.critical(membership_message)
         return
-      if output == "id":
-        data = json.loads(result)
-        if data == []:
-          if all_data == []:
-            raise emptyResultsError(message)
-          else:
-            return [f"ATCC {e['product_id']}:{e['id']}" for e in all_data]
-        else:
-          all_data += data
-          page+=1
-      elif output == "table" or output == "json":
-        data = json.loads(result)
-        if data == []:
-          if all_data == []:
-            raise emptyResultsError(message)
-          else:
-            if output == "table":
-              all_data = tabulate(all_data)
-            return all_data
-        else:
-          all_data += data
-          page+=1
-      else:
-        logger.warning(kwarg_message)
-        return
+      all_data += rows
+    if all_data == []:
+      raise emptyResultsError(message)
+    if output == "id":
+      return [f"ATCC {e['product_id']}:{e['id']}" for e in all_data]
+    if output == "table":
+      all_data = tabulate(all_data)
+    return all_data
   except emptyResultsError as ere:
     logger.warning(ere)
 
 
+## Paging for /api/genomes/search. The last page is recognized from the X-Pagination header when there is one, or from being
+## shorter than a full page, so no empty page has to be requested to find the end. When the header gives the number of pages, up to
+## "prefetch" further pages are requested while the current one is being consumed, and pages are still delivered in order. Without
+## it, pages are requested one at a time, so that no request is ever made for a page past the end.
+_search_page_size = None
 
-def deep_search(**kwargs):
+
+def _search_page(apikey, text, page):
+  """One page of a text search as (pagination_info, rows). Rows are None without API access"""
+  resp = _cached_api_request("POST", "/api/genomes/search", apikey, json={"text": text}, params={"page": page})
+  if "API access" in resp.text:
+    return None, None
+  pagination_info = json.loads(resp.headers["X-Pagination"]) if "X-Pagination" in resp.headers else {}
+  return pagination_info, _json_loads(resp.text)
+
+
+def _is_last_search_page(pagination_info, rows, page, page_size):
+  if not rows:
+    return True
+  if "next_page" in pagination_info:
+    return pagination_info["next_page"] is None
+  total_pages = _total_pages(pagination_info, len(rows)) if pagination_info else None
+  if total_pages:
+    return page >= total_pages
+  return page_size is not None and len(rows) < page_size
+
+
+def _iter_search_pages(apikey, text, prefetch):
+  """Yield the rows of each search page in order, or None (and stop) without API access"""
+  global _search_page_size
+  pagination_info, rows = _search_page(apikey, text, 1)
+  yield rows
+  if rows is None or _is_last_search_page(pagination_info, rows, 1, _search_page_size):
+    return
+  page_size = len(rows)
+  total_pages = _total_pages(pagination_info, page_size) if pagination_info else None
+  if not total_pages or prefetch < 1:
+    for page in count(2):
+      pagination_info, rows = _search_page(apikey, text, page)
+      if rows and page == 2:
+        # Page 1 was a full page, remember its size so single-page searches stop after one request
+        _search_page_size = max(_search_page_size or 0, page_size)
+      yield rows
+      if rows is None or _is_last_search_page(pagination_info, rows, page, page_size):
+        return
+  pages = iter(range(2, total_pages + 1))
+  executor = ThreadPoolExecutor(max_workers=prefetch)
+  try:
+    in_flight = deque((page, executor.submit(_search_page, apikey, text, page)) for page in islice(pages, prefetch))
+    while in_flight:
+      page, future = in_flight.popleft()
+      pagination_info, rows = future.result()
+      if rows and page == 2:
+        # Page 1 was a full page, remember its size so single-page searches stop after one request
+        _search_page_size = max(_search_page_size or 0, page_size)
+      yield rows
+      if rows is None or _is_last_search_page(pagination_info, rows, page, page_size):
+        return
+      page = next(pages, None)
+      if page is not None:
+        in_flight.append((page, executor.submit(_search_page, apikey, text, page)))
+  finally:
+    # Pages not started yet are cancelled, and requests already sent finish before the generator returns
+    executor.shutdown(wait=True, cancel_futures=True)
+
+
+def iter_search_text(**kwargs):
   if 'text' in kwargs:
     text = kwargs['text']
   else:
     print("""
-      deep_search() is intended for deep searching of ATCC JSON metadata behind each genome.
-      THIS FUNCTION SUPPORTS EXACT KEY|VALUE|STRING MATCHING, WITH "text" METHOD CAPTURE SUBSTRINGS.
-      There is currently no similar function on the ATCC Genome Portal.
-      This function will search through the JSON metadata of all available genomes for matching strings or values. \n
+      iter_search_text() is a streaming version of search_text(). Genomes are yielded as soon as each page of results arrives,
+      while the next pages are already being requested. \n
 
       --------- USAGE ---------
       Required arguments:
-      \t text = <str> \n \t\t any text field caputured within the JSON of the portal.
-      -- a list of genomes (Globally set variable "global_genome_metadata")
-      
+      \t text = <str> \n \t\t A free text field to search by (ex. "Salmonella enterica")\n
+
       Optional arguments:
-      \t fuzz_on = <str> \n \t\t If provided with a value, enables fuzzy matching  [(75) | value 0-100]
-      \t output = <str> \n \t\t The API response format "output" [(id) | json | table]
-      \t mode = <str> \n \t\t Choice to search based on a dictionary structure or just raw text [(text) | json]
-      \t api_key = <str> \n \t\t Your Genome Portal APIKey [Globally set "global_api_key" or entered "api_key"]
-      \t STORE global_genome_metadata \n \t\t A list of genomes can be set as "global_genome_metadata" variable. Not needed as an argument (Globally set variable "global_genome_metadata") \n
-      
+      \t output = <str> \n \t\t What to yield for each genome [(json) | id]
+      \t prefetch = <int> \n \t\t Number of pages to request ahead of the one being read, when the portal reports the number of pages [(4) | 0 to request one page at a time]
+      \t api_key = <str> \n \t\t Your Genome Portal APIKey [Globally set "global_api_key" or entered "api_key"] \n
+
       EXAMPLES:
-      \t deep_search(text="PGAP") will return a list of genomeIDs that had "PGAP" somewhere in the JSON
-      \t deep_search(text="Lake", output="id") return resulting assembly IDs that contain "Lake" in the metadata
-      \t deep_search(api_key="<apikey>",text="Lake",output="table") Same as above, but with a manually entered API Key and output as an informational table.
-      \t deep_search(api_key="<apikey>",text="Lake",output="table",fuzz_on='75') Same as above, but now fuzzy match to '75'
+      \t for genome in iter_search_text(text='coli'): ... handle each genome's JSON metadata as it arrives
+      \t next(iter_search_text(text='coli', output='id')) the first matching "ATCC <product>:<genomeid>" after a single request
     """)
-    return
-
-  message="Your search returned zero results. This function uses exact string matching on the JSON metadata for each genome. \
-  Check your spelling and try again. If you continue to have issues, try downloading an assembly metadata file to ensure the search term is present."
-  
-  empty_genomes="Your global_genome_metadata variable is empty! If this is an error, try resetting your API key and retry!"
-
+    return iter(())
+  membership_message="API access to the ATCC Genome Portal requires a supporting membership. Please visit https://genomes.atcc.org/plans to subscribe."
   kwarg_message="Whoops, make sure you are providing all the correct arguments and choices!"
-
   if "api_key" in kwargs:
     apikey = kwargs['api_key']
   else:
@@ -364,51 +1137,1502 @@ def deep_search(**kwargs):
       apikey = global_api_key
     except NameError:
       apikey = get_global_apikey()
-  # Method to search. Defaults to JSON format of typical KEY:VALUE
-  mode = kwargs['mode'].lower() if "mode" in kwargs else "text"
-  fuzz_on = True if 'fuzz_on' in kwargs else False
-  if fuzz_on:
-    mode='json'
-  fuzzy_value = int(kwargs['fuzz_on']) if 'fuzz_on' in kwargs else 75
-  # Store ID only as true
-  output = kwargs['output'] if 'output' in kwargs else "id"
-  # If global genome list is empty, repull all JSONs
-  if output not in ['id','json','table'] or mode not in  ['text','str']:
+  output = kwargs['output'].lower() if "output" in kwargs else "json"
+  prefetch = int(kwargs['prefetch']) if 'prefetch' in kwargs else 4
+  if output not in ['id', 'json']:
     logger.warning(kwarg_message)
-    return
+    return iter(())
 
-  genome_list = get_global_metadata()
-  if not genome_list:
-    logger.warning(empty_genomes)
-    return
-  try:  
-    items_to_return = []
-    for item in genome_list:
-      if mode == "json":
-        gotcha=json_search(item, text, fuzzy_value, fuzz_on)
-      else:
-        gotcha=text in str(item)
-      if gotcha:
-        if output != "id":
-          items_to_return.append(item)
-        else:
-          items_to_return.append(f"ATCC {item['product_id']}:{item['id']}")
-    if items_to_return:
-      if output == "table":
-        items_to_return = tabulate(items_to_return)
-      return items_to_return
-    else:
-      emptyResultsError(message)
-  except emptyResultsError as ere:
-    logger.warning(ere)
+  def genomes():
+    for rows in _iter_search_pages(apikey, text, prefetch):
+      if rows is None:
+        logger.critical(membership_message)
+        return
+      for genome in rows:
+        yield f"ATCC {genome['product_id']}:{genome['id']}" if output == "id" else genome
+  return genomes()
 
 
 
-def download_assembly(**kwargs):
-  if "id" in kwargs:
-    id = kwargs['id']
-  else:
-    print("""
+## Inverted index for deep_search(mode="text"). Every genome is serialized once, its word tokens are mapped to
+## the genomes that contain them, and a query only verifies "text in str(genome)" on genomes holding all of its tokens.
+_token_pattern = re.compile(r"\w+")
+_deep_search_index = None
+_deep_search_index_lock = threading.Lock()
+
+
+class _DeepSearchIndex:
+  def __init__(self, genome_list):
+    self.source = genome_list
+    self.count = len(genome_list)
+    self.documents = [str(item) for item in genome_list]
+    postings = {}
+    for position, document in enumerate(self.documents):
+      for token in set(_token_pattern.findall(document)):
+        postings.setdefault(token, []).append(position)
+    self.tokens = list(postings)
+    self.postings = [postings[token] for token in self.tokens]
+    # All tokens joined into one string, so substring lookups over the vocabulary run in C
+    self.vocabulary = "\n".join(self.tokens)
+    self.offsets = []
+    offset = 0
+    for token in self.tokens:
+      self.offsets.append(offset)
+      offset += len(token) + 1
+    self._token_matches = {}
+    self._leaf_cache = {}
+
+  def is_current(self, genome_list):
+    return genome_list is self.source and len(genome_list) == self.count
+
+  def _documents_containing(self, part):
+    """Positions of the genomes with a token that contains part"""
+    if part in self._token_matches:
+      return self._token_matches[part]
+    documents = set()
+    start = self.vocabulary.find(part)
+    while start != -1:
+      token = bisect_right(self.offsets, start) - 1
+      documents.update(self.postings[token])
+      next_token = self.offsets[token + 1] if token + 1 < len(self.offsets) else len(self.vocabulary)
+      start = self.vocabulary.find(part, next_token)
+    if len(self._token_matches) > 4096:
+      self._token_matches.clear()
+    self._token_matches[part] = documents
+    return documents
+
+  def search(self, text):
+    """Positions of the genomes whose str() contains text, in catalog order"""
+    parts = set(_token_pattern.findall(text))
+    if not parts:
+      candidates = range(self.count)
+    else:
+      candidates = None
+      for part in sorted(parts, key=len, reverse=True):
+        documents = self._documents_containing(part)
+        candidates = set(documents) if candidates is None else candidates & documents
+        if not candidates:
+          return []
+      candidates = sorted(candidates)
+    return [position for position in candidates if text in self.documents[position]]
+
+  def field_paths(self, position, text):
+    """Dotted field paths of a genome whose "'key': value" text contains the search text"""
+    if position not in self._leaf_cache:
+      if len(self._leaf_cache) > 4096:
+        self._leaf_cache.clear()
+      self._leaf_cache[position] = list(_iter_leaves(self.source[position]))
+    return [path for path, leaf in self._leaf_cache[position] if text in leaf]
+
+
+def _iter_leaves(d, prefix=""):
+  for key, value in d.items():
+    path = f"{prefix}.{key}" if prefix else str(key)
+    if isinstance(value, dict):
+      yield path, repr(key)
+      yield from _iter_leaves(value, path)
+    else:
+      yield path, f"{key!r}: {value!r}"
+
+
+def _get_deep_search_index(genome_list):
+  global _deep_search_index
+  with _deep_search_index_lock:
+    if _deep_search_index is None or not _deep_search_index.is_current(genome_list):
+      _deep_search_index = _DeepSearchIndex(genome_list)
+    return _deep_search_index
+
+
+## Fuzzy matching engine for deep_search(fuzz_on=...) and fuzzy_search(). Every key and value in the catalog is
+## extracted once into a de-duplicated corpus sorted by length. A ratio of at least c is only possible when the
+## lengths are within c/(2-c) of each other, so each query is only scored against that slice of the corpus.
+_fuzzy_index = None
+_fuzzy_batch_size = 64
+
+
+def _iter_fuzzy_strings(d):
+  for key, value in d.items():
+    yield str(key)
+    if isinstance(value, dict):
+      yield from _iter_fuzzy_strings(value)
+    elif value is not None:
+      value = str(value)
+      if value:
+        yield value
+
+
+def _ratio_score(similarity, length):
+  """The integer fuzz.ratio() gives for a rapidfuzz ratio() between strings of this combined length. fuzz.ratio() rounds
+  100 * 2.0*matches/length half to even, so the score is rebuilt from the match count rather than rounded from the float"""
+  if not length:
+    return 0
+  matches = length - round(length * (100 - similarity) / 100)
+  return int(round(100 * (matches / length)))
+
+
+class _FuzzyIndex:
+  def __init__(self, genome_list):
+    self.source = genome_list
+    self.count = len(genome_list)
+    postings = {}
+    for position, item in enumerate(genome_list):
+      for string in _iter_fuzzy_strings(item):
+        postings.setdefault(string, set()).add(position)
+    self.strings = sorted(postings, key=len)
+    self.lengths = [len(string) for string in self.strings]
+    self.postings = [postings[string] for string in self.strings]
+
+  def is_current(self, genome_list):
+    return genome_list is self.source and len(genome_list) == self.count
+
+  def _window(self, length, cutoff):
+    """Slice of the corpus whose lengths can reach the cutoff ratio against a query of this length"""
+    c = (cutoff - 0.5) / 100  # scores are rounded, as fuzz.ratio() does
+    if c <= 0:
+      return 0, len(self.strings)
+    return bisect_left(self.lengths, math.ceil(length * c / (2 - c))), bisect_right(self.lengths, math.floor(length * (2 - c) / c))
+
+  def _score(self, queries, cutoff):
+    """Yield (query number, corpus position, score) for every corpus string scoring at least cutoff"""
+    for start in range(0, len(queries), _fuzzy_batch_size):
+      batch = queries[start:start + _fuzzy_batch_size]
+      windows = [self._window(len(query), cutoff) for query in batch]
+      low, high = min(w[0] for w in windows), max(w[1] for w in windows)
+      if high <= low:
+        continue
+      if rapid_process is not None:
+        scores = rapid_process.cdist(batch, self.strings[low:high], scorer=rapid_fuzz.ratio, score_cutoff=max(cutoff - 0.5, 0), workers=-1)
+        for number, row in enumerate(scores):
+          for offset in np.flatnonzero(row >= cutoff - 0.5):
+            score = _ratio_score(row[offset], len(batch[number]) + self.lengths[low + offset])
+            if score >= cutoff:
+              yield start + number, low + int(offset), score
+      else:
+        for number, (query, (query_low, query_high)) in enumerate(zip(batch, windows)):
+          for position in range(query_low, query_high):
+            score = fuzz.ratio(query, self.strings[position])
+            if score >= cutoff:
+              yield start + number, position, score
+
+  def match(self, queries, cutoff):
+    """For each query, {genome position: [(score, matched string), ...]} of every genome scoring at least cutoff"""
+    results = [{} for _ in queries]
+    for number, position, score in self._score(queries, cutoff):
+      string = self.strings[position]
+      for genome in self.postings[position]:
+        results[number].setdefault(genome, []).append((score, string))
+    for result in results:
+      for matches in result.values():
+        matches.sort(reverse=True)
+    return results
+
+
+def _get_fuzzy_index(genome_list):
+  global _fuzzy_index
+  with _deep_search_index_lock:
+    if _fuzzy_index is None or not _fuzzy_index.is_current(genome_list):
+      _fuzzy_index = _FuzzyIndex(genome_list)
+    return _fuzzy_index
+
+
+def _fuzzy_field_paths(d, strings, prefix=""):
+  paths = []
+  for key, value in d.items():
+    path = f"{prefix}.{key}" if prefix else str(key)
+    if str(key) in strings or (not isinstance(value, dict) and value is not None and str(value) in strings):
+      paths.append(path)
+    if isinstance(value, dict):
+      paths += _fuzzy_field_paths(value, strings, path)
+  return paths
+
+
+def invalidate_search_index():
+  """Drop the deep_search(), query_genomes() and catalog lookup indexes. They are rebuilt automatically when "global_genome_metadata" is replaced or resized, call this after editing genomes in place"""
+  global _deep_search_index, _fuzzy_index, _genome_table
+  with _deep_search_index_lock:
+    _deep_search_index = None
+    _fuzzy_index = None
+    _genome_table = None
+    _catalog_maps.clear()
+
+
+def fuzzy_search(**kwargs):
+  if 'text' in kwargs:
+    text = kwargs['text']
+  else:
+    print("""
+      fuzzy_search() is intended for ranked fuzzy matching of one or many terms against the JSON metadata of every genome.
+      Every key and value is scored with fuzz.ratio(), and each genome is reported with its best matching string and score. \n
+
+      --------- USAGE ---------
+      Required arguments:
+      \t text = <str> | [list] \n \t\t A term, or a list of terms scored together in one batch \n
+
+      Optional arguments:
+      \t fuzz_on = <int> \n \t\t Minimum fuzzy ratio to report  [(75) | value 0-100]
+      \t limit = <int> \n \t\t Maximum number of genomes to report per term [(all)]
+
+      EXAMPLES:
+      \t fuzzy_search(text="yursinia") returns [("ATCC <product>:<genomeid>", "Yersinia ...", 82), ...] best matches first
+      \t fuzzy_search(text=["yursinia", "salmonela"], limit=5) returns the top 5 genomes for each term as a dictionary
+    """)
+    return
+  empty_genomes="Your global_genome_metadata variable is empty! If this is an error, try resetting your API key and retry!"
+  fuzzy_value = int(kwargs['fuzz_on']) if 'fuzz_on' in kwargs else 75
+  limit = int(kwargs['limit']) if 'limit' in kwargs else None
+  queries = [text] if isinstance(text, str) else list(text)
+
+  genome_list = get_global_metadata()
+  if not genome_list:
+    logger.warning(empty_genomes)
+    return
+  matches = _get_fuzzy_index(genome_list).match(queries, fuzzy_value)
+  ranked = {}
+  for query, result in zip(queries, matches):
+    hits = sorted(result.items(), key=lambda hit: (-hit[1][0][0], hit[0]))[:limit]
+    ranked[query] = [(f"ATCC {genome_list[position]['product_id']}:{genome_list[position]['id']}", best[0][1], best[0][0]) for position, best in hits]
+  return ranked[text] if isinstance(text, str) else ranked
+
+
+@_timed("deep_search")
+def deep_search(**kwargs):
+  if 'text' in kwargs:
+    text = kwargs['text']
+  else:
+    print("""
+      deep_search() is intended for deep searching of ATCC JSON metadata behind each genome.
+      THIS FUNCTION SUPPORTS EXACT KEY|VALUE|STRING MATCHING, WITH "text" METHOD CAPTURE SUBSTRINGS.
+      There is currently no similar function on the ATCC Genome Portal.
+      This function will search through the JSON metadata of all available genomes for matching strings or values. \n
+
+      --------- USAGE ---------
+      Required arguments:
+      \t text = <str> \n \t\t any text field caputured within the JSON of the portal.
+      -- a list of genomes (Globally set variable "global_genome_metadata")
+      
+      Optional arguments:
+      \t fuzz_on = <str> \n \t\t If provided with a value, enables fuzzy matching  [(75) | value 0-100]
+      \t output = <str> \n \t\t The API response format "output" [(id) | json | table | fields]
+      \t mode = <str> \n \t\t Choice to search based on a dictionary structure or just raw text [(text) | json]
+      \t api_key = <str> \n \t\t Your Genome Portal APIKey [Globally set "global_api_key" or entered "api_key"]
+      \t STORE global_genome_metadata \n \t\t A list of genomes can be set as "global_genome_metadata" variable. Not needed as an argument (Globally set variable "global_genome_metadata") \n
+      
+      EXAMPLES:
+      \t deep_search(text="PGAP") will return a list of genomeIDs that had "PGAP" somewhere in the JSON
+      \t deep_search(text="PGAP", output="fields") return each matching genomeID with the metadata fields that contain "PGAP"
+      \t deep_search(text="Lake", output="id") return resulting assembly IDs that contain "Lake" in the metadata
+      \t deep_search(api_key="<apikey>",text="Lake",output="table") Same as above, but with a manually entered API Key and output as an informational table.
+      \t deep_search(api_key="<apikey>",text="Lake",output="table",fuzz_on='75') Same as above, but now fuzzy match to '75'
+    """)
+    return
+
+  message="Your search returned zero results. This function uses exact string matching on the JSON metadata for each genome. \
+  Check your spelling and try again. If you continue to have issues, try downloading an assembly metadata file to ensure the search term is present."
+  
+  empty_genomes="Your global_genome_metadata variable is empty! If this is an error, try resetting your API key and retry!"
+
+  kwarg_message="Whoops, make sure you are providing all the correct arguments and choices!"
+
+  if "api_key" in kwargs:
+    apikey = kwargs['api_key']
+  else:
+    try:
+      apikey = global_api_key
+    except NameError:
+      apikey = get_global_apikey()
+  # Method to search. Defaults to JSON format of typical KEY:VALUE
+  mode = kwargs['mode'].lower() if "mode" in kwargs else "text"
+  fuzz_on = True if 'fuzz_on' in kwargs else False
+  if fuzz_on:
+    mode='json'
+  fuzzy_value = int(kwargs['fuzz_on']) if 'fuzz_on' in kwargs else 75
+  # Store ID only as true
+  output = kwargs['output'] if 'output' in kwargs else "id"
+  # If global genome list is empty, repull all JSONs
+  if output not in ['id','json','table','fields'] or mode not in  ['text','str','json']:
+    logger.warning(kwarg_message)
+    return
+
+  genome_list = get_global_metadata()
+  if not genome_list:
+    logger.warning(empty_genomes)
+    return
+  try:  
+    items_to_return = []
+    if fuzz_on:
+      fuzzy_hits = _get_fuzzy_index(genome_list).match([text], fuzzy_value)[0]
+      hits = sorted(fuzzy_hits)
+    elif mode == "json":
+      hits = [position for position, item in enumerate(genome_list) if json_search(item, text, fuzzy_value, fuzz_on)]
+    else:
+      index = _get_deep_search_index(genome_list)
+      hits = index.search(text)
+    for position in hits:
+      item = genome_list[position]
+      if output == "fields":
+        if fuzz_on:
+          paths = _fuzzy_field_paths(item, {string for _, string in fuzzy_hits[position]})
+        elif mode == "json":
+          paths = []
+        else:
+          paths = index.field_paths(position, text)
+        items_to_return.append((f"ATCC {item['product_id']}:{item['id']}", paths))
+      elif output != "id":
+        items_to_return.append(item)
+      else:
+        items_to_return.append(f"ATCC {item['product_id']}:{item['id']}")
+    if items_to_return:
+      if output == "table":
+        items_to_return = tabulate(items_to_return)
+      elif output == "fields":
+        items_to_return = dict(items_to_return)
+      return items_to_return
+    else:
+      raise emptyResultsError(message)
+  except emptyResultsError as ere:
+    logger.warning(ere)
+
+
+
+def _parse_fasta(text):
+  """Parse FASTA text into {header: sequence}"""
+  assembly_obj = {}
+  header = None
+  sequence = []
+  for line in text.split("\n"):
+    if line.startswith(">"):
+      if header is not None:
+        assembly_obj[header] = "".join(sequence)
+      header = line.strip()
+      sequence = []
+    else:
+      sequence.append(line.strip())
+  if header is not None:
+    assembly_obj[header] = "".join(sequence)
+  return assembly_obj
+
+
+def _fasta_assembly_id(file_path):
+  """Return the assembly_id in the first FASTA header of a file"""
+  with _open_artifact(file_path) as f:
+    for line in f:
+      if line.startswith(">"):
+        match = re.search(r'assembly_id="?(\w+)', line)
+        return match.group(1) if match else None
+  return None
+
+
+## Compressed output. With compress=True, download_assembly(output='fasta') and download_annotations(output='gbk') write BGZF, the
+## blocked gzip format of samtools and tabix, as the file streams in. Every block of up to 64 KiB is compressed on its own, so the
+## file is a valid .gz for any gzip reader, samtools can random-access a FASTA through its .fai and .gzi indexes, and an interrupted
+## download resumes after the last complete block. With threads > 1, blocks are compressed in parallel (zlib releases the GIL).
+compression_settings = {
+  "level": 6,
+  "threads": 1,
+}
+_bgzf_block_size = 0xff00  # uncompressed bytes per block, as bgzip uses, so a block still fits in 64 KiB if it does not compress
+_bgzf_header = struct.Struct("<4BI2BH2B2H")
+_bgzf_eof = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+
+def configure_compression(**kwargs):
+  """
+    configure_compression() is a function used to configure the BGZF compression of downloads made with compress=True. \n
+
+    --------- USAGE ---------
+    Optional arguments:
+    \t level = <int> \n \t\t zlib compression level, from 1 (fastest) to 9 (smallest) [(6)]
+    \t threads = <int> \n \t\t Threads compressing the blocks of each file [(1)]
+  """
+  unknown = [k for k in kwargs if k not in compression_settings]
+  if unknown:
+    logger.warning(f"Unknown compression setting(s): {', '.join(unknown)}. Choose from {', '.join(compression_settings)}")
+    return
+  compression_settings.update(kwargs)
+
+
+def _open_artifact(file_path, mode='r'):
+  """Open a downloaded file, decompressing it when it was written with compress=True"""
+  if str(file_path).endswith(".gz"):
+    return gzip.open(file_path, mode if 'b' in mode else mode + 't')
+  return open(file_path, mode)
+
+
+def _bgzf_block(data, level):
+  compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+  payload = compressor.compress(data) + compressor.flush()
+  header = _bgzf_header.pack(0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, ord("B"), ord("C"), 2, len(payload) + 25)
+  return header + payload + struct.pack("<2I", zlib.crc32(data), len(data))
+
+
+def _bgzf_blocks(file_path, truncate=False):
+  """
+    (compressed offset, uncompressed offset) of every complete block of a BGZF file, and its uncompressed size.
+    With truncate=True, a block torn by an interrupted write is cut off the end of the file.
+  """
+  blocks, offset, size = [], 0, 0
+  with open(file_path, 'rb+' if truncate else 'rb') as f:
+    file_size = os.fstat(f.fileno()).st_size
+    while offset + _bgzf_header.size <= file_size:
+      f.seek(offset)
+      fields = _bgzf_header.unpack(f.read(_bgzf_header.size))
+      block_end = offset + fields[-1] + 1
+      if fields[:2] != (0x1f, 0x8b) or fields[8:11] != (ord("B"), ord("C"), 2) or block_end > file_size:
+        break
+      f.seek(block_end - 4)
+      blocks.append((offset, size))
+      size += struct.unpack("<I", f.read(4))[0]
+      offset = block_end
+    if offset < file_size:
+      if not truncate:
+        raise ValueError(f"{file_path} is not a complete BGZF file")
+      f.truncate(offset)
+  return blocks, size
+
+
+def _write_gzi(file_path):
+  """Write the .gzi index samtools uses to seek in a BGZF file: every block's offsets but the first"""
+  blocks, _ = _bgzf_blocks(file_path)
+  with open(file_path + ".gzi", 'wb') as f:
+    f.write(struct.pack("<Q", len(blocks) - 1))
+    for compressed_offset, uncompressed_offset in blocks[1:]:
+      f.write(struct.pack("<2Q", compressed_offset, uncompressed_offset))
+
+
+class _BgzfWriter:
+  """Compresses whatever is written to it into BGZF blocks appended to an open file, in order, on one or more threads"""
+
+  def __init__(self, file, level=6, threads=1):
+    self._file = file
+    self._level = level
+    self._threads = threads
+    self._buffer = bytearray()
+    self._pending = deque()
+    self._executor = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+
+  def write(self, data):
+    self._buffer += data
+    while len(self._buffer) >= _bgzf_block_size:
+      self._compress(bytes(self._buffer[:_bgzf_block_size]))
+      del self._buffer[:_bgzf_block_size]
+
+  def _compress(self, data):
+    if self._executor is None:
+      self._file.write(_bgzf_block(data, self._level))
+      return
+    self._pending.append(self._executor.submit(_bgzf_block, data, self._level))
+    while len(self._pending) > 2 * self._threads:
+      self._file.write(self._pending.popleft().result())
+
+  def close(self):
+    """Write out everything received so far, so that a resumed download can continue right after it"""
+    try:
+      if self._buffer:
+        self._compress(bytes(self._buffer))
+        self._buffer.clear()
+      while self._pending:
+        self._file.write(self._pending.popleft().result())
+    finally:
+      if self._executor is not None:
+        self._executor.shutdown(cancel_futures=True)
+
+
+## Resumable downloads. A signed URL is streamed into "<file>.part", next to a "<file>.part.json" state file holding the
+## object's size and validators. An interrupted transfer resumes from the end of the partial file with an HTTP Range request
+## (guarded by If-Range, so a changed object restarts from zero), an expired signed URL is requested again from the portal,
+## and the finished file is checked against its expected size and, when the storage backend reports one, its MD5.
+_resume_attempts = 8
+_signed_url_refreshes = 3
+
+
+def _signed_url_refresher(path, apikey):
+  """Callable that asks a portal endpoint for a freshly signed download URL"""
+  return lambda: _api_request("GET", path, apikey).json()['url']
+
+
+def _file_digest(file_path, algorithm="sha256", decompress=False):
+  digest = hashlib.new(algorithm)
+  with (gzip.open if decompress else open)(file_path, 'rb') as f:
+    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+
+def _expected_md5(headers):
+  """
+    MD5 of the whole object, from an x-goog-hash or a Content-MD5 header. An ETag is not used even when it looks like an MD5:
+    S3 objects encrypted with SSE-KMS, and some proxies, send 32 hex digit ETags that are not the MD5 of the body.
+  """
+  for value in headers.get("x-goog-hash", "").split(","):
+    if value.strip().startswith("md5="):
+      return base64.b64decode(value.strip()[4:]).hex()
+  if headers.get("Content-MD5"):
+    return base64.b64decode(headers["Content-MD5"]).hex()
+  return None
+
+
+def _read_part_state(part_path):
+  try:
+    with open(part_path + ".json") as f:
+      return json.load(f)
+  except (OSError, ValueError):
+    return {}
+
+
+def _write_part_state(part_path, state):
+  with open(part_path + ".json", "w") as f:
+    json.dump(state, f)
+
+
+def _remove_partial(part_path, keep_part=False):
+  for path in ([] if keep_part else [part_path]) + [part_path + ".json"]:
+    try:
+      os.remove(path)
+    except FileNotFoundError:
+      pass
+
+
+def _part_size(part_path, compress):
+  """Bytes of the object already in a partial file, after cutting off any block torn by an interrupted write"""
+  if not os.path.isfile(part_path):
+    return 0
+  if compress:
+    return _bgzf_blocks(part_path, truncate=True)[1]
+  return os.path.getsize(part_path)
+
+
+def _resumable_download(url, part_path, refresh_url=None, compress=False):
+  """
+    Download a signed URL into part_path, resuming the partial file left by an earlier attempt when there is one.
+    With compress=True the file is written as BGZF while it streams in, and sizes and checksums apply to its uncompressed bytes.
+    Returns part_path once the file is complete and verified, or None while the storage key does not exist yet.
+  """
+  state = _read_part_state(part_path) if os.path.isfile(part_path) else {}
+  not_ready, refreshes, failures, restarted = 0, 0, 0, False
+  while True:
+    offset = _part_size(part_path, compress) if state else 0
+    if state.get("size") is not None and offset >= state["size"]:
+      if offset > state["size"]:
+        state = {}
+        continue
+    else:
+      headers = {}
+      if offset:
+        headers["Range"] = f"bytes={offset}-"
+        if state.get("etag") or state.get("last_modified"):
+          headers["If-Range"] = state.get("etag") or state.get("last_modified")
+      try:
+        with _signed_url_request(url, stream=True, headers=headers) as resp:
+          if resp.status_code == 416:
+            state = {}  # the object is smaller than our partial file, start over
+            continue
+          if resp.status_code not in (200, 206):
+            if "The specified key does not exist" in resp.text:
+              # The file behind a new signed URL is still being generated
+              if not_ready == 2 * transport_settings["max_retries"]:
+                logger.warning("The URL to download this file appears to be broken. Please try again later!")
+                return None
+              time.sleep(_backoff_delay(not_ready))
+              not_ready += 1
+              continue
+            if refresh_url is not None and resp.status_code in (400, 401, 403) and refreshes < _signed_url_refreshes:
+              # Signed URLs expire, ask the portal for a new one and pick up where we left off
+              refreshes += 1
+              logger.info(f"The download URL was rejected ({resp.status_code}), requesting a new one")
+              url = refresh_url()
+              continue
+            resp.raise_for_status()
+          if resp.status_code == 200:
+            # A fresh transfer, or the server ignored our Range because the object changed
+            length = resp.headers.get("Content-Length")
+            encoded = bool(resp.headers.get("Content-Encoding"))
+            state = {
+              "size": int(length) if length and not encoded else None,
+              "etag": resp.headers.get("ETag"),
+              "last_modified": resp.headers.get("Last-Modified"),
+              "md5": None if encoded else _expected_md5(resp.headers),
+            }
+            mode = 'wb'
+          else:
+            content_range = resp.headers.get("Content-Range", "")
+            if not content_range.startswith(f"bytes {offset}-"):
+              state = {}
+              continue
+            total = content_range.rsplit("/", 1)[-1]
+            if total.isdigit():
+              state["size"] = int(total)
+            mode = 'ab'
+          _write_part_state(part_path, state)
+          received = 0
+          try:
+            with open(part_path, mode) as f:
+              writer = _BgzfWriter(f, compression_settings["level"], compression_settings["threads"]) if compress else f
+              try:
+                # Small chunks, so that little more than the unread socket buffer is lost when the connection drops
+                for chunk in resp.iter_content(chunk_size=256 * 1024):
+                  writer.write(chunk)
+                  received += len(chunk)
+              finally:
+                if compress:
+                  writer.close()
+          finally:
+            _record_count("GET", url, "bytes_received", received)
+      except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+        failures += 1
+        if failures > _resume_attempts:
+          raise
+        delay = _backoff_delay(failures - 1)
+        _record_count("GET", url, "retries")
+        _record_count("GET", url, "retry_sleep_seconds", delay)
+        time.sleep(delay)
+        logger.info(f"Download interrupted ({e}), resuming {os.path.basename(part_path)} from byte {_part_size(part_path, compress):,}")
+        continue
+      if state.get("size") is not None and _part_size(part_path, compress) < state["size"]:
+        failures += 1
+        if failures > _resume_attempts:
+          raise IOError(f"The download of {part_path} stopped short after {_resume_attempts} attempts")
+        continue
+    size = _part_size(part_path, compress)
+    if (state.get("size") is None or size == state["size"]) and (not state.get("md5") or _file_digest(part_path, "md5", compress) == state["md5"]):
+      if compress:
+        with open(part_path, 'ab') as f:
+          f.write(_bgzf_eof)
+      _remove_partial(part_path, keep_part=True)
+      return part_path
+    _remove_partial(part_path)
+    if restarted:
+      raise IOError(f"The download of {part_path} failed its integrity check twice")
+    logger.info(f"The download of {os.path.basename(part_path)} failed its integrity check, downloading it again")
+    state, restarted = {}, True
+
+
+def _genbank_assembly_id(file_path):
+  """Return the assembly ID in the VERSION line of a GenBank file"""
+  with _open_artifact(file_path) as f:
+    for line in f:
+      if line.startswith("VERSION     "):
+        match = re.search(r'assembly_(\w+)', line)
+        return match.group(1) if match else None
+  return None
+
+
+def _download_artifact_file(data, file_path, read_assembly_id, refresh_url=None, compress=False):
+  """Stream an assembly or annotations file to disk with constant memory, keeping earlier assembly versions under their own name"""
+  output_file_path = os.path.join(file_path, data['save_as_filename'] + (".gz" if compress else ""))
+  tmp_path = _resumable_download(data['url'], output_file_path + ".part", refresh_url, compress)
+  if tmp_path is None:
+    return
+  try:
+    if os.path.isfile(output_file_path) and os.path.getsize(output_file_path) > 500:
+      incoming_id = read_assembly_id(tmp_path)
+      if read_assembly_id(output_file_path) == incoming_id:
+        logger.info("This file already exists, and the assembly version is the same...re-downloading!")
+      else:
+        logger.info("You had a previous version of this genome, but we have updated the assembly version...downloading with assembly ID appended to name!")
+        root, extension = os.path.splitext(output_file_path[:-3] if compress else output_file_path)
+        output_file_path = f'{root}_{incoming_id}{extension}' + (".gz" if compress else "")
+    os.replace(tmp_path, output_file_path)
+  except BaseException:
+    os.remove(tmp_path)
+    raise
+  print(f"SUCCESS! File: {output_file_path} now exists!")
+  return output_file_path
+
+
+## Local artifact cache. Every assembly or annotations file written to a download directory gets a sidecar manifest in
+## <download_dir>/.genome_portal_api/, keyed by genome ID, file kind and primary_assembly.id and holding the file size and sha256.
+## Before asking the portal for a signed URL, the current assembly ID is looked up (in the loaded catalog when there is one)
+## and a file whose manifest matches is returned without downloading anything. A new assembly version gets its own file and manifest.
+artifact_cache_settings = {
+  "enabled": True,
+  "cache_dir": None,
+  "verify_checksum": False,
+}
+
+
+def configure_artifact_cache(**kwargs):
+  """
+    configure_artifact_cache() is a function used to configure the local cache of downloaded assemblies and annotations. \n
+
+    --------- USAGE ---------
+    Optional arguments:
+    \t enabled = <bool> \n \t\t Reuse files already downloaded for the current assembly version [(True) | False ]
+    \t cache_dir = [Path <str>] \n \t\t Directory to keep output='dict' downloads in when no download_dir is given [(None) uses a temporary directory]
+    \t verify_checksum = <bool> \n \t\t Check the sha256 of a cached file before reusing it, instead of only its size [True | (False) ]
+  """
+  unknown = [k for k in kwargs if k not in artifact_cache_settings]
+  if unknown:
+    logger.warning(f"Unknown artifact cache setting(s): {', '.join(unknown)}. Choose from {', '.join(artifact_cache_settings)}")
+    return
+  artifact_cache_settings.update(kwargs)
+
+
+def _current_assembly_id(genome_id, apikey):
+  """primary_assembly.id of a genome, from the loaded catalog when there is one, otherwise from its metadata"""
+  genome_list = globals().get("global_genome_metadata")
+  if genome_list:
+    by_id = _catalog_map(genome_list, "id")
+    if genome_id in by_id:
+      return (by_id[genome_id].get("primary_assembly") or {}).get("id")
+  try:
+    resp = _cached_api_request("GET", f"/api/genomes/{genome_id}", apikey)
+    return resp.json()["primary_assembly"]["id"] if resp.status_code == 200 else None
+  except (requests.RequestException, ValueError, KeyError, TypeError):
+    return None
+
+
+def _artifact_manifest_path(file_path, genome_id, kind, assembly_id):
+  return os.path.join(file_path, ".genome_portal_api", f"{genome_id}.{kind}.{assembly_id}.json")
+
+
+def _cached_artifact(file_path, genome_id, kind, assembly_id):
+  """Path of the file downloaded earlier for this genome, kind and assembly version, if it is still intact"""
+  if not artifact_cache_settings["enabled"] or not assembly_id:
+    return None
+  try:
+    with open(_artifact_manifest_path(file_path, genome_id, kind, assembly_id)) as f:
+      manifest = json.load(f)
+  except (OSError, ValueError):
+    return None
+  cached_path = os.path.join(file_path, manifest["file_name"])
+  try:
+    stat = os.stat(cached_path)
+  except OSError:
+    return None
+  # A file rewritten since (ex. by a download of another assembly version under the same name) no longer matches
+  if stat.st_size != manifest["size"] or stat.st_mtime_ns != manifest["mtime_ns"]:
+    return None
+  if artifact_cache_settings["verify_checksum"] and _file_digest(cached_path) != manifest["sha256"]:
+    logger.info(f"{cached_path} does not match its checksum, re-downloading!")
+    return None
+  logger.info(f"File: {cached_path} is already up to date with assembly {assembly_id}")
+  return cached_path
+
+
+def _record_artifact(output_file_path, genome_id, kind, assembly_id):
+  """Write the sidecar manifest of a downloaded file"""
+  if not artifact_cache_settings["enabled"] or not assembly_id:
+    return
+  file_path, file_name = os.path.split(output_file_path)
+  manifest_path = _artifact_manifest_path(file_path, genome_id, kind, assembly_id)
+  manifest = {
+    "genome_id": genome_id,
+    "kind": kind,
+    "assembly_id": assembly_id,
+    "file_name": file_name,
+    "size": os.path.getsize(output_file_path),
+    "mtime_ns": os.stat(output_file_path).st_mtime_ns,
+    "sha256": _file_digest(output_file_path),
+    "downloaded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+  }
+  os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+  with open(manifest_path + ".tmp", "w") as f:
+    json.dump(manifest, f)
+  os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def _download_cached_artifact(data, file_path, genome_id, kind, assembly_id, refresh_url=None, compress=False):
+  """Download an assembly or annotations file and record it in the artifact cache, compressed files under their own kind"""
+  read_assembly_id = _fasta_assembly_id if kind == "assembly" else _genbank_assembly_id
+  output_file_path = _download_artifact_file(data, file_path, read_assembly_id, refresh_url, compress)
+  if output_file_path is not None:
+    if compress and kind == "assembly":
+      # samtools faidx reads a bgzipped FASTA through both indexes
+      _write_gzi(output_file_path)
+      try:
+        _load_or_build_fai(output_file_path)
+      except ValueError as e:
+        logger.info(f"{e}, no .fai index was written")
+    _record_artifact(output_file_path, genome_id, kind + (".gz" if compress else ""), assembly_id or read_assembly_id(output_file_path))
+  return output_file_path
+
+
+def _build_fai(file_path):
+  """
+    Build samtools-style .fai records (name, length, offset, linebases, linewidth) for a FASTA file.
+    Raises ValueError when a record is not wrapped at a constant width, as samtools faidx does.
+  """
+  records = []
+  record = None
+  short_line = False
+  position = 0
+  with _open_artifact(file_path, 'rb') as f:
+    for line in f:
+      if line.startswith(b">"):
+        record = [line[1:].split(maxsplit=1)[0].decode() if line[1:].strip() else "", 0, position + len(line), 0, 0]
+        records.append(record)
+        short_line = False
+      elif record is not None:
+        bases = len(line.rstrip(b"\r\n"))
+        if bases:
+          if short_line or (record[3] and bases > record[3]):
+            raise ValueError(f"{file_path} has inconsistent line lengths in record {record[0]}")
+          if not record[3]:
+            record[3], record[4] = bases, len(line)
+          elif bases < record[3] or len(line) != record[4]:
+            short_line = True
+          record[1] += bases
+      position += len(line)
+  return [tuple(record) for record in records]
+
+
+def _load_or_build_fai(file_path):
+  fai_path = file_path + ".fai"
+  if os.path.isfile(fai_path) and os.path.getmtime(fai_path) >= os.path.getmtime(file_path):
+    with open(fai_path) as f:
+      return [(name, int(length), int(offset), int(linebases), int(linewidth)) for name, length, offset, linebases, linewidth in (line.rstrip("\n").split("\t")[:5] for line in f if line.strip())]
+  records = _build_fai(file_path)
+  try:
+    with open(fai_path, 'w') as f:
+      for record in records:
+        f.write("\t".join(map(str, record)) + "\n")
+  except OSError:
+    pass  # read-only location, keep the index in memory only
+  return records
+
+
+def _close_indexed_fasta(resources, remove_dir):
+  for resource in resources:
+    resource.close()
+  if remove_dir:
+    shutil.rmtree(remove_dir, ignore_errors=True)
+
+
+class IndexedFasta(Mapping):
+  """
+    Read-only, dict-compatible assembly backed by a memory-mapped FASTA file and its .fai index.
+    Keys are the full header lines, the same as the dictionaries download_assembly(output='dict') used to return.
+    Only the index is held in memory: lengths come from the index, and sequences are read from disk when accessed.
+
+      assembly = download_assembly(id='304fd1fb9a4e48ee')
+      assembly.lengths                                  {header: length} without reading any sequence
+      assembly.fetch('>contig_1 ...', 1000, 1150)       150 bases, reading only that region
+      assembly['>contig_1 ...']                         the full contig as a str
+  """
+
+  def __init__(self, file_path, remove_dir=None):
+    self.file_path = file_path
+    self._file = open(file_path, 'rb')
+    resources = [self._file]
+    self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(file_path) else b""
+    if self._mmap:
+      resources.insert(0, self._mmap)
+    self._finalizer = weakref.finalize(self, _close_indexed_fasta, resources, remove_dir)
+    self._records = {}
+    self._names = {}
+    for name, length, offset, linebases, linewidth in _load_or_build_fai(file_path):
+      # The header is the whole line ending where the sequence starts, whatever ">" its description holds
+      header_start = self._mmap.rfind(b"\n", 0, offset - 1) + 1
+      header = self._mmap[header_start:offset].decode().strip()
+      self._records[header] = (length, offset, linebases, linewidth)
+      self._names.setdefault(name, header)
+
+  def _record(self, key):
+    if key in self._records:
+      return self._records[key]
+    if key in self._names:
+      return self._records[self._names[key]]
+    raise KeyError(key)
+
+  def __getitem__(self, key):
+    return self.fetch(key)
+
+  def __contains__(self, key):
+    return key in self._records or key in self._names
+
+  def __iter__(self):
+    return iter(self._records)
+
+  def __len__(self):
+    return len(self._records)
+
+  def __repr__(self):
+    return f"IndexedFasta({self.file_path!r}, {len(self)} contigs)"
+
+  @property
+  def lengths(self):
+    """{header: sequence length} read from the index"""
+    return {header: record[0] for header, record in self._records.items()}
+
+  def length(self, key):
+    """Length of one contig, by full header or contig name"""
+    return self._record(key)[0]
+
+  def fetch(self, key, start=0, end=None):
+    """Return bases [start, end) of a contig (0-based, like a str slice), reading only that region from disk"""
+    length, offset, linebases, linewidth = self._record(key)
+    start, end, _ = slice(start, end).indices(length)
+    if end <= start:
+      return ""
+    first = offset + (start // linebases) * linewidth + start % linebases
+    last = offset + ((end - 1) // linebases) * linewidth + (end - 1) % linebases
+    return self._mmap[first:last + 1].replace(b"\n", b"").replace(b"\r", b"").decode()
+
+  def close(self):
+    """Release the memory map. Temporary downloads are deleted"""
+    self._finalizer()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+
+## 2-bit packed assemblies. A, C, G and T are stored 4 bases to a byte in a NumPy array. N and other IUPAC codes are coded as A
+## in the packed bases and restored from side arrays: runs of N (start, end) and of soft-masked lowercase bases, and the positions
+## and letters of anything else. Slicing, reverse complement and base counts work on the arrays, and only decoding builds a str.
+_base_codes = np.full(256, 4, dtype=np.uint8)
+for _code, _base in enumerate(b"ACGT"):
+  _base_codes[_base] = _base_codes[_base | 0x20] = _code
+_code_bases = np.frombuffer(b"ACGT", dtype=np.uint8)
+_iupac_complement = np.arange(256, dtype=np.uint8)
+for _base, _complement_base in zip(b"ACGTRYKMBVDHSWN", b"TGCAYRMKVBHDSWN"):
+  _iupac_complement[_base] = _complement_base
+# _byte_codes[byte] = the 4 codes a packed byte holds, and _byte_base_counts[byte] = how many A, C, G and T those are
+_byte_codes = np.array([[(byte >> shift) & 3 for shift in (6, 4, 2, 0)] for byte in range(256)], dtype=np.uint8)
+_byte_base_counts = np.stack([(_byte_codes == code).sum(axis=1) for code in range(4)], axis=1).astype(np.int64)
+_no_runs = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+
+
+def _runs(mask):
+  """(starts, ends) of the runs of True in a boolean array"""
+  edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.view(np.int8), [0]))))
+  return edges[0::2].astype(np.int64), edges[1::2].astype(np.int64)
+
+
+def _run_mask(runs, start, end):
+  """Boolean mask of the bases [start, end) covered by runs, or None when no run reaches them"""
+  starts, ends = runs
+  first, last = np.searchsorted(ends, start, side="right"), np.searchsorted(starts, end, side="left")
+  if first >= last:
+    return None
+  edges = np.zeros(end - start + 1, dtype=np.int64)
+  np.add.at(edges, np.maximum(starts[first:last], start) - start, 1)
+  np.add.at(edges, np.minimum(ends[first:last], end) - start, -1)
+  return np.cumsum(edges[:-1]) > 0
+
+
+def _clip_runs(runs, start, end, length=None):
+  """Runs within [start, end), shifted to start at 0, or mirrored for a reverse complement when length is given"""
+  starts, ends = runs
+  first, last = np.searchsorted(ends, start, side="right"), np.searchsorted(starts, end, side="left")
+  if first >= last:
+    return _no_runs
+  starts, ends = np.maximum(starts[first:last], start) - start, np.minimum(ends[first:last], end) - start
+  if length is not None:
+    starts, ends = length - ends[::-1], length - starts[::-1]
+  return starts, ends
+
+
+def _pack_codes(codes):
+  padded = np.zeros((len(codes) + 3) // 4 * 4, dtype=np.uint8)
+  padded[:len(codes)] = codes & 3
+  quads = padded.reshape(-1, 4)
+  return (quads[:, 0] << 6) | (quads[:, 1] << 4) | (quads[:, 2] << 2) | quads[:, 3]
+
+
+def _unpack_codes(packed, start, end):
+  """2-bit codes of the bases [start, end)"""
+  first = start // 4
+  return _byte_codes[packed[first:(end + 3) // 4]].ravel()[start - first * 4:end - first * 4]
+
+
+class PackedSequence:
+  """
+    One sequence stored 2 bits per base. Slices and reverse complements are PackedSequences too, and str() decodes one.
+
+      sequence = assembly['>contig_1 ...']
+      str(sequence[1000:1150])                         150 bases, decoding only those
+      sequence.reverse_complement()
+      sequence.base_counts(), sequence.gc_content()   without decoding anything
+  """
+  __slots__ = ("_packed", "_length", "_n_runs", "_soft_runs", "_other_positions", "_other_bases")
+
+  def __init__(self, packed, length, n_runs, soft_runs, other_positions, other_bases):
+    self._packed = packed
+    self._length = length
+    self._n_runs = n_runs
+    self._soft_runs = soft_runs
+    self._other_positions = other_positions
+    self._other_bases = other_bases
+
+  @classmethod
+  def from_bytes(cls, sequence):
+    """Pack an ASCII sequence (bytes, bytearray or str) with no line breaks"""
+    values = np.frombuffer(sequence.encode("ascii") if isinstance(sequence, str) else bytes(sequence), dtype=np.uint8)
+    codes = _base_codes[values]
+    soft = (values >= ord("a")) & (values <= ord("z"))
+    upper = np.where(soft, values - 32, values).astype(np.uint8)
+    is_n = upper == ord("N")
+    other_positions = np.flatnonzero((codes == 4) & ~is_n)
+    return cls(_pack_codes(codes), len(values), _runs(is_n), _runs(soft), other_positions.astype(np.int64), upper[other_positions])
+
+  from_str = from_bytes
+
+  def __len__(self):
+    return self._length
+
+  def __repr__(self):
+    preview = self.decode(0, 20) + ("..." if self._length > 20 else "")
+    return f"PackedSequence({preview!r}, {self._length:,} bases)"
+
+  def __str__(self):
+    return self.decode()
+
+  def __eq__(self, other):
+    if isinstance(other, PackedSequence):
+      other = other.decode()
+    return self.decode() == other if isinstance(other, str) else NotImplemented
+
+  def __hash__(self):
+    return hash(self.decode())
+
+  @property
+  def nbytes(self):
+    """Bytes held by the packed bases and the side arrays"""
+    return sum(array.nbytes for array in (self._packed, *self._n_runs, *self._soft_runs, self._other_positions, self._other_bases))
+
+  def __getitem__(self, key):
+    if isinstance(key, slice):
+      start, end, step = key.indices(self._length)
+      if step != 1:
+        return PackedSequence.from_bytes(self.decode()[key])
+      return self.slice(start, end)
+    position = key + self._length if key < 0 else key
+    if not 0 <= position < self._length:
+      raise IndexError("PackedSequence index out of range")
+    return self.decode(position, position + 1)
+
+  def slice(self, start, end):
+    """Bases [start, end) (0-based, like a str slice) as a new PackedSequence"""
+    start, end, _ = slice(start, end).indices(self._length)
+    end = max(start, end)
+    if start % 4 == 0:
+      packed = self._packed[start // 4:(end + 3) // 4].copy()
+      if (end - start) % 4:
+        # base_counts() relies on the padding past the end being packed as 0
+        packed[-1] &= (0xff << 8 - 2 * ((end - start) % 4)) & 0xff
+    else:
+      packed = _pack_codes(_unpack_codes(self._packed, start, end))
+    first, last = np.searchsorted(self._other_positions, [start, end])
+    return PackedSequence(packed, end - start, _clip_runs(self._n_runs, start, end), _clip_runs(self._soft_runs, start, end),
+                          self._other_positions[first:last] - start, self._other_bases[first:last].copy())
+
+  def reverse_complement(self):
+    codes = 3 - _unpack_codes(self._packed, 0, self._length)[::-1]
+    n_runs = _clip_runs(self._n_runs, 0, self._length, self._length)
+    other_positions = (self._length - 1 - self._other_positions)[::-1].copy()
+    # N and other letters stay packed as 0, the placeholder base_counts() expects, instead of complementing to 3
+    n_mask = _run_mask(n_runs, 0, self._length)
+    if n_mask is not None:
+      codes[n_mask] = 0
+    codes[other_positions] = 0
+    return PackedSequence(_pack_codes(codes), self._length, n_runs, _clip_runs(self._soft_runs, 0, self._length, self._length),
+                          other_positions, _iupac_complement[self._other_bases[::-1]])
+
+  def decode(self, start=0, end=None):
+    """Bases [start, end) as a str"""
+    start, end, _ = slice(start, end).indices(self._length)
+    if end <= start:
+      return ""
+    bases = _code_bases[_unpack_codes(self._packed, start, end)]
+    n_mask = _run_mask(self._n_runs, start, end)
+    if n_mask is not None:
+      bases[n_mask] = ord("N")
+    first, last = np.searchsorted(self._other_positions, [start, end])
+    bases[self._other_positions[first:last] - start] = self._other_bases[first:last]
+    soft_mask = _run_mask(self._soft_runs, start, end)
+    if soft_mask is not None:
+      bases[soft_mask] |= 0x20
+    return bases.tobytes().decode("ascii")
+
+  def codes(self, start=0, end=None):
+    """Bases [start, end) as a uint8 array, 0-3 for A, C, G and T, and 4 for N or any other letter"""
+    start, end, _ = slice(start, end).indices(self._length)
+    codes = _unpack_codes(self._packed, start, max(start, end)).copy()
+    n_mask = _run_mask(self._n_runs, start, end)
+    if n_mask is not None:
+      codes[n_mask] = 4
+    first, last = np.searchsorted(self._other_positions, [start, end])
+    codes[self._other_positions[first:last] - start] = 4
+    return codes
+
+  def base_counts(self):
+    """{base: count}, counted from a histogram of the packed bytes without decoding the sequence"""
+    counts = np.bincount(self._packed, minlength=256) @ _byte_base_counts
+    # padding, N and other letters are all packed as A
+    n_count = int((self._n_runs[1] - self._n_runs[0]).sum())
+    counts[0] -= len(self._packed) * 4 - self._length + n_count + len(self._other_positions)
+    result = dict(zip("ACGT", counts.tolist()))
+    if n_count:
+      result["N"] = n_count
+    for base, count in zip(*np.unique(self._other_bases, return_counts=True)):
+      result[chr(base)] = int(count)
+    return result
+
+  def gc_content(self):
+    """Fraction of G and C among the A, C, G and T bases"""
+    counts = self.base_counts()
+    acgt = sum(counts[base] for base in "ACGT")
+    return (counts["G"] + counts["C"]) / acgt if acgt else 0.0
+
+
+class PackedAssembly(Mapping):
+  """
+    Dict-compatible assembly holding every contig as a 2-bit packed PackedSequence, about 4x smaller than a dict of str.
+    Keys are the full header lines, as with download_assembly(output='dict'), and contig names work as keys too.
+
+      assembly = download_assembly(id='304fd1fb9a4e48ee', output='packed')
+      assembly.lengths                                  {header: length}
+      assembly['contig_1'][1000:1150]                   a PackedSequence, str() it for the bases
+      PackedAssembly.from_assembly(other_assembly)      pack a dict or IndexedFasta already in memory
+  """
+
+  def __init__(self, sequences):
+    self._sequences = dict(sequences)
+    self._names = {}
+    for header in self._sequences:
+      name = header.lstrip(">").split(maxsplit=1)
+      self._names.setdefault(name[0] if name else "", header)
+
+  @classmethod
+  def from_fasta(cls, file_path):
+    """Pack a FASTA file (optionally bgzipped) one record at a time"""
+    sequences = {}
+    header, lines = None, []
+    with _open_artifact(file_path, 'rb') as f:
+      for line in f:
+        if line.startswith(b">"):
+          if header is not None:
+            sequences[header] = PackedSequence.from_bytes(b"".join(lines))
+          header, lines = line.decode().strip(), []
+        elif header is not None:
+          lines.append(line.strip())
+    if header is not None:
+      sequences[header] = PackedSequence.from_bytes(b"".join(lines))
+    return cls(sequences)
+
+  @classmethod
+  def from_assembly(cls, assembly):
+    return cls((header, PackedSequence.from_bytes(sequence)) for header, sequence in assembly.items())
+
+  def __getitem__(self, key):
+    if key in self._sequences:
+      return self._sequences[key]
+    if key in self._names:
+      return self._sequences[self._names[key]]
+    raise KeyError(key)
+
+  def __contains__(self, key):
+    return key in self._sequences or key in self._names
+
+  def __iter__(self):
+    return iter(self._sequences)
+
+  def __len__(self):
+    return len(self._sequences)
+
+  def __repr__(self):
+    return f"PackedAssembly({len(self)} contigs, {sum(self.lengths.values()):,} bases, {self.nbytes / 1e6:,.1f} MB)"
+
+  @property
+  def lengths(self):
+    return {header: len(sequence) for header, sequence in self._sequences.items()}
+
+  @property
+  def nbytes(self):
+    return sum(sequence.nbytes for sequence in self._sequences.values())
+
+
+## Streaming GenBank parser. Files are read one line at a time, the ORIGIN sequence is skipped, and each feature becomes a compact
+## GenbankFeature as soon as its last qualifier has been read, so the text of a multi-MB annotation file is never held in memory.
+GenbankFeature = namedtuple("GenbankFeature", ["contig", "type", "location", "start", "end", "strand", "parts", "locus_tag", "gene", "product", "qualifiers"])
+GenbankFeature.__doc__ = """
+  One annotated feature. start and end (1-based, inclusive) span every part of the location, and parts holds each (start, end) of a join().
+  strand is 1, or -1 for complement() locations. qualifiers holds every qualifier except /translation, repeated ones as a list.
+"""
+_location_part_pattern = re.compile(r"<?(\d+)(?:\.\.>?(\d+))?")
+_location_accession_pattern = re.compile(r"[A-Za-z_][\w.]*:")
+
+
+def _parse_location(location):
+  """(start, end, strand, parts) of a GenBank location string"""
+  parts = tuple((int(start), int(end or start)) for start, end in _location_part_pattern.findall(_location_accession_pattern.sub("", location)))
+  strand = -1 if re.match(r"^(?:(?:join|order)\()?complement\(", location) else 1
+  if not parts:
+    return None, None, strand, parts
+  return min(start for start, _ in parts), max(end for _, end in parts), strand, parts
+
+
+def _genbank_feature(contig, key, location_lines, qualifier_lines, keep_translation):
+  location = "".join(location_lines)
+  qualifiers = {}
+  for name, lines in qualifier_lines:
+    if name == "translation" and not keep_translation:
+      continue
+    if lines is None:
+      value = True  # a flag, ex. /pseudo
+    else:
+      value = ("" if name == "translation" else " ").join(lines)
+      if value.startswith('"'):
+        value = value[1:-1] if value.endswith('"') and len(value) > 1 else value[1:]
+        value = value.replace('""', '"')
+    if name in qualifiers:
+      previous = qualifiers[name]
+      qualifiers[name] = (previous if isinstance(previous, list) else [previous]) + [value]
+    else:
+      qualifiers[name] = value
+  start, end, strand, parts = _parse_location(location)
+  first = lambda name: qualifiers[name][0] if isinstance(qualifiers.get(name), list) else qualifiers.get(name)
+  return GenbankFeature(contig, key, location, start, end, strand, parts, first("locus_tag"), first("gene"), first("product"), qualifiers)
+
+
+def iter_genbank_features(source, feature_types=None, keep_translation=False):
+  """
+    Yield a GenbankFeature for every feature of a GenBank file, reading it one line at a time.
+    source is the path of a GenBank file (optionally gzipped) or any iterable of its lines, ex. an open file.
+    feature_types (ex. ["CDS", "gene"]) keeps only those features, and keep_translation=True keeps the long /translation qualifiers.
+  """
+  if isinstance(source, (str, os.PathLike)):
+    opener = gzip.open if str(source).endswith(".gz") else open
+    with opener(source, 'rt') as f:
+      yield from iter_genbank_features(f, feature_types, keep_translation)
+    return
+  wanted = set(feature_types) if feature_types else None
+  contig, in_features, feature, open_quote = None, False, None, False
+  for line in source:
+    if not in_features:
+      if line.startswith("LOCUS"):
+        contig = line.split()[1]
+      elif line.startswith("FEATURES"):
+        in_features = True
+      continue
+    if not line.startswith(" "):
+      # ORIGIN, CONTIG or "//" end the feature table
+      if feature and (wanted is None or feature[0] in wanted):
+        yield _genbank_feature(contig, *feature, keep_translation)
+      in_features, feature, open_quote = False, None, False
+      continue
+    key, text = line[5:21].strip(), line[21:].rstrip("\r\n")
+    if key:
+      if feature and (wanted is None or feature[0] in wanted):
+        yield _genbank_feature(contig, *feature, keep_translation)
+      feature, open_quote = (key, [text.strip()], []), False
+    elif feature is None:
+      continue
+    elif text.startswith("/") and not open_quote:
+      name, equals, value = text[1:].partition("=")
+      feature[2].append((name, [value] if equals else None))
+      open_quote = value.startswith('"') and (value.count('"') % 2 == 1)
+    elif feature[2]:
+      lines = feature[2][-1][1]
+      if lines is not None:
+        lines.append(text.strip())
+        if text.count('"') % 2 == 1:
+          open_quote = not open_quote
+    else:
+      feature[1].append(text.strip())
+  if feature and (wanted is None or feature[0] in wanted):
+    yield _genbank_feature(contig, *feature, keep_translation)
+
+
+class GenbankFeatures(Sequence):
+  """
+    The features of a GenBank file, in file order, with lookups by locus tag and gene name.
+
+      features = download_annotations(id='304fd1fb9a4e48ee', output='features')
+      features.locus_tag('pgap_annot_000001')          the gene and CDS features with that locus tag
+      features.gene('blaTEM')                          every feature of the gene, ignoring case
+      features.of_type('CDS')                          only the CDS features
+  """
+
+  def __init__(self, features):
+    self.features = list(features)
+    self.by_locus_tag = {}
+    self.by_gene = {}
+    for position, feature in enumerate(self.features):
+      if feature.locus_tag:
+        self.by_locus_tag.setdefault(feature.locus_tag, []).append(position)
+      if feature.gene:
+        self.by_gene.setdefault(feature.gene.lower(), []).append(position)
+
+  def __getitem__(self, position):
+    return self.features[position]
+
+  def __len__(self):
+    return len(self.features)
+
+  def __repr__(self):
+    return f"GenbankFeatures({len(self)} features, {len(self.by_locus_tag)} locus tags)"
+
+  def locus_tag(self, locus_tag):
+    return [self.features[position] for position in self.by_locus_tag.get(locus_tag, [])]
+
+  def gene(self, name):
+    return [self.features[position] for position in self.by_gene.get(str(name).lower(), [])]
+
+  def of_type(self, *feature_types):
+    return [feature for feature in self.features if feature.type in feature_types]
+
+  @property
+  def contigs(self):
+    return list(dict.fromkeys(feature.contig for feature in self.features))
+
+
+## Interval index over the features of a GenBank file, for region and nearest-feature queries. Every part of a feature's location is
+## an interval, and the intervals of each contig are kept in arrays sorted by start, with a running maximum of their ends, so the
+## features overlapping a region, and the nearest feature to a position, are found with binary searches instead of a scan.
+feature_index_suffix = ".features.npz"
+_feature_index_version = 1
+
+
+def _build_feature_index(file_path):
+  """Arrays of the interval index of a GenBank file: one row per feature, one interval per part of its location"""
+  columns = {name: [] for name in ["contig", "type", "location", "strand", "locus_tag", "gene", "product"]}
+  intervals = []  # (contig, start, end, row)
+  for feature in iter_genbank_features(file_path):
+    if feature.type == "source" or not feature.parts:
+      continue  # source features span every contig
+    row = len(columns["type"])
+    columns["contig"].append(feature.contig)
+    columns["type"].append(feature.type)
+    columns["location"].append(feature.location)
+    columns["strand"].append(feature.strand)
+    for name in ["locus_tag", "gene", "product"]:
+      columns[name].append(getattr(feature, name) or "")
+    intervals.extend((feature.contig, min(start, end), max(start, end), row) for start, end in dict.fromkeys(feature.parts))
+  contigs = list(dict.fromkeys(contig for contig, _, _, _ in intervals))
+  contig_number = {contig: number for number, contig in enumerate(contigs)}
+  intervals.sort(key=lambda interval: (contig_number[interval[0]], interval[1], interval[2]))
+  bounds = np.searchsorted(np.array([contig_number[interval[0]] for interval in intervals], dtype=np.int64), np.arange(len(contigs) + 1))
+  arrays = {
+    "version": np.array([_feature_index_version]),
+    "contigs": np.array(contigs, dtype=str),
+    "bounds": bounds.astype(np.int64),
+    "starts": np.array([interval[1] for interval in intervals], dtype=np.int64),
+    "ends": np.array([interval[2] for interval in intervals], dtype=np.int64),
+    "rows": np.array([interval[3] for interval in intervals], dtype=np.int64),
+    "strand": np.array(columns.pop("strand"), dtype=np.int8),
+    "row_contigs": np.array([contig_number.get(contig, -1) for contig in columns.pop("contig")], dtype=np.int64),
+  }
+  for name, values in columns.items():
+    arrays[name] = np.array(values, dtype=str)
+  return arrays
+
+
+def _load_or_build_feature_index(file_path):
+  index_path = file_path + feature_index_suffix
+  if os.path.isfile(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(file_path):
+    try:
+      with np.load(index_path) as saved:
+        if int(saved["version"][0]) == _feature_index_version:
+          return {name: saved[name] for name in saved.files}
+    except (OSError, ValueError, KeyError) as e:
+      logger.info(f"Rebuilding the feature index of {file_path}: {e}")
+  arrays = _build_feature_index(file_path)
+  try:
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(index_path)), suffix=".part", delete=False) as f:
+      np.savez(f, **arrays)
+    os.replace(f.name, index_path)
+  except OSError:
+    pass  # read-only location, keep the index in memory only
+  return arrays
+
+
+class FeatureIndex:
+  """
+    Interval index of the features of a GenBank file, saved next to it as <file>.features.npz and reused while the file is unchanged.
+    Positions are 1-based and inclusive, as in GenBank locations. Features are returned as GenbankFeature records without qualifiers.
+
+      index = download_annotations(id='304fd1fb9a4e48ee', output='index')
+      index.overlap('contig_1', 1000, 1150)             features overlapping bases 1,000-1,150, in order of their start
+      index.overlap('contig_1', 1234, feature_types=['CDS'])
+      index.nearest('contig_1', 52000)                  (the closest feature, its distance in bases), distance 0 inside a feature
+  """
+
+  def __init__(self, file_path, arrays=None):
+    self.file_path = file_path
+    arrays = arrays if arrays is not None else _load_or_build_feature_index(file_path)
+    self._arrays = arrays
+    self._features = {}
+    self._contig_number = {str(contig): number for number, contig in enumerate(arrays["contigs"])}
+    self._intervals = {}
+
+  def __repr__(self):
+    return f"FeatureIndex({self.file_path!r}, {len(self)} features, {len(self._contig_number)} contigs)"
+
+  def __len__(self):
+    return len(self._arrays["type"])
+
+  @property
+  def contigs(self):
+    return list(self._contig_number)
+
+  def feature(self, row):
+    """The GenbankFeature of one row of the index"""
+    if row not in self._features:
+      a = self._arrays
+      contig = str(a["contigs"][a["row_contigs"][row]])
+      location = str(a["location"][row])
+      start, end, _, parts = _parse_location(location)
+      self._features[row] = GenbankFeature(contig, str(a["type"][row]), location, start, end, int(a["strand"][row]), parts,
+                                           str(a["locus_tag"][row]) or None, str(a["gene"][row]) or None, str(a["product"][row]) or None, {})
+    return self._features[row]
+
+  def _contig_intervals(self, contig, feature_types):
+    """(starts, ends, rows, running maximum of ends, position of that maximum) of one contig, optionally only some feature types"""
+    key = (contig, tuple(sorted(feature_types)) if feature_types else None)
+    if key not in self._intervals:
+      if contig not in self._contig_number:
+        raise KeyError(contig)
+      a = self._arrays
+      number = self._contig_number[contig]
+      window = slice(a["bounds"][number], a["bounds"][number + 1])
+      starts, ends, rows = a["starts"][window], a["ends"][window], a["rows"][window]
+      if feature_types:
+        keep = np.isin(a["type"][rows], list(feature_types))
+        starts, ends, rows = starts[keep], ends[keep], rows[keep]
+      max_ends = np.maximum.accumulate(ends) if len(ends) else ends
+      # where each running maximum was reached, so nearest() can name the feature that ends closest upstream
+      max_positions = np.maximum.accumulate(np.where(ends == max_ends, np.arange(len(ends)), 0)) if len(ends) else ends
+      self._intervals[key] = (starts, ends, rows, max_ends, max_positions)
+    return self._intervals[key]
+
+  def overlap(self, contig, start, end=None, feature_types=None):
+    """Features with any part overlapping bases start to end (inclusive) of a contig, in order of their start"""
+    end = start if end is None else end
+    starts, ends, rows, max_ends, _ = self._contig_intervals(contig, feature_types)
+    # intervals that start at or before end, after the first one whose running maximum reaches start
+    first = int(np.searchsorted(max_ends, start, side="left"))
+    last = int(np.searchsorted(starts, end, side="right"))
+    if first >= last:
+      return []
+    hits = rows[first:last][ends[first:last] >= start]
+    return [self.feature(int(row)) for row in dict.fromkeys(hits.tolist())]
+
+  def nearest(self, contig, position, feature_types=None):
+    """(feature, distance in bases) of the feature closest to a position of a contig, distance 0 when it overlaps one, or (None, None)"""
+    starts, ends, rows, max_ends, max_positions = self._contig_intervals(contig, feature_types)
+    before = int(np.searchsorted(starts, position, side="right"))
+    upstream = downstream = None
+    if before:
+      if max_ends[before - 1] >= position:
+        return self.overlap(contig, position, feature_types=feature_types)[0], 0
+      upstream = (position - int(max_ends[before - 1]), int(rows[max_positions[before - 1]]))
+    if before < len(starts):
+      downstream = (int(starts[before]) - position, int(rows[before]))
+    closest = min((candidate for candidate in (upstream, downstream) if candidate), default=None)
+    if closest is None:
+      return None, None
+    return self.feature(closest[1]), closest[0]
+
+
+def download_assembly(**kwargs):
+  if "id" in kwargs:
+    id = kwargs['id']
+  else:
+    print("""
       download_assembly() is function to download the fasta assemblies on the ATCC Genome Portal. The genomes files can be downloaded, or output directly to stdout. \n
       
       --------- USAGE ---------
@@ -416,13 +2640,17 @@ def download_assembly(**kwargs):
       \t id = <str> \n \t\t An ATCC Genome ID (https://genomes.atcc.org/genomes/<genomeid>) \n     
       
       Optional arguments:
-      \t output = <str> \n \t\t The API response format "output" [ (dict) | fasta ]
+      \t output = <str> \n \t\t The API response format "output" [ (dict) | fasta | packed ]
       \t download_dir = [Path <str>] \n \t\t A directory to download the fasta file to. The fasta file will be named automatically.
+      \t\t With output='dict', the file is kept there, otherwise it is stored in a temporary directory until the assembly object is released.
+      \t compress = <bool> \n \t\t With output='fasta', write a bgzip-compressed .fasta.gz with its .fai and .gzi indexes [True | (False) ]
       \t api_key = <str> \n \t\t Your Genome Portal APIKey [(global_api_key) | overwrite if provided ] \n
 
       EXAMPLES:
       \t download_assembly(id='304fd1fb9a4e48ee', output='fasta', download_dir="/directory/for/download/") downloads an assembly file to provided path
-      \t download_assembly(id='304fd1fb9a4e48ee', output='dict') return a dictionary of the assembly. Key=Header : Value=Seq.
+      \t download_assembly(id='304fd1fb9a4e48ee', output='fasta', download_dir="/directory/for/download/", compress=True) downloads a bgzipped assembly samtools can read
+      \t download_assembly(id='304fd1fb9a4e48ee', output='dict') return a dictionary-like IndexedFasta of the assembly. Key=Header : Value=Seq, loaded from disk on access.
+      \t download_assembly(id='304fd1fb9a4e48ee', output='packed') return a PackedAssembly held in memory at 2 bits per base
     """)
     return
 
@@ -444,77 +2672,61 @@ def download_assembly(**kwargs):
     if file_path == False:
       logger.critical("'download_dir' MUST be provided when selecting 'output='fasta'")
       return
-  cmd = f"curl --insecure --header \'Content-Type: Application/json\' --header \"X-API-Key: {apikey}\""
-  cmd += f" https://genomes.atcc.org/api/genomes/{id}/download_assembly"
-  cmd += " 2> /dev/null"
+  compress = bool(kwargs.get("compress", False)) and output == 'fasta'
   try:
-    grab = os.popen(cmd)
-    result = grab.read()
-    data = json.loads(result)
-    grab.close()
-    assembly='The specified key does not exist'
-    if 'url' not in data.keys():
-      logger.warning(f"There does not appear to be a URL for Genome: {id}. Please verify and try again!")
-      return
-    if "API access" in result:
-      logger.critical(membership_message)
-      return
-    if output in ['fasta','dict']:
-      counter=0
-      while "The specified key does not exist" in assembly and counter <=10:
-        assembly_stage = os.popen(f"curl \"{data['url']}\"")
-        assembly = assembly_stage.read()
-        assembly_obj = {}
-        if "The specified key does not exist" in assembly:
-          time.sleep(2.5) # Allow 2 seconds per tmp URL generation
-          counter += 1
-      if "The specified key does not exist" in assembly:
-        logger.warning("The URL to download this file appears to be broken. Please try again later!")
-      for line in assembly.split("\n"):
-        if ">" in line:
-          header = line.strip()
-          assembly_obj[header] = ""
-        else:
-          assembly_obj[header] += line.strip()
-      assembly_stage.close()
-      if output=='dict':
-        return assembly_obj
-      elif output == 'fasta':
-        output_file_path = os.path.join(file_path, data['save_as_filename'])
-        if not os.path.isfile(output_file_path) or os.path.getsize(output_file_path) < 500:
-          try:
-            with open(output_file_path, 'w') as f: 
-              for key, value in assembly_obj.items():
-                print(key, file=f)
-                print(value, file=f)
-              print(f"SUCCESS! File: {output_file_path} now exists!")
-              return
-          except emptyResultsError as ere:
-            logger.warning(ere)
-        if os.path.isfile(output_file_path) or os.path.getsize(output_file_path) > 500:
-          try:
-            with open(output_file_path, 'r') as f: 
-              for line in f:
-                if line.startswith(">"):
-                  filtered=line[line.find('assembly_id='):][13:29]
-                  if filtered in str(assembly_obj):
-                    logger.info("This file already exists, and the assembly version is the same...re-downloading!")
-                    break
-                  else:
-                    logger.info("You had a previous version of this genome, but we have updated the assembly version...downloading with assembly ID appended to name!")
-                    incoming_id = assembly[assembly.find('assembly_id='):][13:29]
-                    output_file_path = f'{output_file_path.strip(".fasta")}_{incoming_id}.fasta'
-                    break
-              with open(output_file_path, 'w') as f: 
-                for key, value in assembly_obj.items():
-                  print(key, file=f)
-                  print(value, file=f)
-              print(f"SUCCESS! File: {output_file_path} now exists!")
-              return
-          except Exception as e:
-            logger.log(e)
-            logger.warning("Whoops, we encountered a file link bug. Please try again!")
+    cache_dir = file_path or artifact_cache_settings["cache_dir"]
+    if offline_settings["enabled"] and output in ['dict', 'packed'] and not file_path:
+      # Index the snapshot's own file instead of copying it
+      cache_dir, assembly_id, cached_path = None, None, _offline_artifact(id, "assembly")
+    elif cache_dir and output in ['fasta', 'dict', 'packed'] and artifact_cache_settings["enabled"]:
+      assembly_id = _current_assembly_id(id, apikey)
+      cached_path = _cached_artifact(cache_dir, id, "assembly.gz" if compress else "assembly", assembly_id)
+    else:
+      assembly_id = cached_path = None
+    if cached_path is None:
+      result = _api_request("GET", f"/api/genomes/{id}/download_assembly", apikey).text
+      data = json.loads(result)
+      if 'url' not in data.keys():
+        logger.warning(f"There does not appear to be a URL for Genome: {id}. Please verify and try again!")
+        return
+      if "API access" in result:
+        logger.critical(membership_message)
+        return
+    refresh_url = _signed_url_refresher(f"/api/genomes/{id}/download_assembly", apikey)
+    if output == 'fasta':
+      return cached_path or _download_cached_artifact(data, file_path, id, "assembly", assembly_id, refresh_url, compress)
+    elif output in ['dict', 'packed']:
+      remove_dir = None
+      if cached_path:
+        fasta_path = cached_path
+      elif cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        fasta_path = _download_cached_artifact(data, cache_dir, id, "assembly", assembly_id, refresh_url)
       else:
+        remove_dir = tempfile.mkdtemp(prefix="atcc_assembly_")
+        fasta_path = os.path.join(remove_dir, data['save_as_filename'])
+        if _resumable_download(data['url'], fasta_path + ".part", refresh_url) is None:
+          fasta_path = None
+        else:
+          os.replace(fasta_path + ".part", fasta_path)
+      if fasta_path is None:
+        if remove_dir:
+          shutil.rmtree(remove_dir, ignore_errors=True)
+        return
+      if output == 'packed':
+        try:
+          return PackedAssembly.from_fasta(fasta_path)
+        finally:
+          if remove_dir:
+            shutil.rmtree(remove_dir, ignore_errors=True)
+      try:
+        return IndexedFasta(fasta_path, remove_dir=remove_dir)
+      except ValueError as e:
+        logger.info(f"{e}, loading the assembly into memory instead")
+        with open(fasta_path) as f:
+          assembly_obj = _parse_fasta(f.read())
+        if remove_dir:
+          shutil.rmtree(remove_dir, ignore_errors=True)
         return assembly_obj
     else:
       logger.warning(kwarg_message)
@@ -537,13 +2749,17 @@ def download_annotations(**kwargs):
       \t id = <str> \n \t\t An ATCC Genome ID (https://genomes.atcc.org/genomes/<genomeid>) \n     
       
       Optional arguments:
-      \t output = <str> \n \t\t The API response format "output" [ (dict) | gbk ]
+      \t output = <str> \n \t\t The API response format "output" [ (dict) | gbk | features | index ]
       \t download_dir = [Path <str>] \n \t\t A directory to download the GenBank files to. The file will be named automatically.
+      \t feature_types = <list> \n \t\t Only keep these feature types with output='features', ex. ['CDS', 'rRNA'] [ (all) ]
+      \t compress = <bool> \n \t\t With output='gbk', write a gzip-compressed (BGZF) .gbk.gz [True | (False) ]
       \t api_key = <str> \n \t\t Your Genome Portal APIKey [(global_api_key) | overwrite if provided ] \n
       
       EXAMPLES:
       download_annotations(id='304fd1fb9a4e48ee', output='gbk', download_dir='/directory/for/download/') downloads a GenBank file to provided path
       download_annotations(id='304fd1fb9a4e48ee', output='dict') return the raw genbank file
+      download_annotations(id='304fd1fb9a4e48ee', output='features') return the parsed features, searchable by locus tag and gene
+      download_annotations(id='304fd1fb9a4e48ee', output='index') return an interval index for overlap and nearest feature queries
     """)
     return
   
@@ -564,68 +2780,74 @@ def download_annotations(**kwargs):
   if output=='gbk':
     if file_path == False:
       logger.critical("'download_dir' MUST be provided when selecting 'output='gbk'")
+      return
+  compress = bool(kwargs.get("compress", False)) and output == 'gbk'
 
-  cmd = f"curl --insecure --header \'Content-Type: Application/json\' --header \"X-API-Key: {apikey}\""
-  cmd += f" https://genomes.atcc.org/api/genomes/{id}/download_annotations"
-  cmd += " 2> /dev/null"
   try:
-    grab = os.popen(cmd)
-    result = grab.read()
-    data = json.loads(result)
-    grab.close()
-    annotations_stage=None
-    annotations='The specified key does not exist'
-    if 'url' not in data.keys():
-      logger.warning(f"There does not appear to be a URL for Genome: {id}. Please verify and try again!")
-      return
-    if "API access" in result:
-      logger.critical(membership_message)
-      return
-    if output in ['gbk','dict']:
-      counter=0
-      while "The specified key does not exist" in annotations and counter <=10:
-        annotations_stage = os.popen(f"curl \"{data['url']}\"")
-        annotations = annotations_stage.read()
-        annotations_stage.close()
-        if "The specified key does not exist" in annotations :
-          time.sleep(2.5)
-          counter += 1
-      if "The specified key does not exist" in annotations:
-        logger.warning("The URL to download this file appears to be broken. Please try again later!")
-      if output == 'dict':
-        return annotations
-      elif output =='gbk':
-        output_file_path = os.path.join(file_path, data['save_as_filename'])
-        if not os.path.isfile(output_file_path) or os.path.getsize(output_file_path) < 500:
-          try:
-            with open(output_file_path, 'w') as f: 
-              f.write(annotations)
-            print(f"SUCCESS! File: {output_file_path} now exists!")
-            return
-          except emptyResultsError as ere:
-            logger.warning(ere)
-        if os.path.isfile(output_file_path) or os.path.getsize(output_file_path) > 500:
-          try:
-            with open(output_file_path, 'r') as f: 
-              for line in f:
-                if line.startswith("VERSION     "):
-                  filtered=line[line.find('assembly_'):][9:25]
-                  continue
-            if filtered in str(annotations):
-              logger.info("This file already exists, and the assembly version is the same...re-downloading!")
-            else:
-              logger.info("You had a previous version of this genome, but we have updated the assembly version...downloading with assembly ID appended to name!")
-              incoming_id = annotations[annotations.find('assembly_'):][9:25]
-              output_file_path = f'{output_file_path.strip(".gbk")}_{incoming_id}.gbk'
-            with open(output_file_path, 'w') as f: 
-              f.write(annotations)
-            print(f"SUCCESS! File: {output_file_path} now exists!")
-            return
-          except:
-            logger.warning("Whoops, we encountered a file link bug. Please try again!")
+    feature_types = kwargs.get("feature_types")
+    cache_dir = file_path if output == 'gbk' else artifact_cache_settings["cache_dir"]
+    if offline_settings["enabled"] and output in ['dict', 'features', 'index']:
+      # Read the snapshot's own file instead of copying it
+      cache_dir, assembly_id, cached_path = None, None, _offline_artifact(id, "annotations")
+    elif cache_dir and output in ['gbk', 'dict', 'features', 'index'] and artifact_cache_settings["enabled"]:
+      assembly_id = _current_assembly_id(id, apikey)
+      cached_path = _cached_artifact(cache_dir, id, "annotations.gz" if compress else "annotations", assembly_id)
+    else:
+      assembly_id = cached_path = None
+    if cached_path is None:
+      result = _api_request("GET", f"/api/genomes/{id}/download_annotations", apikey).text
+      data = json.loads(result)
+      if 'url' not in data.keys():
+        logger.warning(f"There does not appear to be a URL for Genome: {id}. Please verify and try again!")
+        return
+      if "API access" in result:
+        logger.critical(membership_message)
+        return
+    refresh_url = _signed_url_refresher(f"/api/genomes/{id}/download_annotations", apikey)
+    if output == 'gbk':
+      return cached_path or _download_cached_artifact(data, file_path, id, "annotations", assembly_id, refresh_url, compress)
+    elif output == 'dict':
+      if cached_path or cache_dir:
+        if cached_path is None:
+          os.makedirs(cache_dir, exist_ok=True)
+          cached_path = _download_cached_artifact(data, cache_dir, id, "annotations", assembly_id, refresh_url)
+          if cached_path is None:
             return
+        with open(cached_path, 'r') as f:
+          return f.read()
+      annotations = _signed_url_request(data['url']).text
+      counter=0
+      while "The specified key does not exist" in annotations and counter < 2 * transport_settings["max_retries"]:
+        time.sleep(_backoff_delay(counter))
+        counter += 1
+        annotations = _signed_url_request(data['url']).text
+      if "The specified key does not exist" in annotations:
+        logger.warning("The URL to download this file appears to be broken. Please try again later!")
+      return annotations
+    elif output in ['features', 'index']:
+      # Parse the file line by line from disk rather than holding its text in memory
+      remove_dir = None
+      if cached_path:
+        gbk_path = cached_path
+      elif cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        gbk_path = _download_cached_artifact(data, cache_dir, id, "annotations", assembly_id, refresh_url)
       else:
-        return annotations
+        remove_dir = tempfile.mkdtemp(prefix="atcc_annotations_")
+        gbk_path = os.path.join(remove_dir, data['save_as_filename'])
+        if _resumable_download(data['url'], gbk_path + ".part", refresh_url) is None:
+          gbk_path = None
+        else:
+          os.replace(gbk_path + ".part", gbk_path)
+      try:
+        if gbk_path is None:
+          return
+        if output == 'index':
+          return FeatureIndex(gbk_path)
+        return GenbankFeatures(iter_genbank_features(gbk_path, feature_types=feature_types))
+      finally:
+        if remove_dir:
+          shutil.rmtree(remove_dir, ignore_errors=True)
     else:
       logger.warning(kwarg_message)
       return
@@ -671,16 +2893,11 @@ def download_metadata(**kwargs):
       apikey = get_global_apikey()
   output = kwargs['output'].lower() if 'output' in kwargs else 'dict'
 
-  cmd = f"curl --insecure --header \'Content-Type: Application/json\' --header \"X-API-Key: {apikey}\""
-  cmd += f" https://genomes.atcc.org/api/genomes/{id}"
-  cmd += " 2> /dev/null"
   if output not in ['dict','table']:
     logger.warning(kwarg_message)
     return
   try:
-    result_stage = os.popen(cmd)
-    result = result_stage.read()
-    result_stage.close()
+    result = _cached_api_request("GET", f"/api/genomes/{id}", apikey).text
     if "API access" in result:
       logger.critical(membership_message)
       return
@@ -695,35 +2912,78 @@ def download_metadata(**kwargs):
     logger.warning(ere)
 
 
-def iter_paginated_endpoint(url: str, api_key) -> Generator:
-    """Fetch all items from a paginated API endpoint"""
+def _fetch_page(url: str, api_key, page: int):
+    """Fetch a single page of a paginated endpoint as (pagination_info, rows). Rows are None without API access"""
+    resp = _api_request("GET", url, api_key, basic_auth=True, params={"page": page})
+    if "API access" in resp.text:
+        return None, None
+    if not resp.status_code == 200:
+        raise Exception(f"something went wrong {resp.status_code}: {resp.text}")
+    return json.loads(resp.headers["X-Pagination"]), _json_loads(resp.text)
+
+def _total_pages(pagination_info: dict, page_size: int) -> Optional[int]:
+    """Work out the number of pages from an X-Pagination header, if it exposes one"""
+    for key in ("total_pages", "pages", "last_page"):
+        if pagination_info.get(key):
+            return int(pagination_info[key])
+    total = pagination_info.get("total")
+    per_page = pagination_info.get("per_page") or page_size
+    if total is not None and per_page:
+        return -(-int(total) // int(per_page))
+    return None
+
+def _iter_pages_concurrently(url: str, api_key, pages, max_workers: int, ordered: bool) -> Generator:
+    """Fetch pages with at most max_workers requests in flight, yielding each page's rows"""
+    membership_message="API access to the ATCC Genome Portal requires a supporting membership. Please visit https://genomes.atcc.org/plans to subscribe."
+    pages = iter(pages)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        in_flight = deque(executor.submit(_fetch_page, url, api_key, page) for page in islice(pages, max_workers))
+        while in_flight:
+            if ordered:
+                future = in_flight.popleft()
+            else:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                future = done.pop()
+                in_flight.remove(future)
+            _, rows = future.result()
+            if rows is None:
+                logger.critical(membership_message)
+                return
+            page = next(pages, None)
+            if page is not None:
+                in_flight.append(executor.submit(_fetch_page, url, api_key, page))
+            yield from rows
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def iter_paginated_endpoint(url: str, api_key, max_workers: int = 1, ordered: bool = True) -> Generator:
+    """Fetch all items from a paginated API endpoint
+
+    With max_workers > 1, and an X-Pagination header that reports the number of pages, the
+    remaining pages are fetched concurrently with at most max_workers requests in flight.
+    Rows are yielded in page order, or page by page as they arrive when ordered=False.
+    """
     page = 1
-    total = 0
     membership_message="API access to the ATCC Genome Portal requires a supporting membership. Please visit https://genomes.atcc.org/plans to subscribe."
     while True:
-        resp = requests.get(
-            url,
-            auth=(api_key, ""),
-            params={"page": page},
-        )
-        
-        if "API access" in resp.text:
+        pagination_info, rows = _fetch_page(url, api_key, page)
+        if rows is None:
           logger.critical(membership_message)
           return
-        if not resp.status_code == 200:
-            raise Exception(f"something went wrong {resp.status_code}: {resp.text}")
-        pagination_info = json.loads(resp.headers["X-Pagination"])
-        page = pagination_info.get("next_page")
-        rows = resp.json()
-        for row in rows:
-            total += 1
-            yield row
-        if page is None or len(rows) == 0:
+        next_page = pagination_info.get("next_page")
+        yield from rows
+        if next_page is None or len(rows) == 0:
             break
+        total_pages = _total_pages(pagination_info, len(rows)) if max_workers > 1 else None
+        if total_pages:
+            yield from _iter_pages_concurrently(url, api_key, range(next_page, total_pages + 1), max_workers, ordered)
+            return
+        page = next_page
 
-def get_genomes(api_key) -> Generator:
+def get_genomes(api_key, max_workers: int = 1, ordered: bool = True) -> Generator:
     """Fetch list of Genomes using ATCC Genome Management API"""
-    return iter_paginated_endpoint("https://genomes.atcc.org/api/genomes", api_key)
+    return iter_paginated_endpoint("/api/genomes", api_key, max_workers=max_workers, ordered=ordered)
 
 def convert_to_genomeid(**kwargs):
   try:
@@ -767,7 +3027,9 @@ def download_all_genomes(**kwargs):
       Required arguments: NONE \n
       
       Optional arguments:
-      \t api_key = <str> \n \t\t Your Genome Portal APIKey [(global_api_key) | overwrite if provided ] \n
+      \t api_key = <str> \n \t\t Your Genome Portal APIKey [(global_api_key) | overwrite if provided ]
+      \t max_workers = <int> \n \t\t Number of pages to fetch at the same time [(4)]
+      \t snapshot = <bool> \n \t\t Refresh and save the local metadata snapshot incrementally [(True) | False ] \n
 
       EXAMPLES:
       \t download_all_genomes() downloads all genomes as a list of JSON dictionaries to the variable "global_genome_metadata".
@@ -777,7 +3039,12 @@ def download_all_genomes(**kwargs):
   message="Your search returned zero results. Double check that the page you are searching for exists, and try again."
   message2="Your search returned an error. Double check that the page you are searching for exists, and try again."
 
-  genomes=list(get_genomes(apikey))
+  max_workers = int(kwargs['max_workers']) if 'max_workers' in kwargs else 4
+  use_snapshot = kwargs['snapshot'] if 'snapshot' in kwargs else snapshot_settings["enabled"]
+  if use_snapshot:
+    genomes=refresh_metadata_snapshot(api_key=apikey, max_workers=max_workers)
+  else:
+    genomes=list(get_genomes(apikey, max_workers=max_workers))
   if not genomes:
     return
   print(f"Fetched {len(genomes):,} genomes")
@@ -798,80 +3065,632 @@ def download_all_genomes(**kwargs):
     else:
       return data
 
+## Persistent metadata snapshot. The catalog is stored as gzipped JSONL next to a JSON manifest that
+## keeps the HTTP validators (ETag/Last-Modified) and genome IDs of every page, so a refresh only
+## re-downloads the pages that changed.
+snapshot_settings = {
+  "enabled": True,
+  "snapshot_dir": os.environ.get("ATCC_GENOME_PORTAL_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "genome_portal_api")),
+  "max_age": 24 * 60 * 60,
+}
+snapshot_format_version = 1
+
+
+def configure_snapshot(**kwargs):
+  """
+    configure_snapshot() is a function used to configure the local metadata snapshot used by download_all_genomes(), get_global_metadata() and deep_search(). \n
+
+    --------- USAGE ---------
+    Optional arguments:
+    \t enabled = <bool> \n \t\t Use and maintain the snapshot [(True) | False ]
+    \t snapshot_dir = [Path <str>] \n \t\t Directory holding the snapshot [($ATCC_GENOME_PORTAL_CACHE) | (~/.cache/genome_portal_api) ]
+    \t max_age = <int> \n \t\t Seconds before get_global_metadata() refreshes the snapshot from the portal [(86400) | None to never refresh ]
+  """
+  unknown = [k for k in kwargs if k not in snapshot_settings]
+  if unknown:
+    logger.warning(f"Unknown snapshot setting(s): {', '.join(unknown)}. Choose from {', '.join(snapshot_settings)}")
+    return
+  snapshot_settings.update(kwargs)
+
+
+def _snapshot_paths(snapshot_dir=None):
+  snapshot_dir = snapshot_dir or snapshot_settings["snapshot_dir"]
+  return os.path.join(snapshot_dir, "genomes.jsonl.gz"), os.path.join(snapshot_dir, "manifest.json")
+
+
+def _read_snapshot_manifest(snapshot_dir=None):
+  _, manifest_path = _snapshot_paths(snapshot_dir)
+  try:
+    with open(manifest_path) as f:
+      manifest = json.load(f)
+  except (OSError, ValueError):
+    return None
+  if manifest.get("version") != snapshot_format_version or manifest.get("base_url") != transport_settings["base_url"]:
+    return None
+  return manifest
+
+
+def load_metadata_snapshot(snapshot_dir=None, max_age=None):
+  """
+    Load the genome metadata list from the local snapshot, or return None when there is no usable snapshot.
+    With max_age (seconds), a snapshot refreshed longer ago than that is treated as missing.
+  """
+  manifest = _read_snapshot_manifest(snapshot_dir)
+  if manifest is None:
+    return None
+  if max_age is not None and not offline_settings["enabled"] and time.time() - manifest["refreshed_at"] > max_age:
+    return None
+  data_path, _ = _snapshot_paths(snapshot_dir)
+  try:
+    with gzip.open(data_path, "rt", encoding="utf-8") as f:
+      genomes = [json.loads(line) for line in f]
+  except (OSError, ValueError) as e:
+    logger.warning(f"Could not read the metadata snapshot {data_path}: {e}")
+    return None
+  if len(genomes) != manifest["count"]:
+    logger.warning(f"The metadata snapshot {data_path} is incomplete, ignoring it")
+    return None
+  logger.info(f"Loaded {len(genomes):,} genomes from the metadata snapshot refreshed {manifest['refreshed'].replace('T', ' ')}")
+  return genomes
+
+
+def save_metadata_snapshot(genomes, snapshot_dir=None, pages=None):
+  """Write a genome metadata list to the local snapshot. Files are replaced atomically"""
+  data_path, manifest_path = _snapshot_paths(snapshot_dir)
+  os.makedirs(os.path.dirname(data_path), exist_ok=True)
+  with gzip.open(data_path + ".tmp", "wt", encoding="utf-8", compresslevel=5) as f:
+    for genome in genomes:
+      f.write(json.dumps(genome, separators=(",", ":")))
+      f.write("\n")
+  os.replace(data_path + ".tmp", data_path)
+  _write_snapshot_manifest(genomes, snapshot_dir, pages or {})
+
+
+_genome_list_fingerprints = (None, 0, None)
+
+
+def _genome_list_fingerprint(genomes):
+  """sha256 of the IDs and "updated_at" of a genome list, so lists holding the same versions of the same genomes match"""
+  global _genome_list_fingerprints
+  source, size, fingerprint = _genome_list_fingerprints
+  if source is not genomes or size != len(genomes):
+    digest = hashlib.sha256()
+    for genome in genomes:
+      digest.update(f"{genome.get('id')}\t{genome.get('updated_at')}\n".encode())
+    fingerprint = digest.hexdigest()
+    _genome_list_fingerprints = (genomes, len(genomes), fingerprint)
+  return fingerprint
+
+
+def _write_snapshot_manifest(genomes, snapshot_dir, pages):
+  _, manifest_path = _snapshot_paths(snapshot_dir)
+  now = time.time()
+  manifest = {
+    "version": snapshot_format_version,
+    "base_url": transport_settings["base_url"],
+    "count": len(genomes),
+    "refreshed_at": now,
+    "refreshed": datetime.fromtimestamp(now, timezone.utc).isoformat(timespec="seconds"),
+    "fingerprint": _genome_list_fingerprint(genomes),
+    "pages": pages,
+  }
+  with open(manifest_path + ".tmp", "w") as f:
+    json.dump(manifest, f)
+  os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def _fetch_snapshot_page(page, apikey, validators):
+  """Conditionally GET one page of /api/genomes. Returns (status, pagination_info, rows, validators), status 404 past the last page"""
+  headers = {}
+  if validators.get("etag"):
+    headers["If-None-Match"] = validators["etag"]
+  if validators.get("last_modified"):
+    headers["If-Modified-Since"] = validators["last_modified"]
+  resp = _api_request("GET", "/api/genomes", apikey, basic_auth=True, params={"page": page}, headers=headers)
+  if resp.status_code == 304:
+    return 304, None, None, validators
+  if resp.status_code == 404:
+    return 404, {}, [], {}
+  if "API access" in resp.text:
+    return None, None, None, None
+  if not resp.status_code == 200:
+    raise Exception(f"something went wrong {resp.status_code}: {resp.text}")
+  pagination_info = json.loads(resp.headers["X-Pagination"]) if "X-Pagination" in resp.headers else {}
+  return 200, pagination_info, _json_loads(resp.text), {"etag": resp.headers.get("ETag"), "last_modified": resp.headers.get("Last-Modified")}
+
+
+def refresh_metadata_snapshot(**kwargs):
+  """
+    refresh_metadata_snapshot() is a function to bring the local metadata snapshot up to date with the portal and return the full genome list.
+    Every page is requested conditionally with the validators stored in the manifest, so unchanged pages are answered with
+    "304 Not Modified" and reused from disk. Genomes are merged by ID, and new, changed (by "updated_at") and removed genomes are reported. \n
+
+    --------- USAGE ---------
+    Optional arguments:
+    \t api_key = <str> \n \t\t Your Genome Portal APIKey [(global_api_key) | overwrite if provided ]
+    \t max_workers = <int> \n \t\t Number of pages to fetch at the same time [(4)]
+    \t snapshot_dir = [Path <str>] \n \t\t Directory holding the snapshot [(configure_snapshot() setting)]
+  """
+  membership_message="API access to the ATCC Genome Portal requires a supporting membership. Please visit https://genomes.atcc.org/plans to subscribe."
+  if "api_key" in kwargs:
+    apikey = kwargs['api_key']
+  else:
+    try:
+      apikey = global_api_key
+    except NameError:
+      apikey = get_global_apikey()
+  max_workers = int(kwargs['max_workers']) if 'max_workers' in kwargs else 4
+  snapshot_dir = kwargs['snapshot_dir'] if 'snapshot_dir' in kwargs else None
+  if offline_settings["enabled"]:
+    # There is nothing to refresh from, and an offline snapshot may be shared read-only
+    return load_metadata_snapshot(snapshot_dir)
+
+  manifest = _read_snapshot_manifest(snapshot_dir)
+  cached = {g["id"]: g for g in (load_metadata_snapshot(snapshot_dir) or [])} if manifest else {}
+  old_pages = manifest["pages"] if manifest and cached else {}
+
+  def validators_for(page):
+    # Only revalidate a page when every genome it held is still on disk
+    old = old_pages.get(str(page))
+    if old and all(i in cached for i in old["ids"]):
+      return old
+    return {}
+
+  fetched = {}
+  fetched[1] = _fetch_snapshot_page(1, apikey, validators_for(1))
+  if fetched[1][0] is None:
+    logger.critical(membership_message)
+    return
+  status, pagination_info, rows, _ = fetched[1]
+  if status in (200, 404):
+    total_pages = _total_pages(pagination_info, len(rows)) if pagination_info.get("next_page") else 1
+  else:
+    total_pages = max(int(p) for p in old_pages)
+  if total_pages and total_pages > 1:
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+      futures = {executor.submit(_fetch_snapshot_page, page, apikey, validators_for(page)): page for page in range(2, total_pages + 1)}
+      for future in as_completed(futures):
+        fetched[futures[future]] = future.result()
+  # Keep walking if the catalog grew past the pages we know about
+  page_size = len(fetched[1][2]) if fetched[1][0] == 200 else len(old_pages["1"]["ids"]) if "1" in old_pages else None
+  page = max(fetched)
+  while True:
+    status, pagination_info, rows, _ = fetched[page]
+    if status is None:
+      logger.critical(membership_message)
+      return
+    if status in (200, 404):
+      if not rows:
+        break
+      if "next_page" in pagination_info:
+        if pagination_info["next_page"] is None:
+          break
+      elif len(rows) < page_size:
+        break  # without an X-Pagination header, a short page is the last one
+    elif page_size and len(old_pages[str(page)]["ids"]) < page_size:
+      # An unchanged last page that was not full: nothing was added after it
+      break
+    page = (pagination_info or {}).get("next_page") or page + 1
+    fetched[page] = _fetch_snapshot_page(page, apikey, validators_for(page))
+    if fetched[page][0] in (200, 404) and not fetched[page][2]:
+      del fetched[page]
+      break
+
+  genomes, pages, seen = [], {}, set()
+  new, changed, unchanged_pages = 0, 0, 0
+  for page in sorted(fetched):
+    status, _, rows, validators = fetched[page]
+    if status == 304:
+      rows = [cached[i] for i in old_pages[str(page)]["ids"]]
+      unchanged_pages += 1
+    else:
+      for g in rows:
+        if g["id"] not in cached:
+          new += 1
+        elif cached[g["id"]].get("updated_at") != g.get("updated_at"):
+          changed += 1
+    rows = [g for g in rows if g["id"] not in seen]
+    seen.update(g["id"] for g in rows)
+    genomes += rows
+    pages[str(page)] = {"etag": validators.get("etag"), "last_modified": validators.get("last_modified"), "ids": [g["id"] for g in rows]}
+  removed = len(set(cached) - seen)
+
+  if genomes:
+    if new or changed or removed or not manifest or unchanged_pages < len(pages):
+      save_metadata_snapshot(genomes, snapshot_dir, pages)
+    else:
+      _write_snapshot_manifest(genomes, snapshot_dir, pages)
+  logger.info(f"Metadata snapshot refreshed: {unchanged_pages:,} of {len(pages):,} pages unchanged, {new:,} new, {changed:,} updated and {removed:,} removed genomes")
+  return genomes
+
+
+@_timed("format_qc")
 def format_qc(dataframe):
   """Format table of JSON into human readable and digestable"""
   df=dataframe
-  new_df=pd.DataFrame()
+  new_df=pd.DataFrame(index=df.index)
+  empty=pd.Series([None] * len(df), index=df.index, dtype=object)
+
+  def column(name):
+    return df[name] if name in df.columns else empty
+
+  def extended_or_none(name):
+    return column(name) if extended_json_format else empty
 
   new_df['atcc_product_id'] = df['product_id']
-  new_df['name'] = df['attributes.atcc_metadata.preferred_taxonomy_name'].combine_first(df['taxon_name'])
+  new_df['name'] = column('attributes.atcc_metadata.preferred_taxonomy_name').combine_first(df['taxon_name'])
   new_df['taxid'] = df['taxon_id']
   new_df['genome_id'] = df['id']
   new_df['assembly_id'] = df['primary_assembly.id']
   new_df['collection'] = "ATCC " + df['collection_name'].str.capitalize()
   
-  # Extended metadata inclusion
-  df['extended_json_format'] = df.apply(lambda row: True if 'attributes.atcc_metadata.other_metadata.catalog_details.ATCC_catalog_number' in row else False, axis=1)
-
-  new_df['contig_count'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.genome_stats.filtered_contig_count'] if row['extended_json_format'] else row['primary_assembly.attributes.qc_statistics.assembly_statistics.filtered.total_contigs'], axis=1)
-  new_df['total_contig_length'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.genome_stats.filtered_contig_length'] if row['extended_json_format'] else row['primary_assembly.attributes.qc_statistics.assembly_statistics.filtered.total_contig_length'], axis=1)
-  new_df['total_circular_contigs'] = df.apply(lambda row: row['primary_assembly.attributes.qc_statistics.assembly_statistics.filtered.total_circular_contigs'], axis=1)
-  new_df['total_n_assembly'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.genome_stats.number_of_n_bases'] if (row['extended_json_format'] and pd.notnull(row['attributes.atcc_metadata.other_metadata.genome_stats.number_of_n_bases'])) else (sum([i['ambiguous_nucleotide_count'] for i in row['primary_assembly.attributes.qc_statistics.assembly_statistics.filtered.contig_statistics']])) if isinstance(row['primary_assembly.attributes.qc_statistics.assembly_statistics.filtered.contig_statistics'], list) else None, axis=1)
-  new_df['illumina_barcoding_kit'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.illumina_metadata.barcoding_kit'] if row['extended_json_format'] else None, axis=1)
-  new_df['illumina_library_kit'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.illumina_metadata.library_kit'] if row['extended_json_format'] else None, axis=1)
-  new_df['illumina_sequencer'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.illumina_metadata.sequencer'] if row['extended_json_format'] else None, axis=1)
-  new_df['illumina_basecalling_model'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.illumina_metadata.basecaller_model'] if row['extended_json_format'] else None, axis=1)
-  new_df['illumina_basecalling_version'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.illumina_metadata.basecaller_version'] if row['extended_json_format'] else None, axis=1)
-  new_df['nanopore_barcoding_kit'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.ont_metadata.barcoding_kit'] if row['extended_json_format'] else None, axis=1)
-  new_df['nanopore_library_kit'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.ont_metadata.library_kit'] if row['extended_json_format'] else None, axis=1)
-  new_df['nanopore_flowcell_type'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.ont_metadata.flowcell_type'] if row['extended_json_format'] else None, axis=1)
-  new_df['nanopore_sequencer'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.ont_metadata.sequencer'] if row['extended_json_format'] else None, axis=1)
-  new_df['nanopore_basecalling_model'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.ont_metadata.basecaller_model'] if row['extended_json_format'] else None, axis=1)
-  new_df['nanopore_basecalling_version'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.ont_metadata.basecaller_version'] if row['extended_json_format'] else None, axis=1)
-
-  new_df['genome_page_creation'] = df.apply(lambda row: parse(row['created_at']).strftime('%x %X'), axis=1)  
-  new_df['genome_assembled_by'] = df['attributes.atcc_metadata.notes'].apply(lambda x: 'ATCC' if ('attributes.atcc_metadata.notes' in df.columns and ('oatmeal' in str(x).lower() or 'manual' in str(x).lower())) else 'OneCodex')
-  df['genome_assembled_by'] = new_df['genome_assembled_by']
+  # Extended metadata inclusion. The extended JSON fields are used for every row as soon as any genome in the table has them
+  extended_json_format = 'attributes.atcc_metadata.other_metadata.catalog_details.ATCC_catalog_number' in df.columns
+
+  new_df['contig_count'] = column('attributes.atcc_metadata.other_metadata.genome_stats.filtered_contig_count') if extended_json_format else column('primary_assembly.attributes.qc_statistics.assembly_statistics.filtered.total_contigs')
+  new_df['total_contig_length'] = column('attributes.atcc_metadata.other_metadata.genome_stats.filtered_contig_length') if extended_json_format else column('primary_assembly.attributes.qc_statistics.assembly_statistics.filtered.total_contig_length')
+  new_df['total_circular_contigs'] = column('primary_assembly.attributes.qc_statistics.assembly_statistics.filtered.total_circular_contigs')
+  contig_n_counts = column('primary_assembly.attributes.qc_statistics.assembly_statistics.filtered.contig_statistics').map(
+    lambda contigs: sum(i['ambiguous_nucleotide_count'] for i in contigs) if isinstance(contigs, list) else None)
+  n_bases = extended_or_none('attributes.atcc_metadata.other_metadata.genome_stats.number_of_n_bases')
+  new_df['total_n_assembly'] = n_bases.where(n_bases.notnull(), contig_n_counts)
+  new_df['illumina_barcoding_kit'] = extended_or_none('attributes.atcc_metadata.other_metadata.illumina_metadata.barcoding_kit')
+  new_df['illumina_library_kit'] = extended_or_none('attributes.atcc_metadata.other_metadata.illumina_metadata.library_kit')
+  new_df['illumina_sequencer'] = extended_or_none('attributes.atcc_metadata.other_metadata.illumina_metadata.sequencer')
+  new_df['illumina_basecalling_model'] = extended_or_none('attributes.atcc_metadata.other_metadata.illumina_metadata.basecaller_model')
+  new_df['illumina_basecalling_version'] = extended_or_none('attributes.atcc_metadata.other_metadata.illumina_metadata.basecaller_version')
+  new_df['nanopore_barcoding_kit'] = extended_or_none('attributes.atcc_metadata.other_metadata.ont_metadata.barcoding_kit')
+  new_df['nanopore_library_kit'] = extended_or_none('attributes.atcc_metadata.other_metadata.ont_metadata.library_kit')
+  new_df['nanopore_flowcell_type'] = extended_or_none('attributes.atcc_metadata.other_metadata.ont_metadata.flowcell_type')
+  new_df['nanopore_sequencer'] = extended_or_none('attributes.atcc_metadata.other_metadata.ont_metadata.sequencer')
+  new_df['nanopore_basecalling_model'] = extended_or_none('attributes.atcc_metadata.other_metadata.ont_metadata.basecaller_model')
+  new_df['nanopore_basecalling_version'] = extended_or_none('attributes.atcc_metadata.other_metadata.ont_metadata.basecaller_version')
+
+  try:
+    new_df['genome_page_creation'] = pd.to_datetime(df['created_at'], format='ISO8601').dt.strftime('%x %X')
+  except (ValueError, TypeError):
+    new_df['genome_page_creation'] = df['created_at'].map(lambda created_at: parse(created_at).strftime('%x %X'))
+  notes = df['attributes.atcc_metadata.notes'].astype(str).str.lower()
+  genome_assembled_by = pd.Series('OneCodex', index=df.index).mask(notes.str.contains('oatmeal|manual', regex=True), 'ATCC')
+  new_df['genome_assembled_by'] = genome_assembled_by
+  assembled_by_atcc = genome_assembled_by == 'ATCC'
   
-  new_df['atcc_lotnumber'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.catalog_details.ATCC_lot_number'] if row['extended_json_format'] else None, axis=1)
-  new_df['assembled_by'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.genome_provider.asssembled_by'] if row['extended_json_format'] else row['genome_assembled_by'], axis=1)
-  new_df['assembled_date'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.genome_provider.asssembly_date'] if row['extended_json_format'] else None, axis=1)
-  new_df['assembler_software'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.genome_provider.asssembler_software'] if row['extended_json_format'] else None, axis=1)
-  new_df['annotatated_by'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.genome_provider.annotatated_by'] if row['extended_json_format'] else row['genome_assembled_by'], axis=1)
-  new_df['annotations_date'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.genome_provider.annotations_date'] if row['extended_json_format'] else None, axis=1)
-  new_df['annotations_software'] = df.apply(lambda row: row['attributes.atcc_metadata.other_metadata.genome_provider.annotations_software'] if row['extended_json_format'] else None, axis=1)
-
-  new_df['genome_completeness'] = df.apply(lambda row: row['attributes.atcc_metadata.qc_statistics.assembly_quality_control.genome_completeness'] if row['genome_assembled_by'] == 'ATCC' 
-    else row['primary_assembly.attributes.qc_statistics.checkm_results.completeness'] if pd.notnull(row['primary_assembly.attributes.qc_statistics.checkm_results.completeness']) 
-    else row['primary_assembly.attributes.qc_statistics.virify_results.completeness'] if pd.notnull(row['primary_assembly.attributes.qc_statistics.virify_results.completeness']) else None, axis=1)
-  new_df['genome_contamination'] = df.apply(lambda row: row['attributes.atcc_metadata.qc_statistics.assembly_quality_control.genome_contamination'] if row['genome_assembled_by'] == 'ATCC' 
-    else row['primary_assembly.attributes.qc_statistics.checkm_results.contamination'] if pd.notnull(row['primary_assembly.attributes.qc_statistics.checkm_results.contamination']) else None, axis=1)
+  new_df['atcc_lotnumber'] = extended_or_none('attributes.atcc_metadata.other_metadata.catalog_details.ATCC_lot_number')
+  new_df['assembled_by'] = column('attributes.atcc_metadata.other_metadata.genome_provider.asssembled_by') if extended_json_format else genome_assembled_by
+  new_df['assembled_date'] = extended_or_none('attributes.atcc_metadata.other_metadata.genome_provider.asssembly_date')
+  new_df['assembler_software'] = extended_or_none('attributes.atcc_metadata.other_metadata.genome_provider.asssembler_software')
+  new_df['annotatated_by'] = column('attributes.atcc_metadata.other_metadata.genome_provider.annotatated_by') if extended_json_format else genome_assembled_by
+  new_df['annotations_date'] = extended_or_none('attributes.atcc_metadata.other_metadata.genome_provider.annotations_date')
+  new_df['annotations_software'] = extended_or_none('attributes.atcc_metadata.other_metadata.genome_provider.annotations_software')
+
+  checkm_completeness = column('primary_assembly.attributes.qc_statistics.checkm_results.completeness')
+  virify_completeness = column('primary_assembly.attributes.qc_statistics.virify_results.completeness')
+  genome_completeness = column('attributes.atcc_metadata.qc_statistics.assembly_quality_control.genome_completeness').where(assembled_by_atcc,
+    checkm_completeness.where(checkm_completeness.notnull(), virify_completeness))
+  onecodex_virology = (genome_assembled_by == 'OneCodex') & (new_df['collection'] == "ATCC Virology")
+  new_df['genome_completeness'] = (pd.to_numeric(genome_completeness, errors='coerce') * 100).where(onecodex_virology)
+  checkm_contamination = column('primary_assembly.attributes.qc_statistics.checkm_results.contamination')
+  new_df['genome_contamination'] = column('attributes.atcc_metadata.qc_statistics.assembly_quality_control.genome_contamination').where(assembled_by_atcc, checkm_contamination)
   
-  new_df['genome_completeness'] = new_df.apply(lambda row: (row['genome_completeness']*100) if (row['genome_assembled_by'] == 'OneCodex' and row['collection'] == "ATCC Virology") else None, axis=1)
-  new_df['illumina_depth'] = df.apply(lambda row: row['attributes.atcc_metadata.qc_statistics.assembly_quality_control.illumina_depth_of_coverage'] if 'attributes.atcc_metadata.qc_statistics.assembly_quality_control.illumina_depth_of_coverage' in df.columns else row['primary_assembly.attributes.qc_statistics.sequencing_statistics.illumina.depth.mean'], axis=1)
-  new_df['nanopore_depth'] = df.apply(lambda row: row['attributes.atcc_metadata.qc_statistics.assembly_quality_control.ont_depth_of_coverage'] if 'attributes.atcc_metadata.qc_statistics.assembly_quality_control.ont_depth_of_coverage' in df.columns else row['primary_assembly.attributes.qc_statistics.sequencing_statistics.ont.depth.mean'], axis=1)
+  new_df['illumina_depth'] = df['attributes.atcc_metadata.qc_statistics.assembly_quality_control.illumina_depth_of_coverage'] if 'attributes.atcc_metadata.qc_statistics.assembly_quality_control.illumina_depth_of_coverage' in df.columns else column('primary_assembly.attributes.qc_statistics.sequencing_statistics.illumina.depth.mean')
+  new_df['nanopore_depth'] = df['attributes.atcc_metadata.qc_statistics.assembly_quality_control.ont_depth_of_coverage'] if 'attributes.atcc_metadata.qc_statistics.assembly_quality_control.ont_depth_of_coverage' in df.columns else column('primary_assembly.attributes.qc_statistics.sequencing_statistics.ont.depth.mean')
   #AMR Sitecore Section
-  new_df['amr_intermediate'] = df.apply(lambda row: row['attributes.atcc_metadata.amr_intermediate'] if row['attributes.atcc_metadata.amr_intermediate'] != [] else None, axis=1)
-  new_df['amr_resistant'] = df.apply(lambda row: row['attributes.atcc_metadata.amr_resistant'] if row['attributes.atcc_metadata.amr_resistant'] != [] else None, axis=1)
-  new_df['amr_susceptible'] = df.apply(lambda row: row['attributes.atcc_metadata.amr_susceptible'] if row['attributes.atcc_metadata.amr_susceptible'] != [] else None, axis=1)
-  new_df['antibiotic_resistance'] = df.apply(lambda row: row['attributes.atcc_metadata.antibiotic_resistance'] if 'attributes.atcc_metadata.antibiotic_resistance' in row else None, axis=1)
-  new_df['antigenic_prop'] = df.apply(lambda row: row['attributes.atcc_metadata.antigenic_prop'] if 'attributes.atcc_metadata.antigenic_prop' in row else None, axis=1)
-  new_df['drug_repository'] = df.apply(lambda row: row['attributes.atcc_metadata.drug_repository'] if 'attributes.atcc_metadata.drug_repository' in row else None, axis=1)
-  new_df['genotype'] = df.apply(lambda row: row['attributes.atcc_metadata.genotype'] if 'attributes.atcc_metadata.genotype' in row else None, axis=1)
-  new_df['isolation_new_web'] = df.apply(lambda row: row['attributes.atcc_metadata.isolation_new_web'] if 'attributes.atcc_metadata.isolation_new_web' in row else None, axis=1)
-  new_df['biosafety_level'] = df.apply(lambda row: int(row['attributes.atcc_metadata.bsl']) if 'attributes.atcc_metadata.bsl' in row and pd.notnull(row['attributes.atcc_metadata.bsl']) else None, axis=1)
-  new_df['notes'] = df.apply(lambda row: row['attributes.atcc_metadata.notes'] if 'notes' in df.columns  else None, axis=1)
+  for amr_column in ['amr_intermediate', 'amr_resistant', 'amr_susceptible']:
+    values = column(f'attributes.atcc_metadata.{amr_column}')
+    new_df[amr_column] = values.mask(values.map(lambda value: isinstance(value, list) and not value), None)
+  new_df['antibiotic_resistance'] = column('attributes.atcc_metadata.antibiotic_resistance')
+  new_df['antigenic_prop'] = column('attributes.atcc_metadata.antigenic_prop')
+  new_df['drug_repository'] = column('attributes.atcc_metadata.drug_repository')
+  new_df['genotype'] = column('attributes.atcc_metadata.genotype')
+  new_df['isolation_new_web'] = column('attributes.atcc_metadata.isolation_new_web')
+  bsl = column('attributes.atcc_metadata.bsl')
+  new_df['biosafety_level'] = pd.to_numeric(bsl.where(bsl.isnull(), bsl.map(lambda level: int(level) if pd.notnull(level) else None)), errors='coerce')
+  new_df['notes'] = column('attributes.atcc_metadata.notes') if 'notes' in df.columns else empty
   #new_df['genome_page_creation']=new_df['genome_page_creation'].apply(pd.to_datetime)
   #new_df=new_df.sort_values(by='genome_page_creation',ascending=False)
-  
+
   return new_df
 
+
+## Columnar metadata store. The tabulate() table of the whole catalog is written as Parquet, sorted by collection and taxid
+## so that row-group min/max statistics let pyarrow skip most of the file for a filter, and only the requested columns are decoded.
+## pyarrow is optional: pip install genome_portal_api[parquet]
+metadata_table_row_group_size = 8192
+
+
+def _import_pyarrow():
+  try:
+    import pyarrow
+    import pyarrow.parquet
+  except ImportError:
+    raise ImportError("The columnar metadata store requires pyarrow. Install it with `pip install genome_portal_api[parquet]` or `pip install pyarrow`")
+  return pyarrow, pyarrow.parquet
+
+
+def _metadata_table_path(path=None):
+  return path or os.path.join(snapshot_settings["snapshot_dir"], "genomes.parquet")
+
+
+def _arrow_column(pa, values):
+  try:
+    return pa.array(values, from_pandas=True)
+  except (pa.ArrowInvalid, pa.ArrowTypeError):
+    # Fields holding mixed types (ex. numbers and strings) are stored as text
+    return pa.array(values.map(lambda value: json.dumps(value) if isinstance(value, (list, dict)) else None if pd.isnull(value) else str(value)), type=pa.string())
+
+
+def _catalog_fingerprint():
+  """Fingerprint of the catalog the default table is exported from: the loaded genome list, or else the metadata snapshot"""
+  genome_list = globals().get("global_genome_metadata")
+  if genome_list:
+    return _genome_list_fingerprint(genome_list)
+  manifest = _read_snapshot_manifest()
+  return manifest.get("fingerprint") if manifest else None
+
+
+def _metadata_table_is_current(pq, path):
+  """The default table is rebuilt whenever it was exported from other genomes, or other versions of them, than the catalog's"""
+  try:
+    metadata = pq.read_schema(path).metadata or {}
+  except (OSError, ValueError):
+    return False
+  fingerprint = _catalog_fingerprint()
+  return fingerprint is not None and metadata.get(b"genome_portal_api.source_fingerprint", b"").decode() == fingerprint
+
+
+def export_metadata_table(**kwargs):
+  """
+    export_metadata_table() is a function to write the tabulate() table of genome metadata to a columnar Parquet file and return its path.
+    Rows are sorted by collection and taxid and written in row groups, so query_metadata_table() only reads the parts of the file a filter can match. \n
+
+    --------- USAGE ---------
+    Optional arguments:
+    \t genome_list = [list] \n \t\t A list of genome metadata to export [(global_genome_metadata)]
+    \t path = [Path <str>] \n \t\t The Parquet file to write [(genomes.parquet in the snapshot directory)]
+    \t extra_fields = [list] \n \t\t Extra dotted JSON field paths to store as columns, see tabulate()
+  """
+  pa, pq = _import_pyarrow()
+  genome_list = kwargs['genome_list'] if 'genome_list' in kwargs else get_global_metadata()
+  if not genome_list:
+    logger.warning("There is no genome metadata to export! If this is an error, try resetting your API key and retry!")
+    return
+  path = _metadata_table_path(kwargs['path'] if 'path' in kwargs else None)
+  extra_fields = kwargs['extra_fields'] if 'extra_fields' in kwargs else None
+
+  df = tabulate(genome_list, extra_fields=extra_fields)
+  df = df.sort_values(['collection', 'taxid'], kind='stable').reset_index(drop=True)
+  table = pa.table({name: _arrow_column(pa, df[name]) for name in df.columns})
+  table = table.replace_schema_metadata({
+    "genome_portal_api.count": str(len(df)),
+    "genome_portal_api.exported_at": str(time.time()),
+    "genome_portal_api.source_fingerprint": _genome_list_fingerprint(genome_list),
+  })
+  os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+  pq.write_table(table, path + ".tmp", row_group_size=metadata_table_row_group_size, compression="zstd")
+  os.replace(path + ".tmp", path)
+  logger.info(f"Exported {len(df):,} genomes to the metadata table {path}")
+  return path
+
+
+def query_metadata_table(**kwargs):
+  """
+    query_metadata_table() is a function to filter the columnar metadata table without loading the whole catalog.
+    Filters are pushed down into the Parquet scan: row groups whose statistics cannot match are skipped, and only the requested columns are read.
+    The default table is exported from the catalog on first use, and again whenever the genomes in the catalog change. \n
+
+    --------- USAGE ---------
+    Optional arguments:
+    \t filters = [list] \n \t\t pyarrow filters on table columns, ex. [("collection", "==", "ATCC Bacteriology"), ("biosafety_level", "<=", 2)]
+    \t\t A list of such lists is OR'ed together. A pyarrow.compute expression is accepted as well. [(None) returns every genome]
+    \t columns = [list] \n \t\t The columns to return [(all)]
+    \t output = <str> \n \t\t The output format [(table) | arrow | id]
+    \t path = [Path <str>] \n \t\t The Parquet file to read [(genomes.parquet in the snapshot directory)]
+
+    EXAMPLES:
+    \t query_metadata_table(filters=[("collection", "==", "ATCC Bacteriology"), ("contig_count", "<", 5)]) returns a table of matching genomes
+    \t query_metadata_table(filters=[("taxid", "in", [562, 1280])], output="id") returns ["ATCC <product>:<genomeid>", ...]
+  """
+  pa, pq = _import_pyarrow()
+  kwarg_message="Whoops, make sure you are providing all the correct arguments and choices!"
+  filters = kwargs['filters'] if 'filters' in kwargs else None
+  columns = kwargs['columns'] if 'columns' in kwargs else None
+  output = kwargs['output'] if 'output' in kwargs else "table"
+  if output not in ['table', 'arrow', 'id']:
+    logger.warning(kwarg_message)
+    return
+  if 'path' in kwargs:
+    path = kwargs['path']
+  else:
+    path = _metadata_table_path()
+    if not _metadata_table_is_current(pq, path) and export_metadata_table(path=path) is None:
+      return
+  if output == "id":
+    columns = ['atcc_product_id', 'genome_id']
+  try:
+    table = pq.read_table(path, columns=columns, filters=filters)
+  except (pa.ArrowInvalid, pa.ArrowTypeError, KeyError, ValueError) as e:
+    logger.warning(f"{kwarg_message} {str(e).splitlines()[0]}")
+    return
+  if output == "arrow":
+    return table
+  if output == "id":
+    return [f"ATCC {product_id}:{genome_id}" for product_id, genome_id in zip(table.column('atcc_product_id').to_pylist(), table.column('genome_id').to_pylist())]
+  return table.to_pandas()
+
+
+## Structured queries over the tabulate() table of the catalog. The table is built once per genome list and keeps hash
+## indexes (value -> row positions) on the columns most selections start from, so "==" and "in" on those columns pick
+## rows directly, and every other predicate is evaluated as one vectorized mask over the whole column.
+query_indexed_columns = ['atcc_product_id', 'taxid', 'collection']
+_query_operators = ['==', '!=', '<=', '>=', '<', '>', 'not in', 'in', 'contains']
+_predicate_pattern = re.compile(r"^\s*([\w.]+)\s+(not in|in|contains)\s+(.+?)\s*$|^\s*([\w.]+)\s*(==|!=|<=|>=|<|>)\s*(.+?)\s*$")
+_genome_table = None
+
+
+def _count_antibiotics(value):
+  """Number of antibiotics in an amr_* field, which holds a list, a "|"-joined list in one entry, or a delimited string"""
+  if value is None:
+    return 0
+  if isinstance(value, list):
+    return len(value[0].split('|')) if len(value) == 1 and '|' in value[0] else len(value)
+  return len(value.split(',')) if ',' in value else len(value.split('|'))
+
+
+class _GenomeTable:
+  def __init__(self, genome_list):
+    self.source = genome_list
+    self.count = len(genome_list)
+    self.extra_fields = set()
+    self.table = tabulate(genome_list)
+    self.table['amr_resistant_count'] = self.table['amr_resistant'].map(_count_antibiotics)
+    # Columns every query returns. Dotted fields are added to the cached table as queries ask for them, but only returned by those queries
+    self.columns = list(self.table.columns)
+    self.indexes = {name: self.table.groupby(name, sort=False).indices for name in query_indexed_columns}
+
+  def is_current(self, genome_list):
+    return genome_list is self.source and len(genome_list) == self.count
+
+  def add_fields(self, fields):
+    """Add columns for dotted JSON paths that are not in the table yet, without rebuilding it"""
+    fields = {f for f in fields if "." in f and f not in self.table.columns and f not in self.extra_fields}
+    if not fields:
+      return
+    tree = _field_tree(fields)
+    extra = pd.DataFrame.from_records([flatten_fields(genome, tree) for genome in self.source])
+    extra.index = self.table.index
+    self.table = pd.concat([self.table, extra[[c for c in extra.columns if c not in self.table.columns]]], axis=1)
+    self.extra_fields |= fields
+
+  def mask(self, field, op, value):
+    """Boolean numpy mask of the rows matching one predicate. Missing values never match, except for "!=" and "not in" """
+    if field in self.indexes and op in ('==', 'in'):
+      index = self.indexes[field]
+      mask = np.zeros(self.count, dtype=bool)
+      for key in ([value] if op == '==' else value):
+        if key in index:
+          mask[index[key]] = True
+      return mask
+    column = self.table[field] if field in self.table.columns else pd.Series([None] * self.count, dtype=object)
+    if op == 'in' or op == 'not in':
+      mask = column.isin(list(value)).to_numpy()
+      return mask if op == 'in' else ~mask
+    if op == 'contains':
+      if pd.api.types.is_string_dtype(column) and not column.map(lambda v: isinstance(v, list)).any():
+        return column.str.contains(str(value), regex=False, na=False).to_numpy(dtype=bool)
+      return column.map(lambda v: isinstance(v, (str, list)) and value in v).to_numpy(dtype=bool)
+    compare = {'==': column.eq, '!=': column.ne, '<': column.lt, '<=': column.le, '>': column.gt, '>=': column.ge}[op]
+    return compare(value).fillna(op == '!=').to_numpy(dtype=bool)
+
+
+def _get_genome_table(genome_list, fields=()):
+  global _genome_table
+  with _deep_search_index_lock:
+    if _genome_table is None or not _genome_table.is_current(genome_list):
+      _genome_table = _GenomeTable(genome_list)
+    _genome_table.add_fields(fields)
+    return _genome_table
+
+
+def _parse_predicate(predicate):
+  """A (field, op, value) tuple, or a "field op value" string whose value is a Python literal or bare text"""
+  if isinstance(predicate, str):
+    match = _predicate_pattern.match(predicate)
+    if not match:
+      raise ValueError(f"Could not parse the predicate {predicate!r}")
+    field, op, value = [group for group in match.groups() if group is not None]
+    try:
+      value = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+      value = value.strip("'\"")
+  else:
+    field, op, value = predicate
+  op = op.strip().lower()
+  if op not in _query_operators:
+    raise ValueError(f"Unknown operator {op!r} in {predicate!r}. Choose from {', '.join(_query_operators)}")
+  if op in ('in', 'not in') and (isinstance(value, str) or not hasattr(value, '__iter__')):
+    value = [value]
+  return field, op, value
+
+
+def query_genomes(**kwargs):
+  if not kwargs:
+    print("""
+      query_genomes() is a function to select genomes from the catalog by their table fields, then sort and limit the selection.
+      Predicates are evaluated together as vectorized masks over a cached tabulate() table of the catalog, so repeated selections never re-tabulate it.
+      The table has an extra "amr_resistant_count" column, the number of antibiotics a genome is resistant to. \n
+
+      --------- USAGE ---------
+      Optional arguments:
+      \t where = [list] \n \t\t Predicates that must all hold, as "field op value" strings or (field, op, value) tuples.
+      \t\t Fields are tabulate() columns or dotted JSON paths, ops are == != < <= > >= in "not in" contains [(None) selects every genome]
+      \t sort_by = <str> | [list] \n \t\t Column(s) to sort the selection by [(catalog order)]
+      \t ascending = <bool> \n \t\t Sort direction [(True) | False]
+      \t limit = <int> \n \t\t Maximum number of genomes to return [(all)]
+      \t output = <str> \n \t\t The output format [(table) | json | id]
+      \t genome_list = [list] \n \t\t The genomes to query [(global_genome_metadata)]
+
+      EXAMPLES:
+      \t query_genomes(where=["biosafety_level == 2", "name contains 'Escherichia coli'"], sort_by="amr_resistant_count", ascending=False, limit=5)
+      \t query_genomes(where=[("collection", "in", {"ATCC Bacteriology", "ATCC Mycology"}), ("contig_count", "<", 5)], output="id")
+      \t query_genomes(where=["primary_assembly.attributes.qc_statistics.checkm_results.completeness >= 99"], output="json")
+    """)
+    return
+  kwarg_message="Whoops, make sure you are providing all the correct arguments and choices!"
+  empty_genomes="Your global_genome_metadata variable is empty! If this is an error, try resetting your API key and retry!"
+  where = kwargs['where'] if 'where' in kwargs else []
+  if isinstance(where, (str, tuple)):
+    where = [where]
+  sort_by = kwargs['sort_by'] if 'sort_by' in kwargs else None
+  sort_by = [sort_by] if isinstance(sort_by, str) else list(sort_by or [])
+  ascending = kwargs['ascending'] if 'ascending' in kwargs else True
+  limit = int(kwargs['limit']) if 'limit' in kwargs and kwargs['limit'] is not None else None
+  output = kwargs['output'] if 'output' in kwargs else "table"
+  if output not in ['table', 'json', 'id']:
+    logger.warning(kwarg_message)
+    return
+  try:
+    predicates = [_parse_predicate(predicate) for predicate in where]
+  except (ValueError, TypeError) as e:
+    logger.warning(f"{kwarg_message} {e}")
+    return
+
+  genome_list = kwargs['genome_list'] if 'genome_list' in kwargs else get_global_metadata()
+  if not genome_list:
+    logger.warning(empty_genomes)
+    return
+  fields = [field for field, _, _ in predicates] + sort_by
+  genome_table = _get_genome_table(genome_list, fields)
+  # A dotted path no genome has never gets a column (one that holds an object gets a column per nested field instead)
+  columns = genome_table.table.columns
+  unknown = [field for field in fields if field not in columns and not ("." in field and columns.str.startswith(field + ".").any())]
+  if unknown:
+    logger.warning(f"{kwarg_message} Unknown field(s): {', '.join(unknown)}. Choose from the tabulate() columns or a dotted JSON path found in the genomes")
+    return
+
+  mask = np.ones(genome_table.count, dtype=bool)
+  try:
+    for field, op, value in predicates:
+      mask &= genome_table.mask(field, op, value)
+  except TypeError as e:
+    logger.warning(f"{kwarg_message} {e}")
+    return
+  selection = genome_table.table[mask]
+  sort_by = [field for field in sort_by if field in selection.columns]
+  if sort_by:
+    selection = selection.sort_values(sort_by, ascending=ascending, kind='stable', na_position='last')
+  if limit is not None:
+    selection = selection.head(limit)
+  if output == "json":
+    return [genome_list[position] for position in selection.index]
+  if output == "id":
+    return [f"ATCC {product_id}:{genome_id}" for product_id, genome_id in zip(selection['atcc_product_id'], selection['genome_id'])]
+  extra_columns = [field for field in dict.fromkeys(fields) if field in selection.columns and field not in genome_table.columns]
+  return selection[genome_table.columns + extra_columns].copy()
+
 def retrieve_datasets_json(genome_id, apikey):
     """Retrieves jsons with datasets metadata """
     try:
-        cmd = f'curl -H "X-API-Key: {apikey}" https://genomes.atcc.org/api/genomes/{genome_id}/datasets 2> /dev/null'
-        result = subprocess.run(cmd, capture_output=True, shell=True)
-        data = json.loads(result.stdout)
+        data = _api_request("GET", f"/api/genomes/{genome_id}/datasets", apikey).json()
     except Exception as e:
         return ["error"]
     return(data)
@@ -924,15 +3743,378 @@ def download_methylation(**kwargs):
         if dataset_id == "none":
             return f"No methylation data for {genome_id} is available"
 
-        cmd = f'curl -H "X-API-Key: {apikey}" https://genomes.atcc.org/api/datasets/{dataset_id}/download 2> /dev/null'
-        result = subprocess.run(cmd, capture_output=True, shell=True) # this runs the command to return the json that contains the download_url
-        download_data = json.loads(result.stdout)
+        download_data = _api_request("GET", f"/api/datasets/{dataset_id}/download", apikey).json() # returns the json that contains the download_url
         filename = f"{genome_id}_methylation_data.zip"
         if file_path != "No file path provided":
             filename = f"{file_path}/{filename}"
-        
-        os.system(f"wget \"{download_data['url']}\" -O {filename}")
+
+        # Large zips resume from the partial file of an interrupted attempt, and are verified before they are renamed into place
+        refresh_url = _signed_url_refresher(f"/api/datasets/{dataset_id}/download", apikey)
+        if _resumable_download(download_data['url'], filename + ".part", refresh_url) is None:
+            return f"Ran into unexpected errors while attempting to download methylation data for {genome_id}"
+        os.replace(filename + ".part", filename)
+        print(f"SUCCESS! File: {filename} now exists!")
     except Exception as e:
         print(e)
         return f"Ran into unexpected errors while attempting to download methylation data for {genome_id}"
 
+
+bulk_download_functions = {
+  "assembly": download_assembly,
+  "annotations": download_annotations,
+  "metadata": download_metadata,
+}
+
+
+def _download_one(genome_id, kind, apikey, file_path, compress=False):
+  kwargs = {"id": genome_id, "api_key": apikey}
+  if kind == "assembly":
+    kwargs["output"] = "fasta" if file_path else "dict"
+  elif kind == "annotations":
+    kwargs["output"] = "gbk" if file_path else "dict"
+  if file_path and kind != "metadata":
+    kwargs["download_dir"] = file_path
+    kwargs["compress"] = compress
+  result = bulk_download_functions[kind](**kwargs)
+  if result is None:
+    raise emptyResultsError(f"No {kind} returned for {genome_id}, see the log above for details")
+  return result
+
+
+def download_genomes(**kwargs):
+  if "id_list" in kwargs:
+    id_list = kwargs['id_list']
+  else:
+    print("""
+      download_genomes() is a function to download the assemblies, annotations and/or metadata for many genomes at once.
+      Downloads run concurrently, and every genome is reported back with its results and any errors. \n
+
+      --------- USAGE ---------
+      Required arguments:
+      \t id_list = [list] \n \t\t A list of ATCC Genome IDs, or the "ATCC <product>:<genomeid>" strings returned by output="id" \n
+
+      Optional arguments:
+      \t data = [list] \n \t\t The data to download for each genome [(assembly, annotations, metadata)]
+      \t download_dir = [Path <str>] \n \t\t A directory to download fasta and GenBank files to. If not provided, data is returned in memory.
+      \t max_workers = <int> \n \t\t Number of downloads to run at the same time [(8)]
+      \t compress = <bool> \n \t\t With a download_dir, write bgzip-compressed fasta and GenBank files [True | (False) ]
+      \t api_key = <str> \n \t\t Your Genome Portal APIKey [(global_api_key) | overwrite if provided ] \n
+
+      EXAMPLES:
+      \t download_genomes(id_list=search_text(text='coli')) returns {"results": {id: {"assembly": ..., "annotations": ..., "metadata": ...}}, "errors": {id: {...}}}
+      \t download_genomes(id_list=ids, data=['assembly'], download_dir='/directory/for/download/', max_workers=16) downloads fasta files for every genome to provided path
+    """)
+    return
+
+  kwarg_message="Whoops, make sure you are providing all the correct arguments and choices!"
+
+  if "api_key" in kwargs:
+    apikey = kwargs['api_key']
+  else:
+    try:
+      apikey = global_api_key
+    except NameError:
+      apikey = get_global_apikey()
+  kinds = kwargs['data'] if 'data' in kwargs else list(bulk_download_functions)
+  if isinstance(kinds, str):
+    kinds = [kinds]
+  file_path = kwargs["download_dir"] if 'download_dir' in kwargs else False
+  max_workers = int(kwargs['max_workers']) if 'max_workers' in kwargs else 8
+  compress = bool(kwargs.get("compress", False))
+  if any(kind not in bulk_download_functions for kind in kinds) or max_workers < 1:
+    logger.warning(kwarg_message)
+    return
+
+  # Accept the "ATCC <product>:<genomeid>" strings returned by output="id"
+  genome_ids = list(dict.fromkeys(str(i).split(":")[-1].strip() for i in id_list))
+  results = {genome_id: {} for genome_id in genome_ids}
+  errors = {}
+  with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    futures = {
+      executor.submit(_download_one, genome_id, kind, apikey, file_path, compress): (genome_id, kind)
+      for genome_id in genome_ids for kind in kinds
+    }
+    for future in as_completed(futures):
+      genome_id, kind = futures[future]
+      try:
+        results[genome_id][kind] = future.result()
+      except Exception as e:
+        errors.setdefault(genome_id, {})[kind] = str(e)
+  results = {genome_id: data for genome_id, data in results.items() if genome_id not in errors or data}
+  logger.info(f"Downloaded {len(kinds)} data type(s) for {len(genome_ids) - len(errors):,} of {len(genome_ids):,} genomes without errors")
+  return {"results": results, "errors": errors}
+
+
+## Offline mode. With configure_offline(enabled=True), or ATCC_GENOME_PORTAL_OFFLINE=1 in the environment, nothing is sent to the portal.
+## Its API is answered by a transport adapter mounted on the shared session, from the snapshot directory (see configure_snapshot()):
+## the metadata snapshot, and in "files/" the assemblies, GenBank files and methylation zips written by build_offline_snapshot().
+## Every API function works unchanged, and output="dict" reads the snapshot's files in place. The directory is only ever read,
+## so any number of workers can share one copy of it.
+offline_settings = {
+  "enabled": os.environ.get("ATCC_GENOME_PORTAL_OFFLINE", "").lower() in ("1", "true", "yes"),
+}
+offline_page_size = 100
+offline_api_key = "offline"
+offline_search_fields = ["product_id", "taxon_name", "attributes.atcc_metadata.preferred_taxonomy_name"]
+_offline_catalog = None
+_offline_lock = threading.Lock()
+
+
+def configure_offline(**kwargs):
+  """
+    configure_offline() is a function used to switch offline mode on or off. In offline mode, every function reads from a snapshot
+    directory built with build_offline_snapshot() instead of the ATCC Genome Portal, ex. on compute nodes without network access. \n
+
+    --------- USAGE ---------
+    Optional arguments:
+    \t enabled = <bool> \n \t\t Serve every API call from the snapshot directory [(False) | True ], or set ATCC_GENOME_PORTAL_OFFLINE=1
+    \t snapshot_dir = [Path <str>] \n \t\t The snapshot directory, same as configure_snapshot(snapshot_dir=...) [($ATCC_GENOME_PORTAL_CACHE) | (~/.cache/genome_portal_api) ]
+  """
+  global _session, _offline_catalog
+  unknown = [k for k in kwargs if k not in offline_settings and k != "snapshot_dir"]
+  if unknown:
+    logger.warning(f"Unknown offline setting(s): {', '.join(unknown)}. Choose from {', '.join(list(offline_settings) + ['snapshot_dir'])}")
+    return
+  if "snapshot_dir" in kwargs:
+    configure_snapshot(snapshot_dir=kwargs.pop("snapshot_dir"))
+  offline_settings.update(kwargs)
+  _offline_catalog = None
+  invalidate_response_cache()
+  # The adapter is mounted (or not) when the next session is created
+  with _session_lock:
+    if _session is not None:
+      _session.close()
+    _session = None
+
+
+def _offline_files_dir():
+  return os.path.join(snapshot_settings["snapshot_dir"], "files")
+
+
+def _get_offline_catalog():
+  """The snapshot's genomes with lookups by ID and catalog number, loaded once and again only when the snapshot changes"""
+  global _offline_catalog
+  _, manifest_path = _snapshot_paths()
+  try:
+    version = (manifest_path, os.stat(manifest_path).st_mtime_ns)
+  except OSError:
+    version = None
+  with _offline_lock:
+    if _offline_catalog is None or _offline_catalog["version"] != version:
+      genomes = load_metadata_snapshot() if version else None
+      if genomes is None:
+        raise emptyResultsError(f"There is no metadata snapshot in {snapshot_settings['snapshot_dir']} to work offline from. Build one with build_offline_snapshot() where the portal can be reached.")
+      _offline_catalog = {
+        "version": version,
+        "genomes": genomes,
+        "by_id": {genome["id"]: genome for genome in genomes},
+        "by_product_id": {},
+        "search_text": None,
+      }
+      for genome in genomes:
+        _offline_catalog["by_product_id"].setdefault(_normalize_product_id(genome.get("product_id")), genome)
+    return _offline_catalog
+
+
+def _offline_search(catalog, text):
+  """Genomes with text in one of offline_search_fields, ignoring case"""
+  if catalog["search_text"] is None:
+    def field(genome, path):
+      for key in path.split("."):
+        genome = genome.get(key) if isinstance(genome, dict) else None
+      return "" if genome is None else str(genome)
+    catalog["search_text"] = ["\n".join(field(genome, path) for path in offline_search_fields).lower() for genome in catalog["genomes"]]
+  text = str(text).lower()
+  return [genome for genome, haystack in zip(catalog["genomes"], catalog["search_text"]) if text in haystack]
+
+
+def _offline_artifact(genome_id, kind):
+  """Path of a genome's assembly, annotations or methylation file in the snapshot, or None"""
+  files_dir = _offline_files_dir()
+  if kind == "methylation":
+    file_path = os.path.join(files_dir, f"{genome_id}_methylation_data.zip")
+    return file_path if os.path.isfile(file_path) else None
+  # The artifact manifests name the file. With several assembly versions, the newest download wins
+  newest = None
+  for manifest_path in glob.glob(os.path.join(glob.escape(files_dir), ".genome_portal_api", f"{glob.escape(genome_id)}.{kind}.*.json")):
+    try:
+      with open(manifest_path) as f:
+        manifest = json.load(f)
+    except (OSError, ValueError):
+      continue
+    file_path = os.path.join(files_dir, manifest["file_name"])
+    if manifest.get("kind") == kind and os.path.isfile(file_path) and (newest is None or manifest["downloaded_at"] > newest[0]):
+      newest = (manifest["downloaded_at"], file_path)
+  return newest[1] if newest else None
+
+
+class _OfflineAdapter(requests.adapters.BaseAdapter):
+  """Answers portal API requests, and the offline:// URLs it hands out for downloads, from the snapshot directory"""
+
+  def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+    url = requests.utils.urlparse(request.url)
+    try:
+      if url.scheme == "offline":
+        return self.file_response(request, os.path.join(_offline_files_dir(), requests.utils.unquote(os.path.basename(url.path))))
+      return self.api_response(request, url.path, parse_qs(url.query))
+    except emptyResultsError as e:
+      logger.critical(e.message)
+      return self.response(request, 404, {"message": e.message})
+
+  def close(self):
+    pass
+
+  def response(self, request, status, body=b"", headers=None, raw=None):
+    resp = requests.Response()
+    resp.status_code = status
+    resp.reason = http.client.responses.get(status, "")
+    resp.headers = requests.structures.CaseInsensitiveDict(headers or {})
+    if raw is None:
+      if not isinstance(body, bytes):
+        body = json.dumps(body).encode()
+        resp.headers["Content-Type"] = "application/json"
+      resp.headers["Content-Length"] = str(len(body))
+      raw = io.BytesIO(body)
+    resp.raw = raw
+    resp.encoding = "utf-8"
+    resp.url = request.url
+    resp.request = request
+    return resp
+
+  def api_response(self, request, path, query):
+    catalog = _get_offline_catalog()
+    page = int(query.get("page", ["1"])[0])
+    rows = slice((page - 1) * offline_page_size, page * offline_page_size)
+    if path == "/api/genomes":
+      total_pages = max(1, -(-len(catalog["genomes"]) // offline_page_size))
+      pagination_info = {"total": len(catalog["genomes"]), "total_pages": total_pages, "per_page": offline_page_size, "page": page,
+                         "next_page": page + 1 if page < total_pages else None}
+      return self.response(request, 200, catalog["genomes"][rows], {"X-Pagination": json.dumps(pagination_info)})
+    if path == "/api/genomes/search":
+      body = json.loads(request.body or b"{}")
+      if "product_id" in body:
+        genome = catalog["by_product_id"].get(_normalize_product_id(body["product_id"]))
+        return self.response(request, 200, [genome] if genome else [])
+      return self.response(request, 200, _offline_search(catalog, body.get("text", ""))[rows])
+
+    match = re.match(r"^/api/genomes/([^/]+)(?:/(\w+))?$", path)
+    if match and match.group(1) in catalog["by_id"]:
+      genome_id, action = match.groups()
+      if action is None:
+        return self.response(request, 200, catalog["by_id"][genome_id])
+      if action == "datasets":
+        return self.response(request, 200, [{"id": genome_id, "type": "epigenome"}] if _offline_artifact(genome_id, "methylation") else [])
+      if action in ("download_assembly", "download_annotations"):
+        kind = action.split("_")[1]
+        file_path = _offline_artifact(genome_id, kind)
+        if file_path is None:
+          message = f"Genome {genome_id} has no {kind} file in the offline snapshot {snapshot_settings['snapshot_dir']}"
+          logger.warning(message)
+          return self.response(request, 404, {"message": message})
+        file_name = os.path.basename(file_path)
+        return self.response(request, 200, {"url": f"offline://files/{requests.utils.quote(file_name)}", "save_as_filename": file_name})
+    match = re.match(r"^/api/datasets/([^/]+)/download$", path)
+    if match and _offline_artifact(match.group(1), "methylation"):
+      return self.response(request, 200, {"url": f"offline://files/{match.group(1)}_methylation_data.zip"})
+    return self.response(request, 404, {"message": "Not found."})
+
+  def file_response(self, request, file_path):
+    try:
+      f = open(file_path, "rb")
+    except OSError:
+      return self.response(request, 404, {"message": f"{os.path.basename(file_path)} is not in the offline snapshot"})
+    stat = os.fstat(f.fileno())
+    last_modified = formatdate(stat.st_mtime, usegmt=True)
+    headers = {"Content-Type": "application/octet-stream", "Accept-Ranges": "bytes", "Last-Modified": last_modified}
+    byte_range = re.match(r"^bytes=(\d+)-$", request.headers.get("Range", ""))
+    if byte_range and request.headers.get("If-Range") in (None, last_modified):
+      start = int(byte_range.group(1))
+      if start >= stat.st_size:
+        f.close()
+        return self.response(request, 416, b"", {"Content-Range": f"bytes */{stat.st_size}"})
+      f.seek(start)
+      headers.update({"Content-Length": str(stat.st_size - start), "Content-Range": f"bytes {start}-{stat.st_size - 1}/{stat.st_size}"})
+      return self.response(request, 206, headers=headers, raw=f)
+    headers["Content-Length"] = str(stat.st_size)
+    return self.response(request, 200, headers=headers, raw=f)
+
+
+def build_offline_snapshot(**kwargs):
+  """
+    build_offline_snapshot() is a function to download everything offline mode needs into the snapshot directory: the metadata of every genome,
+    and the assemblies, annotations and methylation data of the genomes in id_list. Run it where the portal can be reached, then copy or share
+    the directory and call configure_offline(enabled=True) where it cannot. Files already in the snapshot are not downloaded again. \n
+
+    --------- USAGE ---------
+    Optional arguments:
+    \t id_list = [list] \n \t\t ATCC Genome IDs, or the "ATCC <product>:<genomeid>" strings returned by output="id" [(every genome)]
+    \t data = [list] \n \t\t The files to download for each genome [(assembly, annotations, methylation)]
+    \t snapshot_dir = [Path <str>] \n \t\t The snapshot directory [(configure_snapshot() setting)]
+    \t max_workers = <int> \n \t\t Number of downloads to run at the same time [(8)]
+    \t api_key = <str> \n \t\t Your Genome Portal APIKey [(global_api_key) | overwrite if provided ] \n
+
+    EXAMPLES:
+    \t build_offline_snapshot(id_list=search_text(text='coli'), snapshot_dir='/shared/atcc_snapshot') metadata for every genome, files for E. coli
+    \t build_offline_snapshot(data=['assembly']) metadata and assemblies of every genome
+  """
+  kwarg_message="Whoops, make sure you are providing all the correct arguments and choices!"
+  if offline_settings["enabled"]:
+    logger.warning("build_offline_snapshot() downloads from the portal, switch offline mode off first with configure_offline(enabled=False)")
+    return
+  if "api_key" in kwargs:
+    apikey = kwargs['api_key']
+  else:
+    try:
+      apikey = global_api_key
+    except NameError:
+      apikey = get_global_apikey()
+  kinds = kwargs['data'] if 'data' in kwargs else ["assembly", "annotations", "methylation"]
+  if isinstance(kinds, str):
+    kinds = [kinds]
+  max_workers = int(kwargs['max_workers']) if 'max_workers' in kwargs else 8
+  if any(kind not in ("assembly", "annotations", "methylation") for kind in kinds) or max_workers < 1:
+    logger.warning(kwarg_message)
+    return
+  if 'snapshot_dir' in kwargs:
+    configure_snapshot(snapshot_dir=kwargs['snapshot_dir'])
+
+  genomes = refresh_metadata_snapshot(api_key=apikey, max_workers=max_workers)
+  if not genomes:
+    return
+  id_list = kwargs['id_list'] if 'id_list' in kwargs else [genome["id"] for genome in genomes]
+  genome_ids = list(dict.fromkeys(str(i).split(":")[-1].strip() for i in id_list))
+  files_dir = _offline_files_dir()
+  os.makedirs(files_dir, exist_ok=True)
+
+  downloaded = {"results": {genome_id: {} for genome_id in genome_ids}, "errors": {}}
+  file_kinds = [kind for kind in kinds if kind != "methylation"]
+  if file_kinds:
+    downloaded = download_genomes(id_list=genome_ids, data=file_kinds, download_dir=files_dir, max_workers=max_workers, api_key=apikey)
+    # Offline readers open assemblies with IndexedFasta, write their .fai now in case the snapshot is shared read-only
+    for results in downloaded["results"].values():
+      if results.get("assembly"):
+        _load_or_build_fai(results["assembly"])
+      if results.get("annotations"):
+        _load_or_build_feature_index(results["annotations"])
+  if "methylation" in kinds:
+    def methylation(genome_id):
+      if _offline_artifact(genome_id, "methylation"):
+        return _offline_artifact(genome_id, "methylation")
+      message = download_methylation(id=genome_id, download_dir=files_dir, api_key=apikey)
+      if message and "unexpected errors" in message:
+        raise emptyResultsError(message)
+      return _offline_artifact(genome_id, "methylation")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+      futures = {executor.submit(methylation, genome_id): genome_id for genome_id in genome_ids}
+      for future in as_completed(futures):
+        genome_id = futures[future]
+        try:
+          file_path = future.result()
+        except Exception as e:
+          downloaded["errors"].setdefault(genome_id, {})["methylation"] = str(e)
+          continue
+        if file_path:
+          downloaded["results"].setdefault(genome_id, {})["methylation"] = file_path
+  logger.info(f"The offline snapshot in {snapshot_settings['snapshot_dir']} holds the metadata of {len(genomes):,} genomes, and files for {len(genome_ids) - len(downloaded['errors']):,} of {len(genome_ids):,} genomes without errors")
+  return downloaded
+
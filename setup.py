@@ -24,7 +24,8 @@ setup(
     keywords="core package",
     license="https://www.atcc.org/policies/product-use-policies/data-use-agreement",
     packages=["genome_portal_api"],
-    install_requires=["fuzzywuzzy>=0.18.0","python-Levenshtein>=0.12.2", "requests>=2.31.0", "argparse>=1.1", 'pandas>=2.0.3'],
+    install_requires=["fuzzywuzzy>=0.18.0","python-Levenshtein>=0.12.2", "requests>=2.31.0", "argparse>=1.1", 'pandas>=2.0.3', "numpy>=1.22"],
+    extras_require={"fast": ["rapidfuzz>=3.0"], "parquet": ["pyarrow>=12.0"]},
     include_package_data=True,
 
 )
@@ -0,0 +1,45 @@
+import os
+import sys
+
+import pytest
+
+import genome_portal_api.genome_portal_api as module
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from mock_portal import MockPortal, serve
+
+
+@pytest.fixture
+def portal():
+  """A mock portal serving 120 synthetic genomes in pages of 50, with small files"""
+  portal = MockPortal(genomes=120, page_size=50, contig_scale=0.001)
+  server = serve(portal)
+  portal.server = server
+  portal.url = f"http://127.0.0.1:{server.server_address[1]}"
+  yield portal
+  server.shutdown()
+  server.server_close()
+
+
+def swap_catalog(portal, genomes=None, page_size=None):
+  """Serve another catalog from the same address, returns the new MockPortal"""
+  replacement = MockPortal(genomes=portal.genomes if genomes is None else genomes, page_size=page_size or portal.page_size, contig_scale=portal.contig_scale)
+  replacement.server, replacement.url = portal.server, portal.url
+  portal.server.RequestHandlerClass.portal = replacement
+  return replacement
+
+
+@pytest.fixture
+def gpa(portal, tmp_path, monkeypatch):
+  """The module pointed at the mock portal with an empty snapshot directory. Every setting is restored afterwards"""
+  monkeypatch.setitem(module.transport_settings, "base_url", portal.url)
+  monkeypatch.setitem(module.snapshot_settings, "snapshot_dir", str(tmp_path / "snapshot"))
+  monkeypatch.setitem(module.offline_settings, "enabled", False)
+  monkeypatch.setattr(module, "global_api_key", "test-key", raising=False)
+  monkeypatch.delattr(module, "global_genome_metadata", raising=False)
+  monkeypatch.setattr(module, "_search_page_size", None)
+  module.invalidate_response_cache()
+  module.configure_transport()
+  yield module
+  module.invalidate_response_cache()
+  module.configure_transport()
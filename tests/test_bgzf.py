@@ -0,0 +1,102 @@
+import bisect
+import gzip
+import os
+import random
+import struct
+
+import pytest
+
+import genome_portal_api.genome_portal_api as module
+from synthetic import genome_id
+
+
+def make_fasta(rng, width=60):
+  records, out = {}, []
+  for number, length in enumerate([150_000, 61, 60, 1, 90_000]):
+    name = f"contig_{number + 1}"
+    records[name] = "".join(rng.choices("ACGTN", weights=[30, 20, 20, 29, 1], k=length))
+    out.append(f">{name} description\n")
+    out.extend(records[name][i:i + width] + "\n" for i in range(0, length, width))
+  return records, "".join(out).encode()
+
+
+def write_bgzf(path, data, threads, rng):
+  with open(path, "wb") as f:
+    writer = module._BgzfWriter(f, level=6, threads=threads)
+    position = 0
+    while position < len(data):
+      size = rng.choice([1, 100, 4096, 70_000])
+      writer.write(data[position:position + size])
+      position += size
+    writer.close()
+    f.write(module._bgzf_eof)
+
+
+def read_gzi(path):
+  with open(path, "rb") as f:
+    count, = struct.unpack("<Q", f.read(8))
+    return [(0, 0)] + [struct.unpack("<2Q", f.read(16)) for _ in range(count)]
+
+
+def read_bases(path, blocks, record, start, end):
+  """Bases start to end (0-based, exclusive) of a record, seeking to their block through the .gzi index as samtools does"""
+  _, length, offset, linebases, linewidth = record
+  first = offset + start // linebases * linewidth + start % linebases
+  last = offset + (end - 1) // linebases * linewidth + (end - 1) % linebases
+  compressed, uncompressed = blocks[bisect.bisect_right([u for _, u in blocks], first) - 1]
+  with open(path, "rb") as f:
+    f.seek(compressed)
+    with gzip.GzipFile(fileobj=f) as reader:
+      reader.read(first - uncompressed)
+      return reader.read(last - first + 1).replace(b"\n", b"").decode()
+
+
+@pytest.mark.parametrize("threads", [1, 3])
+def test_round_trip_and_random_access(tmp_path, threads):
+  rng = random.Random(threads)
+  records, data = make_fasta(rng)
+  path = str(tmp_path / "assembly.fasta.gz")
+  write_bgzf(path, data, threads, rng)
+  assert gzip.decompress(open(path, "rb").read()) == data
+  blocks, size = module._bgzf_blocks(path)
+  assert size == len(data)
+  assert len(blocks) == -(-len(data) // module._bgzf_block_size) + 1  # and the empty EOF block
+  module._write_gzi(path)
+  assert read_gzi(path + ".gzi") == blocks
+  fai = {record[0]: record for record in module._load_or_build_fai(path)}
+  assert {name: record[1] for name, record in fai.items()} == {name: len(sequence) for name, sequence in records.items()}
+  for _ in range(300):
+    name = rng.choice(list(records))
+    start = rng.randrange(len(records[name]))
+    end = rng.randint(start + 1, min(len(records[name]), start + 70_000))
+    assert read_bases(path, blocks, fai[name], start, end) == records[name][start:end]
+
+
+def test_a_torn_block_is_cut_off_and_writing_continues(tmp_path):
+  rng = random.Random(7)
+  _, data = make_fasta(rng)
+  path = str(tmp_path / "assembly.fasta.gz.part")
+  half = len(data) // 2
+  with open(path, "wb") as f:
+    writer = module._BgzfWriter(f)
+    writer.write(data[:half])
+    writer.close()
+  complete = os.path.getsize(path)
+  with open(path, "ab") as f:
+    f.write(module._bgzf_block(data[half:half + 5000], 6)[:-100])
+  assert module._bgzf_blocks(path, truncate=True)[1] == half
+  assert os.path.getsize(path) == complete
+  with open(path, "ab") as f:
+    writer = module._BgzfWriter(f)
+    writer.write(data[half:])
+    writer.close()
+    f.write(module._bgzf_eof)
+  assert gzip.decompress(open(path, "rb").read()) == data
+
+
+def test_compressed_assembly_downloads(gpa, portal, tmp_path):
+  file_path = gpa.download_assembly(id=genome_id(1), output="fasta", download_dir=str(tmp_path), compress=True)
+  assert file_path.endswith(".fasta.gz")
+  assert gzip.decompress(open(file_path, "rb").read()) == portal.fasta(1)
+  assert read_gzi(file_path + ".gzi") == module._bgzf_blocks(file_path)[0]
+  assert os.path.isfile(file_path + ".fai")
@@ -0,0 +1,91 @@
+import os
+import random
+
+import pytest
+
+from genome_portal_api import FeatureIndex, iter_genbank_features
+from genome_portal_api.genome_portal_api import feature_index_suffix
+from mock_portal import MockPortal
+
+EXTRA = """\
+LOCUS       split_contig             4000 bp    DNA     circular BCT 30-APR-2024
+FEATURES             Location/Qualifiers
+     source          1..4000
+     CDS             complement(join(3900..4000,1..50))
+                     /locus_tag="wraps_origin"
+     gene            100..2000
+                     /locus_tag="long_gene"
+     CDS             join(300..400,1500..1600)
+                     /locus_tag="spliced"
+     tRNA            450
+                     /locus_tag="single_base"
+ORIGIN
+//
+"""
+
+
+@pytest.fixture
+def genbank_path(tmp_path):
+  path = tmp_path / "annotations.gbk"
+  path.write_bytes(MockPortal(genomes=3, contig_scale=0.02).genbank(2) + EXTRA.encode())
+  return str(path)
+
+
+def key(feature):
+  return (feature.contig, feature.type, feature.location, feature.locus_tag)
+
+
+def distance(feature, position):
+  return min(0 if low <= position <= high else min(abs(low - position), abs(position - high)) for low, high in ((min(p), max(p)) for p in feature.parts))
+
+
+def test_queries_match_a_brute_force_scan(genbank_path):
+  features = [f for f in iter_genbank_features(genbank_path) if f.type != "source"]
+  index = FeatureIndex(genbank_path)
+  assert len(index) == len(features)
+  rng = random.Random(0)
+  for contig in index.contigs:
+    on_contig = [f for f in features if f.contig == contig]
+    length = max(f.end for f in on_contig) + 100
+    for _ in range(200):
+      start = rng.randint(1, length)
+      end = start + rng.choice([0, 10, 500, 5000])
+      for feature_types in (None, ["CDS"]):
+        candidates = [f for f in on_contig if feature_types is None or f.type in feature_types]
+        expected = sorted(key(f) for f in candidates if any(min(p) <= end and max(p) >= start for p in f.parts))
+        hits = index.overlap(contig, start, end, feature_types=feature_types)
+        assert sorted(key(f) for f in hits) == expected
+        feature, bases = index.nearest(contig, start, feature_types=feature_types)
+        assert bases == min(distance(f, start) for f in candidates)
+        assert distance(feature, start) == bases
+
+
+def test_split_features(genbank_path):
+  index = FeatureIndex(genbank_path)
+  assert [f.locus_tag for f in index.overlap("split_contig", 3950)] == ["wraps_origin"]
+  assert [f.locus_tag for f in index.overlap("split_contig", 10)] == ["wraps_origin"]
+  assert [f.locus_tag for f in index.overlap("split_contig", 1000)] == ["long_gene"]
+  assert [f.locus_tag for f in index.overlap("split_contig", 350, 460)] == ["long_gene", "spliced", "single_base"]
+  assert index.nearest("split_contig", 1000, feature_types=["CDS"])[1] == 500
+  assert index.nearest("split_contig", 2500, feature_types=["tRNA"])[1] == 2050
+  with pytest.raises(KeyError):
+    index.overlap("no_such_contig", 1)
+
+
+def test_a_stale_index_is_rebuilt(genbank_path):
+  assert len(FeatureIndex(genbank_path).overlap("split_contig", 1000)) == 1
+  assert os.path.isfile(genbank_path + feature_index_suffix)
+  stat = os.stat(genbank_path + feature_index_suffix)
+  os.utime(genbank_path + feature_index_suffix, ns=(stat.st_atime_ns, stat.st_mtime_ns - 10**10))
+  with open(genbank_path, "a") as f:
+    f.write(EXTRA.replace("split_contig", "appended_contig"))
+  index = FeatureIndex(genbank_path)
+  assert "appended_contig" in index.contigs
+  assert os.path.getmtime(genbank_path + feature_index_suffix) >= os.path.getmtime(genbank_path)
+
+
+def test_an_unreadable_index_is_rebuilt(genbank_path):
+  expected = len(FeatureIndex(genbank_path))
+  with open(genbank_path + feature_index_suffix, "wb") as f:
+    f.write(b"not an npz file")
+  assert len(FeatureIndex(genbank_path)) == expected
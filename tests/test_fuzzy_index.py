@@ -0,0 +1,14 @@
+import pytest
+from fuzzywuzzy import fuzz
+
+from genome_portal_api.genome_portal_api import _FuzzyIndex, rapid_process
+
+
+@pytest.mark.skipif(rapid_process is None, reason="rapidfuzz is not installed")
+@pytest.mark.parametrize("cutoff", [74, 75])
+def test_half_scores_round_like_fuzz_ratio(cutoff):
+  # 298 of 400 characters match: 74.5, which fuzz.ratio() rounds half to even, to 74
+  query, string = "a" * 149 + "b" * 51, "a" * 149 + "c" * 51
+  assert fuzz.ratio(query, string) == 74
+  scores = [score for _, _, score in _FuzzyIndex([{"sequence": string}])._score([query], cutoff)]
+  assert scores == ([74] if cutoff == 74 else [])
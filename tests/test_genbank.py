@@ -0,0 +1,69 @@
+import gzip
+
+from genome_portal_api import iter_genbank_features
+
+GENBANK = """\
+LOCUS       contig_1                3000 bp    DNA     circular BCT 30-APR-2024
+DEFINITION  Escherichia coli ATCC BAA-1, contig 1.
+FEATURES             Location/Qualifiers
+     source          1..3000
+                     /organism="Escherichia coli"
+     gene            complement(join(2500..3000,1..120))
+                     /locus_tag="tag_1"
+                     /gene="blaTEM"
+     CDS             complement(join(2500..3000,
+                     1..120))
+                     /locus_tag="tag_1"
+                     /gene="blaTEM"
+                     /product="beta-lactamase with a description that
+                     runs over two lines"
+                     /note="first note"
+                     /note="a note with a ""quoted"" word"
+                     /pseudo
+                     /translation="MSIQHFRVALIPFFAAFCLPVFA
+                     HPETLVKVKDAEDQ"
+     misc_feature    join(200..300,NZ_CP000001.1:5..10)
+                     /note="a join across records"
+ORIGIN
+        1 acgtacgtac gtacgtacgt
+//
+LOCUS       contig_2                 900 bp    DNA     linear   BCT 30-APR-2024
+FEATURES             Location/Qualifiers
+     tRNA            <10..>80
+                     /product="tRNA-Ala"
+     rRNA            complement(400..800)
+                     /product="16S ribosomal RNA"
+ORIGIN
+        1 acgtacgtac gtacgtacgt
+//
+"""
+
+
+def test_locations_and_qualifiers():
+  features = list(iter_genbank_features(GENBANK.splitlines(keepends=True)))
+  assert [(f.contig, f.type) for f in features] == [
+    ("contig_1", "source"), ("contig_1", "gene"), ("contig_1", "CDS"), ("contig_1", "misc_feature"), ("contig_2", "tRNA"), ("contig_2", "rRNA")]
+  gene, cds = features[1], features[2]
+  assert cds.location == gene.location == "complement(join(2500..3000,1..120))"
+  assert (cds.start, cds.end, cds.strand, cds.parts) == (1, 3000, -1, ((2500, 3000), (1, 120)))
+  assert (cds.locus_tag, cds.gene) == ("tag_1", "blaTEM")
+  assert cds.product == "beta-lactamase with a description that runs over two lines"
+  assert cds.qualifiers["note"] == ["first note", 'a note with a "quoted" word']
+  assert cds.qualifiers["pseudo"] is True
+  assert "translation" not in cds.qualifiers
+  assert features[3].parts == ((200, 300), (5, 10))
+  assert (features[4].start, features[4].end, features[4].strand) == (10, 80, 1)
+  assert (features[5].start, features[5].end, features[5].strand) == (400, 800, -1)
+
+
+def test_translations_and_feature_types():
+  [cds] = iter_genbank_features(GENBANK.splitlines(keepends=True), feature_types=["CDS"], keep_translation=True)
+  assert cds.qualifiers["translation"] == "MSIQHFRVALIPFFAAFCLPVFAHPETLVKVKDAEDQ"
+  assert [f.type for f in iter_genbank_features(GENBANK.splitlines(keepends=True), feature_types=["rRNA", "tRNA"])] == ["tRNA", "rRNA"]
+
+
+def test_gzipped_files_and_windows_line_endings(tmp_path):
+  path = tmp_path / "annotations.gbk.gz"
+  with gzip.open(path, "wt", newline="\r\n") as f:
+    f.write(GENBANK)
+  assert list(iter_genbank_features(str(path))) == list(iter_genbank_features(GENBANK.splitlines(keepends=True)))
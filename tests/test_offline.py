@@ -0,0 +1,26 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+from synthetic import genome_id
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_offline_calls_need_no_api_key(gpa, portal, tmp_path):
+  gpa.build_offline_snapshot(id_list=[genome_id(0)], data=["assembly"], max_workers=2)
+  (tmp_path / "out").mkdir()
+  env = {name: value for name, value in os.environ.items() if name != "ATCC_GENOME_PORTAL_API_KEY"}
+  env.update({"ATCC_GENOME_PORTAL_OFFLINE": "1", "ATCC_GENOME_PORTAL_CACHE": gpa.snapshot_settings["snapshot_dir"], "PYTHONPATH": ROOT})
+  script = textwrap.dedent(f"""
+    import genome_portal_api as gpa
+    gpa.configure_transport(base_url={portal.url!r})
+    assembly = gpa.download_assembly(id={genome_id(0)!r}, output='fasta', download_dir={str(tmp_path / 'out')!r})
+    print(open(assembly).read(1))
+  """)
+  # stdin is /dev/null, as on a batch node: a prompt for the key would fail with EOFError
+  result = subprocess.run([sys.executable, "-c", script], env=env, stdin=subprocess.DEVNULL, capture_output=True, text=True, timeout=60)
+  assert result.returncode == 0, result.stderr
+  assert result.stdout.splitlines()[-1] == ">"
+  assert "Please enter the API key" not in result.stdout
@@ -0,0 +1,59 @@
+import random
+from collections import Counter
+
+import pytest
+
+from genome_portal_api import PackedSequence
+
+complement = str.maketrans("ACGTRYKMBVDHSWNacgtrykmbvdhswn", "TGCAYRMKVBHDSWNtgcayrmkvbhdswn")
+
+
+def expected_counts(sequence):
+  counts = Counter(sequence.upper())
+  return {base: counts.get(base, 0) for base in "ACGT"} | {base: count for base, count in counts.items() if base not in "ACGT"}
+
+
+def random_sequence(rng, length):
+  bases = []
+  while len(bases) < length:
+    roll = rng.random()
+    if roll < 0.05:
+      bases += "N" * rng.randint(1, 12)
+    elif roll < 0.1:
+      bases += "".join(rng.choice("acgtn") for _ in range(rng.randint(1, 12)))
+    elif roll < 0.12:
+      bases.append(rng.choice("RYKMSWBDHV"))
+    else:
+      bases.append(rng.choice("ACGT"))
+  return "".join(bases[:length])
+
+
+def test_reverse_complement_keeps_base_counts():
+  sequence = PackedSequence.from_bytes("ACGTNNAC").reverse_complement()
+  assert str(sequence) == "GTNNACGT"
+  assert sequence.base_counts() == {"A": 1, "C": 1, "G": 2, "T": 2, "N": 2}
+  assert sequence.gc_content() == 0.5
+
+
+@pytest.mark.parametrize("end", [1, 2, 3, 5, 7])
+def test_aligned_slice_counts_only_its_bases(end):
+  sequence = PackedSequence.from_bytes("ACGTTTAC")[0:end]
+  assert sequence.base_counts() == expected_counts("ACGTTTAC"[:end])
+
+
+def test_round_trips_match_str():
+  rng = random.Random(1)
+  for _ in range(300):
+    text = random_sequence(rng, rng.randint(0, 300))
+    sequence = PackedSequence.from_bytes(text)
+    start, end = sorted(rng.randint(0, len(text)) for _ in range(2))
+    assert str(sequence) == text
+    assert str(sequence[start:end]) == text[start:end]
+    for derived, derived_text in [
+      (sequence.reverse_complement(), text.translate(complement)[::-1]),
+      (sequence[start:end], text[start:end]),
+      (sequence[start:end].reverse_complement(), text[start:end].translate(complement)[::-1]),
+      (sequence.reverse_complement()[start:end], text.translate(complement)[::-1][start:end]),
+    ]:
+      assert str(derived) == derived_text
+      assert derived.base_counts() == expected_counts(derived_text)
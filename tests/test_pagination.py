@@ -0,0 +1,29 @@
+import requests
+
+
+def spy_requests(monkeypatch):
+  """Record the auth and headers of every request sent through a session"""
+  sent = []
+  request = requests.Session.request
+
+  def spy(self, method, url, **kwargs):
+    sent.append((url, kwargs.get("auth"), dict(kwargs.get("headers") or {})))
+    return request(self, method, url, **kwargs)
+
+  monkeypatch.setattr(requests.Session, "request", spy)
+  return sent
+
+
+def test_catalog_pages_authenticate_with_basic_auth(gpa, portal, monkeypatch):
+  sent = spy_requests(monkeypatch)
+  assert len(list(gpa.get_genomes("test-key", max_workers=2))) == 120
+  assert len(sent) == 3
+  for _, auth, headers in sent:
+    assert auth == ("test-key", "")
+    assert "X-API-Key" not in headers
+
+
+def test_other_endpoints_send_the_key_in_a_header(gpa, portal, monkeypatch):
+  sent = spy_requests(monkeypatch)
+  gpa.search_product(product_id="BAA-7")
+  assert [(auth, headers.get("X-API-Key")) for _, auth, headers in sent] == [(None, "test-key")]
@@ -0,0 +1,25 @@
+from genome_portal_api import query_genomes
+from synthetic import make_catalog
+
+completeness = "primary_assembly.attributes.qc_statistics.checkm_results.completeness"
+contamination = "primary_assembly.attributes.qc_statistics.checkm_results.contamination"
+
+
+def test_tables_only_hold_the_fields_of_their_own_query():
+  genomes = make_catalog(60)
+  first = query_genomes(where=[f"{completeness} >= 95"], genome_list=genomes)
+  assert completeness in first.columns
+  assert (first[completeness] >= 95).all()
+  second = query_genomes(where=["biosafety_level == 2"], sort_by=contamination, genome_list=genomes)
+  assert completeness not in second.columns
+  assert list(second.columns[-1:]) == [contamination]
+  third = query_genomes(where=["biosafety_level == 2"], genome_list=genomes)
+  assert list(third.columns) == list(second.columns[:-1])
+  assert third.columns[-1] == "amr_resistant_count"
+
+
+def test_dotted_paths_missing_from_every_genome_are_reported(caplog):
+  genomes = make_catalog(20)
+  assert query_genomes(where=["no.such.path == 1"], genome_list=genomes) is None
+  assert "Unknown field(s): no.such.path" in caplog.text
+  assert len(query_genomes(where=["attributes.atcc_metadata.bsl == 2"], genome_list=genomes)) == 7
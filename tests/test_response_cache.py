@@ -0,0 +1,147 @@
+import threading
+import time
+
+import pytest
+
+import genome_portal_api.genome_portal_api as module
+
+
+class Clock:
+  """Stands in for the time module, with a monotonic() clock the test moves forward"""
+
+  def __init__(self):
+    self.now = 1000.0
+
+  def monotonic(self):
+    return self.now
+
+  def __getattr__(self, name):
+    return getattr(time, name)
+
+
+class Response:
+  def __init__(self, text="[]", status_code=200):
+    self.text = text
+    self.status_code = status_code
+
+
+@pytest.fixture
+def clock(monkeypatch):
+  clock = Clock()
+  monkeypatch.setattr(module, "time", clock)
+  return clock
+
+
+@pytest.fixture
+def cache(monkeypatch):
+  monkeypatch.setitem(module.response_cache_settings, "ttl", 10)
+  monkeypatch.setitem(module.response_cache_settings, "max_entries", 2)
+  return module._ResponseCache()
+
+
+def key(name):
+  return ("GET", f"https://genomes.atcc.org/api/genomes/{name}", "key", "null", "null")
+
+
+def counting_fetch(calls, text="[]", status_code=200):
+  def fetch():
+    calls.append(text)
+    return Response(text, status_code)
+  return fetch
+
+
+def test_entries_expire_after_the_ttl(cache, clock):
+  calls = []
+  first = cache.get(key("a"), counting_fetch(calls))
+  clock.now += 9.9
+  assert cache.get(key("a"), counting_fetch(calls)) is first
+  clock.now += 0.2
+  assert cache.get(key("a"), counting_fetch(calls)) is not first
+  assert len(calls) == 2
+  assert (cache.stats["hits"], cache.stats["misses"], cache.stats["expired"]) == (1, 2, 1)
+
+
+def test_the_least_recently_used_entry_is_evicted(cache, clock):
+  calls = []
+  for name in ["a", "b", "a", "c"]:
+    cache.get(key(name), counting_fetch(calls, name))
+  assert calls == ["a", "b", "c"]
+  assert list(cache.entries) == [key("a"), key("c")]
+  assert cache.stats["evictions"] == 1
+  cache.get(key("b"), counting_fetch(calls, "b"))
+  assert list(cache.entries) == [key("c"), key("b")]
+
+
+def test_failures_are_not_cached(cache, clock):
+  calls = []
+  cache.get(key("a"), counting_fetch(calls, status_code=500))
+  cache.get(key("a"), counting_fetch(calls, text="API access to the ATCC Genome Portal requires a supporting membership."))
+  cache.get(key("a"), counting_fetch(calls))
+  assert len(calls) == 3
+  assert len(cache.entries) == 1
+
+
+def fetch_in_threads(cache, fetch, threads=4):
+  results = [None] * threads
+
+  def get(position):
+    try:
+      results[position] = cache.get(key("a"), fetch)
+    except Exception as e:
+      results[position] = e
+
+  workers = [threading.Thread(target=get, args=(position,)) for position in range(threads)]
+  for worker in workers:
+    worker.start()
+  return workers, results
+
+
+def wait_for_waiters(cache, count):
+  for _ in range(500):
+    if cache.stats["coalesced"] == count:
+      return
+    time.sleep(0.01)
+  raise AssertionError(f"{cache.stats['coalesced']} requests are waiting, expected {count}")
+
+
+def test_identical_requests_in_flight_are_coalesced(cache, clock):
+  calls, release = [], threading.Event()
+
+  def slow_fetch():
+    calls.append(1)
+    release.wait(5)
+    return Response()
+
+  workers, results = fetch_in_threads(cache, slow_fetch)
+  wait_for_waiters(cache, 3)
+  release.set()
+  for worker in workers:
+    worker.join(5)
+  assert len(calls) == 1
+  assert all(result is results[0] for result in results)
+  assert not cache.in_flight
+
+
+def test_waiters_see_the_error_of_the_request_they_waited_for(cache, clock):
+  release = threading.Event()
+
+  def failing_fetch():
+    release.wait(5)
+    raise ConnectionError("portal unreachable")
+
+  workers, results = fetch_in_threads(cache, failing_fetch)
+  wait_for_waiters(cache, 3)
+  release.set()
+  for worker in workers:
+    worker.join(5)
+  assert all(isinstance(result, ConnectionError) for result in results)
+  assert not cache.in_flight and not cache.entries
+
+
+def test_search_product_is_answered_from_the_cache(gpa, portal):
+  first = gpa.search_product(product_id="BAA-7", output="json")
+  assert gpa.search_product(product_id="BAA-7", output="json") == first
+  assert portal.requests == 1
+  gpa.invalidate_response_cache("/api/genomes/search")
+  gpa.search_product(product_id="BAA-7", output="json")
+  assert portal.requests == 2
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+
+import pytest
+
+import genome_portal_api.genome_portal_api as module
+from synthetic import genome_id
+
+
+@pytest.fixture
+def sent(gpa, monkeypatch):
+  """(Range, If-Range, status) of every request for a signed URL"""
+  sent = []
+  request = gpa._signed_url_request
+
+  def spy(url, **kwargs):
+    resp = request(url, **kwargs)
+    headers = kwargs.get("headers") or {}
+    sent.append((headers.get("Range"), headers.get("If-Range"), resp.status_code))
+    return resp
+
+  monkeypatch.setattr(gpa, "_signed_url_request", spy)
+  return sent
+
+
+def signed_fasta(portal, number=0):
+  return portal.sign(portal.url, f"/files/{genome_id(number)}.fasta"), portal.fasta(number)
+
+
+def etag(body):
+  return '"%s"' % hashlib.md5(body).hexdigest()
+
+
+def test_a_fresh_download_is_verified_and_leaves_no_state(gpa, portal, sent, tmp_path):
+  url, body = signed_fasta(portal)
+  part_path = str(tmp_path / "genome.fasta.part")
+  assert gpa._resumable_download(url, part_path) == part_path
+  assert open(part_path, "rb").read() == body
+  assert not os.path.exists(part_path + ".json")
+  assert sent == [(None, None, 200)]
+
+
+def test_a_truncated_part_is_resumed(gpa, portal, sent, tmp_path):
+  url, body = signed_fasta(portal)
+  part_path = str(tmp_path / "genome.fasta.part")
+  with open(part_path, "wb") as f:
+    f.write(body[:1000])
+  gpa._write_part_state(part_path, {"size": len(body), "etag": etag(body), "last_modified": None, "md5": None})
+  assert gpa._resumable_download(url, part_path) == part_path
+  assert open(part_path, "rb").read() == body
+  assert sent == [("bytes=1000-", etag(body), 206)]
+
+
+def test_a_changed_object_restarts_from_zero(gpa, portal, sent, tmp_path):
+  url, body = signed_fasta(portal)
+  part_path = str(tmp_path / "genome.fasta.part")
+  with open(part_path, "wb") as f:
+    f.write(b"x" * 1000)
+  gpa._write_part_state(part_path, {"size": 5000, "etag": '"an older version"', "last_modified": None, "md5": None})
+  assert gpa._resumable_download(url, part_path) == part_path
+  assert open(part_path, "rb").read() == body
+  # If-Range does not match, so the server sends the whole new object
+  assert sent == [("bytes=1000-", '"an older version"', 200)]
+
+
+def test_a_part_longer_than_the_object_restarts_after_416(gpa, portal, sent, tmp_path):
+  url, body = signed_fasta(portal)
+  part_path = str(tmp_path / "genome.fasta.part")
+  with open(part_path, "wb") as f:
+    f.write(body + b"more")
+  gpa._write_part_state(part_path, {"size": None, "etag": etag(body), "last_modified": None, "md5": None})
+  assert gpa._resumable_download(url, part_path) == part_path
+  assert open(part_path, "rb").read() == body
+  assert sent == [(f"bytes={len(body) + 4}-", etag(body), 416), (None, None, 200)]
+
+
+def test_a_corrupt_body_is_downloaded_again(gpa, portal, sent, tmp_path):
+  url, body = signed_fasta(portal)
+  part_path = str(tmp_path / "genome.fasta.part")
+  portal.corrupt_files = 1
+  assert gpa._resumable_download(url, part_path) == part_path
+  assert open(part_path, "rb").read() == body
+  assert sent == [(None, None, 200), (None, None, 200)]
+
+
+def test_a_body_that_never_matches_its_md5_is_rejected(gpa, portal, sent, tmp_path):
+  url, _ = signed_fasta(portal)
+  part_path = str(tmp_path / "genome.fasta.part")
+  portal.corrupt_files = 2
+  with pytest.raises(IOError, match="failed its integrity check twice"):
+    gpa._resumable_download(url, part_path)
+  assert not os.path.exists(part_path)
+  assert not os.path.exists(part_path + ".json")
+
+
+def test_unreadable_state_counts_as_none(tmp_path):
+  part_path = str(tmp_path / "genome.fasta.part")
+  assert module._read_part_state(part_path) == {}
+  with open(part_path + ".json", "w") as f:
+    f.write("{not json")
+  assert module._read_part_state(part_path) == {}
+  module._write_part_state(part_path, {"size": 3})
+  assert json.load(open(part_path + ".json")) == {"size": 3}
+
+
+def test_expected_md5_ignores_etags():
+  md5 = "9e107d9d372bb6826bd81d3542a419d6"
+  assert module._expected_md5({"ETag": f'"{md5}"'}) is None
+  assert module._expected_md5({"Content-MD5": "nhB9nTcrtoJr2B01QqQZ1g=="}) == md5
+  assert module._expected_md5({"x-goog-hash": "crc32c=AAAAAA==, md5=nhB9nTcrtoJr2B01QqQZ1g=="}) == md5
@@ -0,0 +1,120 @@
+import time
+from email.utils import formatdate
+
+import pytest
+import requests
+
+import genome_portal_api.genome_portal_api as module
+
+URL = "https://genomes.atcc.org/api/genomes/0000000000000001"
+
+
+class Clock:
+  """Stands in for the time module: sleep() only moves monotonic() forward, and is recorded"""
+
+  def __init__(self):
+    self.now = 1000.0
+    self.sleeps = []
+
+  def monotonic(self):
+    return self.now
+
+  def sleep(self, seconds):
+    self.sleeps.append(seconds)
+    self.now += seconds
+
+  def __getattr__(self, name):
+    return getattr(time, name)
+
+
+class Session:
+  """Answers requests from a script of responses and exceptions"""
+
+  def __init__(self, script):
+    self.script = list(script)
+    self.calls = 0
+
+  def request(self, method, url, **kwargs):
+    self.calls += 1
+    outcome = self.script.pop(0) if len(self.script) > 1 else self.script[0]
+    if isinstance(outcome, Exception):
+      raise outcome
+    resp = requests.Response()
+    resp.status_code, headers = outcome if isinstance(outcome, tuple) else (outcome, {})
+    resp.headers.update(headers)
+    resp._content = b"{}"
+    resp.request = requests.Request(method, url).prepare()
+    return resp
+
+
+@pytest.fixture
+def clock(monkeypatch):
+  clock = Clock()
+  monkeypatch.setattr(module, "time", clock)
+  monkeypatch.setattr(module, "_rate_limiter", module._RateLimiter())
+  return clock
+
+
+def send(monkeypatch, script, rate_limited=True):
+  session = Session(script)
+  monkeypatch.setattr(module, "get_session", lambda: session)
+  return module._send("GET", URL, rate_limited), session
+
+
+def test_5xx_responses_are_retried_with_growing_backoff(clock, monkeypatch):
+  resp, session = send(monkeypatch, [503, 502, 500, 200])
+  assert (resp.status_code, session.calls) == (200, 4)
+  assert len(clock.sleeps) == 3
+  for attempt, delay in enumerate(clock.sleeps):
+    assert 0 <= delay <= module.transport_settings["backoff_factor"] * 2 ** attempt
+
+
+def test_backoff_never_exceeds_backoff_max(clock, monkeypatch):
+  monkeypatch.setitem(module.transport_settings, "backoff_factor", 100)
+  monkeypatch.setitem(module.transport_settings, "backoff_max", 3)
+  send(monkeypatch, [503, 503, 503, 200])
+  assert max(clock.sleeps) <= 3
+
+
+@pytest.mark.parametrize("as_date", [False, True])
+def test_retry_after_is_honoured(clock, monkeypatch, as_date):
+  retry_after = formatdate(time.time() + 30, usegmt=True) if as_date else "30"
+  resp, _ = send(monkeypatch, [(429, {"Retry-After": retry_after}), 200])
+  assert resp.status_code == 200
+  assert clock.sleeps[0] >= 28
+
+
+def test_429_slows_every_thread_down(clock, monkeypatch):
+  monkeypatch.setitem(module.transport_settings, "rate_limit", 8)
+  send(monkeypatch, [(429, {"Retry-After": "2"}), 200])
+  assert module._rate_limiter.rate == 4 + 8 / 20  # halved, then the success wins a twentieth back
+  assert module._rate_limiter.paused_until >= 1002
+  for _ in range(20):
+    module._rate_limiter.succeeded()
+  assert module._rate_limiter.rate == 8
+
+
+def test_rate_limit_spaces_requests_out(clock, monkeypatch):
+  monkeypatch.setitem(module.transport_settings, "rate_limit", 2)
+  monkeypatch.setitem(module.transport_settings, "rate_burst", 1)
+  for _ in range(3):
+    send(monkeypatch, [200])
+  assert clock.sleeps == [0.5, 0.5]
+
+
+def test_connection_errors_are_retried(clock, monkeypatch):
+  resp, session = send(monkeypatch, [requests.ConnectionError("reset"), requests.Timeout("slow"), 200])
+  assert (resp.status_code, session.calls, len(clock.sleeps)) == (200, 3, 2)
+
+
+def test_retries_give_up_after_max_retries(clock, monkeypatch):
+  monkeypatch.setitem(module.transport_settings, "max_retries", 2)
+  resp, session = send(monkeypatch, [503])
+  assert (resp.status_code, session.calls, len(clock.sleeps)) == (503, 3, 2)
+  with pytest.raises(requests.ConnectionError):
+    send(monkeypatch, [requests.ConnectionError("reset")])
+
+
+def test_client_errors_are_not_retried(clock, monkeypatch):
+  resp, session = send(monkeypatch, [404, 200])
+  assert (resp.status_code, session.calls, clock.sleeps) == (404, 1, [])
@@ -0,0 +1,15 @@
+def test_search_stops_after_a_short_first_page(gpa, portal):
+  assert len(gpa.search_text(text="BAA-", output="json")) == 120
+  assert portal.requests == 3
+  portal.requests = 0
+  assert len(gpa.search_text(text="BAA-3", output="json")) == 11  # BAA-3 and BAA-30 to BAA-39
+  assert portal.requests == 1
+
+
+def test_learned_page_size_is_dropped_for_another_portal(gpa, portal):
+  gpa.search_text(text="BAA-", output="json")
+  assert gpa._search_page_size == 50
+  gpa.configure_transport(base_url=portal.url + "/")
+  assert gpa._search_page_size == 50
+  gpa.configure_transport(base_url=portal.url.replace("127.0.0.1", "localhost"))
+  assert gpa._search_page_size is None
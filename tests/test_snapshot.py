@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from conftest import swap_catalog
+from synthetic import genome_id
+
+
+@pytest.fixture
+def statuses(gpa, monkeypatch):
+  """{page: status} of the catalog pages each refresh requests"""
+  seen = {}
+  fetch = gpa._fetch_snapshot_page
+
+  def spy(page, apikey, validators):
+    result = fetch(page, apikey, validators)
+    seen[page] = result[0]
+    return result
+
+  monkeypatch.setattr(gpa, "_fetch_snapshot_page", spy)
+  return seen
+
+
+def test_unchanged_pages_are_reused(gpa, portal, statuses):
+  first = gpa.refresh_metadata_snapshot()
+  assert len(first) == 120
+  assert statuses == {1: 200, 2: 200, 3: 200}
+  statuses.clear()
+  portal.requests = 0
+  assert gpa.refresh_metadata_snapshot() == first
+  assert statuses == {1: 304, 2: 304, 3: 304}
+  assert portal.requests == 3
+  assert gpa.load_metadata_snapshot() == first
+
+
+def test_a_grown_catalog_is_walked_past_the_known_pages(gpa, portal, statuses):
+  gpa.refresh_metadata_snapshot()
+  statuses.clear()
+  swap_catalog(portal, genomes=170)
+  genomes = gpa.refresh_metadata_snapshot()
+  assert [genome["id"] for genome in genomes] == [genome_id(number) for number in range(170)]
+  assert statuses == {1: 304, 2: 304, 3: 200, 4: 200}
+
+
+def test_removed_genomes_are_dropped(gpa, portal, statuses, caplog):
+  gpa.refresh_metadata_snapshot()
+  statuses.clear()
+  catalog = swap_catalog(portal)
+  catalog.pages[1] = json.dumps([genome for genome in json.loads(catalog.pages[1]) if genome["id"] != genome_id(60)]).encode()
+  genomes = gpa.refresh_metadata_snapshot()
+  assert len(genomes) == 119
+  assert genome_id(60) not in {genome["id"] for genome in genomes}
+  assert statuses == {1: 304, 2: 200, 3: 304}
+  assert "0 new, 0 updated and 1 removed genomes" in caplog.text
+  assert gpa.load_metadata_snapshot() == genomes
+
+
+def test_a_snapshot_of_another_portal_is_not_revalidated(gpa, portal, statuses):
+  gpa.refresh_metadata_snapshot()
+  statuses.clear()
+  gpa.configure_transport(base_url=portal.url.replace("127.0.0.1", "localhost"))
+  assert gpa.load_metadata_snapshot() is None
+  assert len(gpa.refresh_metadata_snapshot()) == 120
+  assert statuses == {1: 200, 2: 200, 3: 200}